@@ -0,0 +1,99 @@
+"""
+DestriChiffrage - Stockage des PDF par contenu
+==============================================
+Chaque fichier est stocke une seule fois sous data/Stockage_PDF, nomme par
+l'empreinte SHA-256 de son contenu. Les dossiers de categories
+(Fiches_techniques/..., Devis_fournisseur/...) ne contiennent que des vues :
+liens physiques vers le fichier stocke (copie si le volume ne les supporte pas).
+
+Le suivi des references (table pdf_blobs) et le ramasse-miettes sont geres
+par Database.
+"""
+
+import hashlib
+import os
+import shutil
+import tempfile
+from typing import Tuple
+
+
+STORE_DIR = 'Stockage_PDF'
+HASH_BUFFER = 1024 * 1024  # Lecture par blocs de 1 Mo
+
+
+def hash_file(path: str) -> str:
+    """Empreinte SHA-256 d'un fichier, calculee par blocs"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(HASH_BUFFER), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class BlobStore:
+    """Fichiers adresses par contenu sous data_dir/Stockage_PDF"""
+
+    def __init__(self, data_dir: str):
+        """
+        Initialise le stockage
+
+        Args:
+            data_dir: Dossier data de l'application
+        """
+        self.data_dir = data_dir
+        self.root = os.path.join(data_dir, STORE_DIR)
+
+    def blob_path(self, digest: str, ext: str = '') -> str:
+        """Chemin absolu du fichier stocke (sous-dossier = 2 premiers caracteres)"""
+        return os.path.join(self.root, digest[:2], digest + ext.lower())
+
+    def put(self, source_path: str) -> Tuple[str, str, int]:
+        """
+        Ajoute un fichier au stockage (une seule lecture : copie et empreinte ensemble)
+
+        Args:
+            source_path: Fichier a stocker
+
+        Returns:
+            (empreinte SHA-256, chemin absolu du fichier stocke, taille)
+        """
+        os.makedirs(self.root, exist_ok=True)
+        digest = hashlib.sha256()
+        size = 0
+        fd, tmp_path = tempfile.mkstemp(dir=self.root, suffix='.tmp')
+        try:
+            with open(source_path, 'rb') as fsrc, os.fdopen(fd, 'wb') as fdst:
+                for block in iter(lambda: fsrc.read(HASH_BUFFER), b''):
+                    digest.update(block)
+                    fdst.write(block)
+                    size += len(block)
+
+            blob = self.blob_path(digest.hexdigest(), os.path.splitext(source_path)[1])
+            if os.path.exists(blob):
+                os.remove(tmp_path)  # Contenu deja stocke
+            else:
+                os.makedirs(os.path.dirname(blob), exist_ok=True)
+                shutil.copystat(source_path, tmp_path)
+                os.replace(tmp_path, blob)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        return digest.hexdigest(), blob, size
+
+    @staticmethod
+    def link(blob: str, view_path: str):
+        """Cree une vue (lien physique, copie en repli) du fichier stocke"""
+        os.makedirs(os.path.dirname(view_path), exist_ok=True)
+        try:
+            os.link(blob, view_path)
+        except OSError:
+            shutil.copy2(blob, view_path)
+
+    @staticmethod
+    def is_same_file(path_a: str, path_b: str) -> bool:
+        """Indique si deux chemins designent le meme fichier (lien physique)"""
+        try:
+            return os.path.samefile(path_a, path_b)
+        except OSError:
+            return False
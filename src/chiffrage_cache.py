@@ -0,0 +1,159 @@
+"""
+DestriChiffrage - Cache de chiffrage DPGF
+=========================================
+Couts des articles d'un chantier conserves en memoire pour la vue de chiffrage :
+- chargement du chantier entier en deux requetes (articles, produits lies)
+- un article modifie est marque "a relire" (mark_dirty) et seul lui est relu
+- les modifications faites ailleurs sur la meme connexion (autre fenetre,
+  actualisation des prix) sont relevees par Database.dpgf_changes : articles
+  concernes relus, ou tout le chantier
+- tout est relu si les taux/marges changent ou si un autre poste a ecrit
+  (nouvel instantane des parametres, voir Database.parametres)
+
+Le detail d'un article et le recapitulatif du projet sont ensuite servis
+sans requete.
+"""
+
+from typing import Dict, List, Optional, Set, TYPE_CHECKING
+
+from simulation import SimulationChantier
+
+if TYPE_CHECKING:
+    from database import Database
+
+
+class ChiffrageCache:
+    """Articles, produits lies et couts d'un chantier, avec suivi des modifications"""
+
+    def __init__(self, db: 'Database', chantier_id: int):
+        """
+        Initialise le cache (charge a la premiere lecture)
+
+        Args:
+            db: Base de donnees
+            chantier_id: ID du chantier chiffre
+        """
+        self.db = db
+        self.chantier_id = chantier_id
+
+        self._articles: Dict[int, Dict] = {}
+        self._produits: Dict[int, List[Dict]] = {}
+        self._dirty: Set[int] = set()
+        self._marge_projet = None
+        self._loaded = False
+        self._parametres = None
+        self._version = 0  # Derniere version de Database.dpgf_changes relevee
+
+    # ==================== INVALIDATION ====================
+
+    def mark_dirty(self, article_id: int):
+        """Marque un article a relire (article, produits lies ou couts modifies)"""
+        self._dirty.add(article_id)
+
+    def invalidate(self):
+        """Relit tout le chantier a la prochaine lecture (marge projet, import, suppression...)"""
+        self._loaded = False
+
+    def _ensure_loaded(self):
+        """Charge le chantier si necessaire, puis relit les articles marques"""
+        # Nouvel instantane = taux modifies ou ecriture d'une autre connexion
+        parametres = self.db.parametres()
+        if parametres is not self._parametres:
+            self._parametres = parametres
+            self._loaded = False
+
+        # Articles modifies par cette connexion depuis la derniere lecture
+        self._version, changed = self.db.dpgf_changes(self.chantier_id, self._version)
+        if changed is None:
+            self._loaded = False
+        else:
+            self._dirty.update(changed)
+
+        if not self._loaded:
+            self._articles = {a['id']: a for a in self.db.get_articles_dpgf(self.chantier_id)}
+            self._produits = self.db.get_produits_lies_chantier(self.chantier_id)
+            chantier = self.db.get_chantier(self.chantier_id)
+            self._marge_projet = chantier.get('marge_projet') if chantier else None
+            self._dirty.clear()
+            self._loaded = True
+            return
+
+        for article_id in self._dirty:
+            article = self.db.get_article_dpgf(article_id)
+            if article is None or article['chantier_id'] != self.chantier_id:
+                self._articles.pop(article_id, None)
+                self._produits.pop(article_id, None)
+            else:
+                self._articles[article_id] = article
+                self._produits[article_id] = self.db.get_produits_article(article_id)
+        self._dirty.clear()
+
+    # ==================== LECTURES ====================
+
+    def article(self, article_id: int) -> Optional[Dict]:
+        """Article DPGF (copie), None s'il n'existe plus"""
+        self._ensure_loaded()
+        article = self._articles.get(article_id)
+        return dict(article) if article is not None else None
+
+    def produits(self, article_id: int) -> List[Dict]:
+        """Produits lies a un article (copies, memes champs que get_produits_article)"""
+        self._ensure_loaded()
+        return [dict(p) for p in self._produits.get(article_id, [])]
+
+    def couts(self, article_id: int) -> Optional[Dict]:
+        """
+        Decomposition des couts d'un article
+
+        Returns:
+            Dict avec: cout_produits, fournitures, cout_materiaux, cout_mo (cout entreprise),
+            vente_mo, cout_revient, prix_manuel, prix_unitaire_ht, prix_total_ht
+        """
+        self._ensure_loaded()
+        article = self._articles.get(article_id)
+        if article is None:
+            return None
+
+        cout_materiaux = article['cout_materiaux'] or 0
+        cout_revient = article['cout_revient'] or 0
+        return {
+            'cout_produits': sum(p['quantite'] * p['prix_unitaire'] for p in self._produits.get(article_id, [])),
+            'fournitures': article.get('fournitures_additionnelles') or 0,
+            'cout_materiaux': cout_materiaux,
+            'cout_mo': cout_revient - cout_materiaux,
+            'vente_mo': article['cout_mo_total'] or 0,
+            'cout_revient': cout_revient,
+            'prix_manuel': article.get('prix_manuel'),
+            'prix_unitaire_ht': article['prix_unitaire_ht'] or 0,
+            'prix_total_ht': article['prix_total_ht'] or 0,
+        }
+
+    def recap(self) -> Dict:
+        """Recapitulatif du chantier (memes cles que Database.get_chantier_recap)"""
+        self._ensure_loaded()
+        articles = self._articles.values()
+
+        h_conception = sum(a['temps_conception'] or 0 for a in articles)
+        h_fabrication = sum(a['temps_fabrication'] or 0 for a in articles)
+        h_pose = sum(a['temps_pose'] or 0 for a in articles)
+        cout_revient = sum(a['cout_revient'] or 0 for a in articles)
+        prix_total = sum(a['prix_total_ht'] or 0 for a in articles)
+
+        return {
+            'nb_articles': len(self._articles),
+            'h_conception': h_conception,
+            'h_fabrication': h_fabrication,
+            'h_pose': h_pose,
+            'h_total': h_conception + h_fabrication + h_pose,
+            'cout_materiaux': sum(a['cout_materiaux'] or 0 for a in articles),
+            'cout_mo': sum(a['cout_mo_total'] or 0 for a in articles),
+            'cout_revient': cout_revient,
+            'prix_total': prix_total,
+            'marge_globale': ((prix_total - cout_revient) / cout_revient * 100) if cout_revient > 0 else 0,
+            'marge_projet': self._marge_projet,
+        }
+
+    def simulation(self) -> SimulationChantier:
+        """Simulation de marge et de taux sur les articles en cache (sans requete)"""
+        self._ensure_loaded()
+        return SimulationChantier(self._articles.values(), self._parametres)
@@ -0,0 +1,176 @@
+"""
+DestriChiffrage - Connexions SQLite
+===================================
+Reglages des connexions et pool de lecteurs :
+- base locale : journal WAL, synchronous=NORMAL, mmap et cache dimensionne ;
+  les lectures ne sont jamais bloquees par une ecriture en cours
+- base sur un lecteur reseau : le WAL n'y est pas fiable (memoire partagee
+  entre postes impossible), on reste en journal DELETE avec un busy_timeout
+- un lecteur en lecture seule par thread, un seul ecrivain serialise
+"""
+
+import functools
+import os
+import sqlite3
+import sys
+import threading
+from contextlib import contextmanager
+from typing import TYPE_CHECKING, Callable, Dict
+
+if TYPE_CHECKING:
+    from database import Database
+
+
+BUSY_TIMEOUT_MS = 10000  # Attente maximale d'un verrou (autres postes, import en cours)
+CACHE_SIZE_KB = 32768  # Cache de pages par connexion (32 Mo)
+MMAP_SIZE = 256 * 1024 * 1024  # Lecture par mmap (base locale uniquement)
+
+_NETWORK_FS = ('nfs', 'nfs4', 'cifs', 'smbfs', 'smb3', 'fuse.sshfs', 'afs', '9p')
+
+
+def is_network_path(path: str) -> bool:
+    """
+    Indique si le fichier est sur un partage reseau
+
+    Windows : chemin UNC (\\\\serveur\\partage) ou lecteur reseau mappe (Y:).
+    Linux / macOS : systeme de fichiers reseau dans /proc/mounts.
+    """
+    path = os.path.abspath(path)
+    if path.startswith('\\\\') or path.startswith('//'):
+        return True
+
+    if sys.platform == 'win32':
+        try:
+            import ctypes
+            drive = os.path.splitdrive(path)[0]
+            if drive:
+                DRIVE_REMOTE = 4
+                return ctypes.windll.kernel32.GetDriveTypeW(drive + '\\') == DRIVE_REMOTE
+        except Exception:
+            pass
+        return False
+
+    try:
+        best, fs_type = '', ''
+        with open('/proc/mounts', 'r') as f:
+            for line in f:
+                parts = line.split()
+                if len(parts) >= 3 and path.startswith(parts[1]) and len(parts[1]) > len(best):
+                    best, fs_type = parts[1], parts[2]
+        return fs_type in _NETWORK_FS
+    except OSError:
+        return False
+
+
+def configure_connection(conn: sqlite3.Connection, network: bool, read_only: bool = False):
+    """
+    Applique les reglages de performance a une connexion
+
+    Args:
+        conn: Connexion SQLite
+        network: Base sur un partage reseau (pas de WAL ni de mmap)
+        read_only: Connexion en lecture seule (le mode journal n'est pas modifie)
+    """
+    conn.execute(f"PRAGMA busy_timeout = {BUSY_TIMEOUT_MS}")
+    conn.execute(f"PRAGMA cache_size = -{CACHE_SIZE_KB}")
+    conn.execute("PRAGMA temp_store = MEMORY")
+    if network:
+        return
+    conn.execute(f"PRAGMA mmap_size = {MMAP_SIZE}")
+    if not read_only:
+        # Le mode WAL est persistant dans le fichier : les lecteurs en heritent
+        conn.execute("PRAGMA journal_mode = WAL")
+        conn.execute("PRAGMA synchronous = NORMAL")
+
+
+class ConnectionPool:
+    """Distribue une connexion en lecture seule par thread et serialise l'ecrivain"""
+
+    def __init__(self, db: 'Database'):
+        """
+        Initialise le pool
+
+        Args:
+            db: Base principale (sa connexion est l'unique ecrivain)
+        """
+        self.db = db
+        self.write_lock = threading.RLock()
+        self._local = threading.local()
+        self._readers: Dict[int, 'Database'] = {}
+        self._lock = threading.Lock()
+        self._closed = False
+
+    def get_reader(self) -> 'Database':
+        """Retourne le lecteur du thread courant (cree a la premiere demande)"""
+        reader = getattr(self._local, 'reader', None)
+        if reader is None:
+            if self._closed:
+                raise sqlite3.ProgrammingError("Pool de connexions ferme")
+            reader = self.db.open_reader()
+            self._local.reader = reader
+            with self._lock:
+                self._readers[threading.get_ident()] = reader
+        return reader
+
+    @contextmanager
+    def reader(self):
+        """
+        Lecteur du thread courant
+
+        Exemple:
+            with db.pool.reader() as reader:
+                produits = reader.search_produits(terme='EI30')
+        """
+        yield self.get_reader()
+
+    @contextmanager
+    def writer(self):
+        """Acces exclusif a l'ecrivain (connexion principale)"""
+        with self.write_lock:
+            yield self.db
+
+    def release_reader(self):
+        """Ferme le lecteur du thread courant (fin d'un thread de travail)"""
+        reader = getattr(self._local, 'reader', None)
+        if reader is not None:
+            self._local.reader = None
+            with self._lock:
+                self._readers.pop(threading.get_ident(), None)
+            reader.close()
+
+    def close(self):
+        """Ferme tous les lecteurs (a la fermeture de la base)"""
+        self._closed = True
+        with self._lock:
+            readers, self._readers = list(self._readers.values()), {}
+        for reader in readers:
+            try:
+                reader.close()
+            except sqlite3.ProgrammingError:
+                pass  # Connexion d'un autre thread deja terminee
+
+
+def serialized_write(method: Callable) -> Callable:
+    """
+    Decorateur des methodes d'ecriture de Database
+
+    La methode s'execute entierement sous le verrou de l'ecrivain unique, du
+    premier ordre SQL jusqu'au commit : l'ecriture d'un autre thread attend la
+    fin du bloc batch() en cours au lieu de s'y joindre. Hors batch(), une
+    exception annule l'ecriture commencee (aucune transaction laissee ouverte).
+    """
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        pool: 'ConnectionPool' = self.pool
+        if pool is None:
+            return method(self, *args, **kwargs)
+        with pool.write_lock:
+            try:
+                return method(self, *args, **kwargs)
+            except BaseException:
+                if not self.in_batch and self.conn.in_transaction:
+                    self.conn.rollback()
+                    self._cache_epoch += 1
+                raise
+
+    return wrapper
@@ -0,0 +1,357 @@
+"""
+DestriChiffrage - Import CSV en flux
+====================================
+Pipeline d'import des catalogues volumineux :
+- lecture en une seule passe, progression estimee sur la position dans le fichier
+- conversion des lignes par paquets (pool de processus pour les gros fichiers)
+- ecriture par un seul consommateur (executemany dans une transaction)
+
+Les fonctions de conversion sont au niveau module pour pouvoir etre
+executees dans les processus du pool.
+"""
+
+import csv
+import io
+import os
+import queue
+import re
+import threading
+from concurrent.futures import Future, ProcessPoolExecutor
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+
+# Mapping par defaut colonnes CSV -> colonnes produits
+DEFAULT_MAPPING = {
+    'CATEGORIE': 'categorie',
+    'SOUS-CATEGORIE': 'sous_categorie',
+    'SOUS-CATEGORIE 2': 'sous_categorie_2',
+    'SOUS-CATEGORIE 3': 'sous_categorie_3',
+    'DESIGNATION': 'designation',
+    'DESCRIPTION': 'description',
+    'DIMENSIONS': 'dimensions',
+    'HAUTEUR': 'hauteur',
+    'LARGEUR': 'largeur',
+    'PRIX_UNITAIRE_HT': 'prix_achat',
+    'ARTICLE': 'reference',
+    'FOURNISSEUR': 'fournisseur',
+    'MARQUE': 'marque',
+    'CHANTIER': 'chantier',
+    'FICHE_TECHNIQUE': 'fiche_technique',
+    'FICHIER_PDF': 'devis_fournisseur'
+}
+
+# Ordre des valeurs produites pour l'INSERT dans produits
+PRODUIT_COLUMNS = ('categorie', 'sous_categorie', 'sous_categorie_2', 'sous_categorie_3',
+                   'designation', 'description', 'dimensions', 'hauteur', 'largeur', 'prix_achat',
+                   'reference', 'fournisseur', 'marque', 'chantier', 'notes',
+                   'fiche_technique', 'devis_fournisseur')
+
+# Patterns courants: "2040x830", "2040 x 830", "H2040 L830", etc.
+_DIMENSION_PATTERNS = [
+    re.compile(r'(\d+)\s*[xX×]\s*(\d+)'),  # 2040x830, 2040 x 830
+    re.compile(r'[hH][\s:]*(\d+).*[lL][\s:]*(\d+)'),  # H2040 L830, H:2040 L:830
+    re.compile(r'(\d{3,4})\D+(\d{2,4})'),  # 2040/830, 2040-830
+]
+
+CHUNK_SIZE = 5000  # Lignes par paquet
+POOL_MIN_SIZE = 8 * 1024 * 1024  # Taille de fichier a partir de laquelle le pool est utilise
+
+
+# ==================== CONVERSION ====================
+
+def parse_dimensions(dim_str: str) -> tuple:
+    """Parse une chaine de dimensions pour extraire hauteur et largeur"""
+    if not dim_str:
+        return None, None
+
+    for pattern in _DIMENSION_PATTERNS:
+        match = pattern.search(dim_str)
+        if match:
+            try:
+                h = int(match.group(1))
+                l = int(match.group(2))
+                # Verifier que les valeurs sont coherentes (hauteur > largeur generalement)
+                if h > 0 and l > 0:
+                    return (h, l) if h > l else (l, h)
+            except ValueError:
+                pass
+
+    return None, None
+
+
+def make_path_relative(path: str, data_dir: str) -> str:
+    """Convertit un chemin absolu en chemin relatif au dossier data"""
+    if not path:
+        return ''
+    # Normaliser les chemins pour comparaison
+    abs_data_dir = os.path.normpath(os.path.abspath(data_dir))
+    abs_path = os.path.normpath(os.path.abspath(path))
+    # Si le chemin est dans le dossier data, le rendre relatif
+    if abs_path.startswith(abs_data_dir):
+        return os.path.relpath(abs_path, abs_data_dir)
+    # Sinon garder le chemin tel quel
+    return path
+
+
+def parse_prix(value) -> float:
+    """Convertit un prix CSV ('12,50', 'divers', '-', vide) en float"""
+    try:
+        return float(value.replace(',', '.')) if value and value not in ['divers', '-', ''] else 0
+    except (AttributeError, ValueError):
+        return 0
+
+
+def parse_entier(value) -> Optional[int]:
+    """Convertit une dimension CSV en entier (None si vide ou non numerique)"""
+    try:
+        return int(value) if value and value.strip().isdigit() else None
+    except ValueError:
+        return None
+
+
+def convert_chunk(rows: List[List[str]], columns: Sequence[Tuple[int, str]],
+                  data_dir: str) -> Tuple[List[tuple], set]:
+    """
+    Convertit un paquet de lignes CSV en tuples prets pour l'INSERT
+
+    Args:
+        rows: Lignes CSV brutes (listes de champs)
+        columns: Couples (index du champ, colonne produits)
+        data_dir: Dossier data (chemins des fiches rendus relatifs)
+
+    Returns:
+        (liste de tuples dans l'ordre PRODUIT_COLUMNS, categories rencontrees)
+    """
+    records = []
+    categories = set()
+
+    for row in rows:
+        size = len(row)
+        data = {}
+        for index, db_col in columns:
+            # Champ absent (ligne courte) : None comme csv.DictReader
+            value = row[index] if index < size else None
+            if db_col == 'prix_achat':
+                value = parse_prix(value)
+            elif db_col in ('hauteur', 'largeur'):
+                value = parse_entier(value)
+            data[db_col] = value
+
+        if not data.get('designation'):
+            continue
+
+        # Parser dimensions si hauteur/largeur non definis
+        if not data.get('hauteur') and not data.get('largeur') and data.get('dimensions'):
+            h, l = parse_dimensions(data['dimensions'])
+            if h:
+                data['hauteur'] = h
+            if l:
+                data['largeur'] = l
+
+        records.append((
+            data.get('categorie', ''),
+            data.get('sous_categorie', ''),
+            data.get('sous_categorie_2', ''),
+            data.get('sous_categorie_3', ''),
+            data['designation'],
+            data.get('description', ''),
+            data.get('dimensions', ''),
+            data.get('hauteur'),
+            data.get('largeur'),
+            data.get('prix_achat', 0),
+            data.get('reference', ''),
+            data.get('fournisseur', ''),
+            data.get('marque', ''),
+            data.get('chantier', ''),
+            data.get('notes', ''),
+            make_path_relative(data.get('fiche_technique', ''), data_dir),
+            make_path_relative(data.get('devis_fournisseur', ''), data_dir),
+        ))
+
+        # Collecter la categorie
+        if data.get('categorie'):
+            categories.add(data['categorie'])
+
+    return records, categories
+
+
+# ==================== LECTURE ====================
+
+def detect_format(filepath: str) -> Tuple[str, str]:
+    """
+    Detecte l'encodage et le delimiteur d'un fichier CSV
+
+    Returns:
+        (encodage, delimiteur) : utf-8-sig (avec ou sans BOM) ou cp1252, ';' ou ','
+    """
+    encoding = 'utf-8-sig'
+    try:
+        with open(filepath, 'r', encoding='utf-8-sig') as test_f:
+            test_f.read(2048)
+    except UnicodeDecodeError:
+        encoding = 'cp1252'
+
+    with open(filepath, 'r', encoding=encoding, errors='replace') as f:
+        sample = f.read(1024)
+    delimiter = ';' if ';' in sample else ','
+    return encoding, delimiter
+
+
+def mapped_columns(filepath: str, mapping: Dict = None) -> set:
+    """
+    Retourne les colonnes produits presentes dans l'en-tete du fichier CSV
+
+    Args:
+        filepath: Chemin du fichier CSV
+        mapping: Mapping des colonnes (DEFAULT_MAPPING si None)
+    """
+    if mapping is None:
+        mapping = DEFAULT_MAPPING
+    encoding, delimiter = detect_format(filepath)
+    with open(filepath, 'r', encoding=encoding, newline='') as f:
+        header = next(csv.reader(f, delimiter=delimiter), None) or []
+    return {db_col for csv_col, db_col in mapping.items() if csv_col in header}
+
+
+class _Done:
+    """Marqueur de fin du flux de paquets"""
+
+
+def _read_chunks(filepath: str, mapping: Dict, data_dir: str, out: queue.Queue,
+                 stop: threading.Event, pool: Optional[ProcessPoolExecutor], chunk_size: int):
+    """
+    Etage de lecture : une seule passe sur le fichier
+
+    Chaque element place dans la file est (Future de conversion, lignes lues,
+    octets lus) ; la conversion est soumise au pool ou faite sur place.
+    """
+    def put(item):
+        while not stop.is_set():
+            try:
+                out.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    try:
+        encoding, delimiter = detect_format(filepath)
+        with open(filepath, 'rb') as raw:
+            text = io.TextIOWrapper(raw, encoding=encoding, newline='')
+            reader = csv.reader(text, delimiter=delimiter)
+            header = next(reader, None) or []
+
+            # Index des colonnes connues (la derniere occurrence l'emporte, comme DictReader)
+            positions = {name: index for index, name in enumerate(header)}
+            columns = [(positions[csv_col], db_col) for csv_col, db_col in mapping.items()
+                       if csv_col in positions]
+
+            lines = 0
+            chunk = []
+            for row in reader:
+                chunk.append(row)
+                if len(chunk) >= chunk_size:
+                    lines += len(chunk)
+                    if not put((_convert(pool, chunk, columns, data_dir), lines, raw.tell())):
+                        return
+                    chunk = []
+            if chunk:
+                lines += len(chunk)
+                put((_convert(pool, chunk, columns, data_dir), lines, raw.tell()))
+    except BaseException as e:
+        failed = Future()
+        failed.set_exception(e)
+        put((failed, 0, 0))
+    finally:
+        put(_Done)
+
+
+def _convert(pool: Optional[ProcessPoolExecutor], chunk, columns, data_dir) -> Future:
+    """Soumet la conversion d'un paquet au pool (ou la fait dans le thread courant)"""
+    if pool is not None:
+        return pool.submit(convert_chunk, chunk, columns, data_dir)
+    future = Future()
+    try:
+        future.set_result(convert_chunk(chunk, columns, data_dir))
+    except Exception as e:
+        future.set_exception(e)
+    return future
+
+
+def default_workers(filepath: str) -> int:
+    """Nombre de processus de conversion (0 = conversion dans le thread de lecture)"""
+    cpus = os.cpu_count() or 1
+    if cpus < 2 or os.path.getsize(filepath) < POOL_MIN_SIZE:
+        return 0
+    return min(4, cpus - 1)
+
+
+# ==================== PIPELINE ====================
+
+def run_import(filepath: str, write_chunk: Callable, mapping: Dict = None, data_dir: str = '',
+               progress_callback: Callable = None, workers: int = None,
+               chunk_size: int = CHUNK_SIZE) -> Tuple[int, set]:
+    """
+    Execute le pipeline lecture -> conversion -> ecriture
+
+    L'ecriture (write_chunk) est appelee dans le thread appelant, dans l'ordre
+    du fichier : la connexion SQLite reste utilisee par un seul thread.
+
+    Args:
+        filepath: Chemin du fichier CSV
+        write_chunk: write_chunk(records) ecrit un paquet de tuples (ordre PRODUIT_COLUMNS)
+        mapping: Mapping des colonnes (DEFAULT_MAPPING si None)
+        data_dir: Dossier data pour les chemins relatifs
+        progress_callback: Fonction callback(current, total) ; total est estime
+                           a partir de la position dans le fichier
+        workers: Processus de conversion (None = automatique, 0 = sans pool)
+        chunk_size: Lignes par paquet
+
+    Returns:
+        (nombre de produits convertis, categories rencontrees)
+    """
+    if mapping is None:
+        mapping = DEFAULT_MAPPING
+    if workers is None:
+        workers = default_workers(filepath)
+
+    file_size = os.path.getsize(filepath)
+    count = 0
+    categories = set()
+    lines = 0
+
+    pool = ProcessPoolExecutor(max_workers=workers) if workers > 0 else None
+    # File bornee : limite la memoire et le nombre de paquets en cours de conversion
+    chunks = queue.Queue(maxsize=max(2, workers * 2))
+    stop = threading.Event()
+    reader = threading.Thread(target=_read_chunks, name="csv-import-reader",
+                              args=(filepath, mapping, data_dir, chunks, stop, pool, chunk_size))
+    reader.daemon = True
+    reader.start()
+
+    try:
+        while True:
+            item = chunks.get()
+            if item is _Done:
+                break
+            future, lines, position = item
+            records, chunk_categories = future.result()
+
+            write_chunk(records)
+            count += len(records)
+            categories |= chunk_categories
+
+            if progress_callback:
+                # Estimation du total a partir des octets deja lus
+                total = int(lines * file_size / position) if position else lines
+                progress_callback(lines, max(total, lines))
+
+        if progress_callback:
+            progress_callback(lines, lines)
+    finally:
+        stop.set()
+        reader.join()
+        if pool is not None:
+            pool.shutdown(wait=True, cancel_futures=True)
+
+    return count, categories
@@ -7,21 +7,40 @@ Gestion de la base de donnees SQLite pour le chiffrage et approvisionnement
 import sqlite3
 import csv
 import os
+import re
 import shutil
+import socket
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
 from datetime import datetime
+from pathlib import Path
 from typing import List, Dict, Optional, Any
 from config import get_config
+from connection_pool import ConnectionPool, configure_connection, is_network_path, serialized_write
+from pdf_bundle import copy_bundle
+from blob_store import BlobStore, hash_file
+from query_cache import QueryCache, cached_query
+from parametres import ParametresSnapshot
+from simulation import SimulationChantier, lot_article
+from csv_import import (DEFAULT_MAPPING, PRODUIT_COLUMNS, make_path_relative, mapped_columns,
+                        parse_dimensions, run_import)
 
 class Database:
     """Classe de gestion de la base de donnees SQLite"""
 
-    def __init__(self, db_path: str = None, data_dir: str = None):
+    def __init__(self, db_path: str = None, data_dir: str = None, read_only: bool = False,
+                 worker: bool = False):
         """
         Initialise la connexion a la base de donnees
 
         Args:
             db_path: Chemin vers le fichier de base de donnees (optionnel)
             data_dir: Dossier data à utiliser (optionnel, sinon lit la config)
+            read_only: Ouvre une connexion en lecture seule, sans migration
+                       (utilise par les threads de recherche en arriere-plan)
+            worker: Connexion d'ecriture d'un thread de travail, sans migration
+                    ni reprise des renommages (voir open_writer)
         """
         # Charger la configuration globale
         config = get_config()
@@ -44,12 +63,224 @@ class Database:
         os.makedirs(os.path.dirname(db_path), exist_ok=True)
 
         self.db_path = db_path
-        self.conn = sqlite3.connect(db_path)
+        self.read_only = read_only
+        # Base sur un partage reseau : pas de WAL (voir connection_pool)
+        self.network = is_network_path(db_path)
+        # check_same_thread=False : les ecritures d'autres threads passent par le
+        # verrou d'ecriture (batch(), serialized_write), chaque lecteur reste propre
+        # a son thread
+        if read_only:
+            # Connexion URI mode=ro : aucune ecriture possible, pas de migration
+            self.conn = sqlite3.connect(Path(os.path.abspath(db_path)).as_uri() + "?mode=ro", uri=True,
+                                        check_same_thread=False)
+        else:
+            self.conn = sqlite3.connect(db_path, check_same_thread=False)
+        try:
+            configure_connection(self.conn, self.network, read_only=read_only)
+        except sqlite3.OperationalError:
+            pass  # Base verrouillee par un autre poste : reglages par defaut
         self.conn.row_factory = sqlite3.Row
-        # Assurer l'encodage UTF-8
-        self.conn.execute("PRAGMA encoding = 'UTF-8'")
         self.conn.text_factory = str  # Forcer les textes en str (unicode en Python 3)
-        self._create_tables()
+        self.has_fts = False  # Mis a jour par _create_tables si FTS5 est disponible
+
+        # Lecteurs par thread et verrou de l'ecrivain unique (connexion principale)
+        self.pool = None if read_only else ConnectionPool(self)
+
+        # Unite de travail (voir batch()) : profondeur et recalculs differes,
+        # propres au thread qui tient le verrou d'ecriture
+        self._batch_state = threading.local()
+
+        # Cache des lectures (voir query_cache) : invalide par toute ecriture
+        self.query_cache = QueryCache()
+        self._cache_epoch = 0  # Incremente a chaque annulation de transaction
+        # Instantane des parametres (voir parametres()) et sa generation
+        self._parametres = None
+        self._parametres_generation = None
+        # Articles DPGF modifies par cette connexion (voir dpgf_changes)
+        self._dpgf_version = 0
+        self._dpgf_changes: Dict[int, list] = {}
+
+        if read_only or worker:
+            cursor = self.conn.cursor()
+            cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='produits_fts'")
+            self.has_fts = cursor.fetchone() is not None
+        else:
+            # Assurer l'encodage UTF-8
+            self.conn.execute("PRAGMA encoding = 'UTF-8'")
+            self._create_tables()
+            # Renommage de categorie interrompu (arret brutal) : reprise
+            self.recover_category_renames()
+
+    def open_reader(self) -> 'Database':
+        """
+        Ouvre une nouvelle instance en lecture seule sur la meme base
+
+        La connexion SQLite appartient au thread qui l'utilise : a appeler depuis
+        le thread de travail (recherche en arriere-plan, analyse, ...).
+
+        Returns:
+            Instance Database en lecture seule
+        """
+        return Database(self.db_path, data_dir=self.data_dir, read_only=True)
+
+    def open_writer(self) -> 'Database':
+        """
+        Ouvre une connexion d'ecriture dediee a un thread de travail
+
+        Les ecritures longues (actualisation des prix, ...) se font dans leur
+        propre transaction, sans bloquer ni melanger celles du thread Tk ; la
+        connexion principale voit le resultat apres validation (data_version).
+        Le schema est deja a jour : ni migration ni reprise des renommages.
+
+        Returns:
+            Instance Database en ecriture, a fermer par le thread de travail
+        """
+        return Database(self.db_path, data_dir=self.data_dir, worker=True)
+
+    # ==================== TRANSACTIONS ====================
+
+    @contextmanager
+    def batch(self):
+        """
+        Unite de travail : regroupe plusieurs ecritures dans une seule transaction
+
+        Dans le bloc, les commits sont differes et les recalculs derives (couts des
+        articles DPGF, montant des chantiers, ajout de categories) sont regroupes :
+        chaque article ou chantier n'est recalcule qu'une fois, a la sortie du bloc
+        le plus externe. Les blocs imbriques sont des SAVEPOINT : une exception
+        n'annule que le bloc concerne, y compris les recalculs qu'il avait differes.
+
+        Le bloc le plus externe refuse de demarrer si une transaction est deja
+        ouverte sur la connexion (ecriture non validee hors batch()) : elle serait
+        sinon validee ou annulee avec le bloc, a l'insu de son auteur.
+
+        Exemple:
+            with db.batch():
+                for data in lignes:
+                    db.add_article_dpgf(chantier_id, data)
+        """
+        # Un seul ecrivain a la fois (reentrant pour les blocs imbriques)
+        if self.pool is not None:
+            self.pool.write_lock.acquire()
+        cursor = self.conn.cursor()
+        depth = self._batch_depth + 1
+        savepoint = f"batch_{depth}"
+        try:
+            if depth == 1:
+                if self.conn.in_transaction:
+                    raise sqlite3.OperationalError(
+                        "Transaction deja ouverte : impossible de demarrer un bloc batch()")
+                cursor.execute("BEGIN")
+            else:
+                cursor.execute(f"SAVEPOINT {savepoint}")
+            # Recalculs differes avant le bloc, restaures si le SAVEPOINT est annule
+            pending = (set(self._pending_articles), set(self._pending_chantiers),
+                       dict(self._pending_categories))
+            self._batch_depth = depth
+            try:
+                yield self
+                if depth == 1:
+                    self._flush_batch()
+                    self.conn.commit()
+                else:
+                    cursor.execute(f"RELEASE {savepoint}")
+            except BaseException:
+                self._cache_epoch += 1  # Lectures faites avant l'annulation : perimees
+                if depth == 1:
+                    self.conn.rollback()
+                else:
+                    cursor.execute(f"ROLLBACK TO {savepoint}")
+                    cursor.execute(f"RELEASE {savepoint}")
+                self._pending_articles, self._pending_chantiers, self._pending_categories = pending
+                raise
+            finally:
+                self._batch_depth = depth - 1
+        finally:
+            if self.pool is not None:
+                self.pool.write_lock.release()
+
+    @property
+    def in_batch(self) -> bool:
+        """True a l'interieur d'un bloc batch() (du thread courant)"""
+        return self._batch_depth > 0
+
+    def _batch_local(self) -> threading.local:
+        """Etat du bloc batch() du thread courant (initialise au premier acces)"""
+        state = self._batch_state
+        if not hasattr(state, 'depth'):
+            state.depth = 0
+            state.articles = set()
+            state.chantiers = set()
+            state.categories = {}
+        return state
+
+    @property
+    def _batch_depth(self) -> int:
+        return self._batch_local().depth
+
+    @_batch_depth.setter
+    def _batch_depth(self, value: int):
+        self._batch_local().depth = value
+
+    @property
+    def _pending_articles(self) -> set:
+        return self._batch_local().articles
+
+    @_pending_articles.setter
+    def _pending_articles(self, value: set):
+        self._batch_local().articles = value
+
+    @property
+    def _pending_chantiers(self) -> set:
+        return self._batch_local().chantiers
+
+    @_pending_chantiers.setter
+    def _pending_chantiers(self, value: set):
+        self._batch_local().chantiers = value
+
+    @property
+    def _pending_categories(self) -> dict:
+        return self._batch_local().categories
+
+    @_pending_categories.setter
+    def _pending_categories(self, value: dict):
+        self._batch_local().categories = value
+
+    def cache_generation(self) -> tuple:
+        """
+        Generation d'ecriture de la base (cle de validite du cache des lectures)
+
+        Change a chaque ecriture de cette connexion (total_changes, triggers
+        compris), a chaque annulation, et a chaque validation d'une autre
+        connexion (data_version : autres threads, autres postes).
+        """
+        data_version = self.conn.execute("PRAGMA data_version").fetchone()[0]
+        return (self.conn.total_changes, self._cache_epoch, data_version)
+
+    def cache_stats(self) -> Dict[str, Any]:
+        """Compteurs du cache des lectures (hits, misses, ratio, taille, lignes)"""
+        return self.query_cache.stats()
+
+    def _commit(self):
+        """Valide la transaction, sauf a l'interieur d'un bloc batch()"""
+        if not self._batch_depth:
+            self.conn.commit()
+
+    def _flush_batch(self):
+        """Execute les ajouts et recalculs differes du bloc batch() (sans commit)"""
+        cursor = self.conn.cursor()
+        if self._pending_categories:
+            categories, self._pending_categories = self._pending_categories, {}
+            cursor.executemany('''
+                INSERT OR IGNORE INTO categories (nom, description, couleur)
+                VALUES (?, ?, ?)
+            ''', [(nom, description, couleur) for nom, (description, couleur) in categories.items()])
+        if self._pending_articles:
+            article_ids, self._pending_articles = self._pending_articles, set()
+            self.recalculer_articles_dpgf(article_ids=sorted(article_ids), parametres=self.parametres())
+        if self._pending_chantiers:
+            chantier_ids, self._pending_chantiers = self._pending_chantiers, set()
+            self._update_chantiers_montant(cursor, chantier_ids)
 
     def _create_tables(self):
         """Cree les tables si elles n'existent pas"""
@@ -120,6 +351,15 @@ class Database:
             cursor.execute("ALTER TABLE produits ADD COLUMN marque TEXT")
         except:
             pass
+        # Migration v1.9: references vers le stockage des PDF par contenu
+        try:
+            cursor.execute("ALTER TABLE produits ADD COLUMN fiche_sha256 TEXT")
+        except:
+            pass
+        try:
+            cursor.execute("ALTER TABLE produits ADD COLUMN devis_sha256 TEXT")
+        except:
+            pass
 
         # Migration v1.3.0: ajouter colonnes nom_client et type_marche dans chantiers
         try:
@@ -273,6 +513,14 @@ class Database:
             )
         ''')
 
+        # Migration v1.9: cle de tri des codes DPGF (ordre hierarchique calcule en SQL)
+        for table in ('prix_marche', 'dpgf_structure'):
+            try:
+                cursor.execute(f"ALTER TABLE {table} ADD COLUMN sort_key TEXT")
+            except:
+                pass
+        self._fill_dpgf_sort_keys(cursor)
+
         # Index pour optimiser les recherches (milliers de produits/chantiers)
         cursor.execute('CREATE INDEX IF NOT EXISTS idx_produits_categorie ON produits(categorie)')
         cursor.execute('CREATE INDEX IF NOT EXISTS idx_produits_sous_categorie ON produits(sous_categorie)')
@@ -289,8 +537,56 @@ class Database:
         cursor.execute('CREATE INDEX IF NOT EXISTS idx_chantiers_resultat ON chantiers(resultat)')
         cursor.execute('CREATE INDEX IF NOT EXISTS idx_chantiers_type_marche ON chantiers(type_marche)')
         cursor.execute('CREATE INDEX IF NOT EXISTS idx_prix_marche_chantier ON prix_marche(chantier_id)')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_prix_marche_tri ON prix_marche(chantier_id, sort_key)')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_dpgf_structure_tri ON dpgf_structure(chantier_id, sort_key)')
         cursor.execute('CREATE INDEX IF NOT EXISTS idx_article_produits_prix_marche ON article_produits(prix_marche_id)')
         cursor.execute('CREATE INDEX IF NOT EXISTS idx_article_produits_produit ON article_produits(produit_id)')
+        # Rapprochement des prix figes avec les anciens prix catalogue (actualisation des prix DPGF)
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_historique_prix_produit ON historique_prix(produit_id, ancien_prix)')
+
+        # Index de pagination par cle (liste virtuelle : categorie, sous-categorie, designation, id)
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_produits_keyset "
+                       "ON produits(actif, categorie, IFNULL(sous_categorie, ''), designation, id)")
+
+        # Index de rapprochement des tarifs fournisseurs (import incremental)
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_produits_ref_fournisseur "
+                       "ON produits(reference, IFNULL(fournisseur, ''))")
+
+        # Index plein texte pour la recherche catalogue (v1.9)
+        self._create_fts_index(cursor)
+
+        # Stockage des PDF par contenu (v1.9)
+        self._create_pdf_store(cursor)
+
+        # Index des fichiers PDF references (tenu a jour par file_scanner, v1.9)
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS fichiers_meta (
+                chemin TEXT PRIMARY KEY,
+                existe INTEGER NOT NULL,
+                taille INTEGER,
+                mtime REAL,
+                sha256 TEXT,
+                date_scan TEXT DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+
+        # Facettes des filtres (listes deroulantes en cascade, v1.9)
+        self._create_facettes(cursor)
+
+        # Journal des deplacements de dossiers (renommage de categorie, v1.9)
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS journal_renommages (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                ancien_nom TEXT NOT NULL,
+                nouveau_nom TEXT NOT NULL,
+                description TEXT,
+                source TEXT NOT NULL,
+                destination TEXT NOT NULL,
+                etat TEXT DEFAULT 'prevu',
+                poste TEXT,
+                date_creation TEXT DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
 
         # Parametres par defaut
         default_data_dir = os.path.normpath(os.path.abspath(
@@ -313,6 +609,8 @@ class Database:
             ('taux_vente_pose', '42', 'Prix vente horaire pose (EUR/h)'),
             # Marge marche (affichee mais non modifiable - calculee automatiquement)
             ('marge_marche', '25', 'Marge par defaut pour les marches publics (%)'),
+            # Stockage des PDF par contenu (dossiers de categories = liens)
+            ('stockage_pdf', '0', 'Stocker les PDF une seule fois par contenu (1 = actif)'),
         ]
 
         for cle, valeur, desc in default_params:
@@ -344,6 +642,210 @@ class Database:
         # Migration: ajouter marge_projet si elle n'existe pas
         self._migrate_chantiers_marge_projet()
 
+    def _create_fts_index(self, cursor):
+        """
+        Cree l'index plein texte FTS5 des produits et ses triggers de synchronisation
+
+        La table produits_fts est une table "external content" : elle ne stocke que
+        l'index, le contenu reste dans produits. Les triggers la maintiennent a jour
+        a chaque INSERT / UPDATE / DELETE. Si SQLite est compile sans FTS5, la
+        recherche retombe sur LIKE (self.has_fts = False).
+        """
+        cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='produits_fts'")
+        exists = cursor.fetchone() is not None
+
+        if not exists:
+            created = False
+            # remove_diacritics 2 (SQLite >= 3.27) gere aussi les lettres composees
+            for tokenizer in ('unicode61 remove_diacritics 2', 'unicode61 remove_diacritics 1'):
+                try:
+                    cursor.execute(f'''
+                        CREATE VIRTUAL TABLE produits_fts USING fts5(
+                            designation, dimensions, reference, sous_categorie, marque,
+                            content='produits', content_rowid='id',
+                            tokenize='{tokenizer}', prefix='2 3'
+                        )
+                    ''')
+                    created = True
+                    break
+                except sqlite3.OperationalError:
+                    continue
+            if not created:
+                self.has_fts = False
+                return
+
+        cursor.execute('''
+            CREATE TRIGGER IF NOT EXISTS produits_fts_insert AFTER INSERT ON produits BEGIN
+                INSERT INTO produits_fts(rowid, designation, dimensions, reference, sous_categorie, marque)
+                VALUES (new.id, new.designation, new.dimensions, new.reference, new.sous_categorie, new.marque);
+            END
+        ''')
+        cursor.execute('''
+            CREATE TRIGGER IF NOT EXISTS produits_fts_delete AFTER DELETE ON produits BEGIN
+                INSERT INTO produits_fts(produits_fts, rowid, designation, dimensions, reference, sous_categorie, marque)
+                VALUES ('delete', old.id, old.designation, old.dimensions, old.reference, old.sous_categorie, old.marque);
+            END
+        ''')
+        cursor.execute('''
+            CREATE TRIGGER IF NOT EXISTS produits_fts_update
+            AFTER UPDATE OF designation, dimensions, reference, sous_categorie, marque ON produits BEGIN
+                INSERT INTO produits_fts(produits_fts, rowid, designation, dimensions, reference, sous_categorie, marque)
+                VALUES ('delete', old.id, old.designation, old.dimensions, old.reference, old.sous_categorie, old.marque);
+                INSERT INTO produits_fts(rowid, designation, dimensions, reference, sous_categorie, marque)
+                VALUES (new.id, new.designation, new.dimensions, new.reference, new.sous_categorie, new.marque);
+            END
+        ''')
+
+        if not exists:
+            # Base existante : indexer les produits deja presents
+            cursor.execute("INSERT INTO produits_fts(produits_fts) VALUES('rebuild')")
+
+        self.has_fts = True
+
+    def _create_pdf_store(self, cursor):
+        """
+        Cree les tables du stockage des PDF par contenu et le comptage des references
+
+        pdf_blobs : un fichier stocke par empreinte SHA-256, avec son nombre de
+        references (produits). pdf_vues : fichiers des dossiers de categories
+        (liens vers un fichier stocke). Les produits pointent toujours vers une
+        vue (fiche_technique, devis_fournisseur) ; les triggers en deduisent
+        fiche_sha256 / devis_sha256 et tiennent refcount a jour.
+        """
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS pdf_blobs (
+                sha256 TEXT PRIMARY KEY,
+                chemin TEXT NOT NULL,
+                taille INTEGER,
+                refcount INTEGER DEFAULT 0,
+                date_ajout TEXT DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS pdf_vues (
+                chemin TEXT PRIMARY KEY,
+                sha256 TEXT NOT NULL,
+                FOREIGN KEY (sha256) REFERENCES pdf_blobs(sha256)
+            )
+        ''')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_pdf_vues_sha256 ON pdf_vues(sha256)')
+
+        # Chemin -> empreinte (uniquement si le chemin est une vue connue)
+        cursor.execute('''
+            CREATE TRIGGER IF NOT EXISTS produits_pdf_insert AFTER INSERT ON produits
+            WHEN EXISTS (SELECT 1 FROM pdf_vues WHERE chemin IN (new.fiche_technique, new.devis_fournisseur))
+            BEGIN
+                UPDATE produits SET
+                    fiche_sha256 = (SELECT sha256 FROM pdf_vues WHERE chemin = new.fiche_technique),
+                    devis_sha256 = (SELECT sha256 FROM pdf_vues WHERE chemin = new.devis_fournisseur)
+                WHERE id = new.id;
+            END
+        ''')
+        cursor.execute('''
+            CREATE TRIGGER IF NOT EXISTS produits_pdf_update
+            AFTER UPDATE OF fiche_technique, devis_fournisseur ON produits
+            WHEN new.fiche_sha256 IS NOT NULL OR new.devis_sha256 IS NOT NULL
+                 OR EXISTS (SELECT 1 FROM pdf_vues WHERE chemin IN (new.fiche_technique, new.devis_fournisseur))
+            BEGIN
+                UPDATE produits SET
+                    fiche_sha256 = (SELECT sha256 FROM pdf_vues WHERE chemin = new.fiche_technique),
+                    devis_sha256 = (SELECT sha256 FROM pdf_vues WHERE chemin = new.devis_fournisseur)
+                WHERE id = new.id;
+            END
+        ''')
+        # Comptage des references
+        cursor.execute('''
+            CREATE TRIGGER IF NOT EXISTS produits_pdf_refcount
+            AFTER UPDATE OF fiche_sha256, devis_sha256 ON produits
+            BEGIN
+                UPDATE pdf_blobs SET refcount = refcount - 1 WHERE sha256 = old.fiche_sha256;
+                UPDATE pdf_blobs SET refcount = refcount - 1 WHERE sha256 = old.devis_sha256;
+                UPDATE pdf_blobs SET refcount = refcount + 1 WHERE sha256 = new.fiche_sha256;
+                UPDATE pdf_blobs SET refcount = refcount + 1 WHERE sha256 = new.devis_sha256;
+            END
+        ''')
+        cursor.execute('''
+            CREATE TRIGGER IF NOT EXISTS produits_pdf_delete AFTER DELETE ON produits
+            WHEN old.fiche_sha256 IS NOT NULL OR old.devis_sha256 IS NOT NULL
+            BEGIN
+                UPDATE pdf_blobs SET refcount = refcount - 1 WHERE sha256 = old.fiche_sha256;
+                UPDATE pdf_blobs SET refcount = refcount - 1 WHERE sha256 = old.devis_sha256;
+            END
+        ''')
+
+    FACET_COLUMNS = ('categorie', 'sous_categorie', 'sous_categorie_2', 'sous_categorie_3',
+                     'hauteur', 'largeur', 'marque', 'fournisseur')
+
+    def _create_facettes(self, cursor):
+        """
+        Cree la table des facettes et ses triggers de synchronisation
+
+        Une ligne par combinaison de valeurs des filtres (produits actifs) avec
+        son nombre de produits : les listes deroulantes et leurs compteurs se
+        lisent sans parcourir produits. Valeur absente stockee en ''.
+        """
+        cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='facettes'")
+        exists = cursor.fetchone() is not None
+
+        columns = ', '.join(self.FACET_COLUMNS)
+        cursor.execute(f'''
+            CREATE TABLE IF NOT EXISTS facettes (
+                {', '.join(f"{col} NOT NULL" for col in self.FACET_COLUMNS)},
+                nb INTEGER NOT NULL,
+                PRIMARY KEY ({columns})
+            ) WITHOUT ROWID
+        ''')
+
+        def values(prefix):
+            return ', '.join(f"IFNULL({prefix}.{col}, '')" for col in self.FACET_COLUMNS)
+
+        def match(prefix):
+            return ' AND '.join(f"{col} = IFNULL({prefix}.{col}, '')" for col in self.FACET_COLUMNS)
+
+        increment = f"ON CONFLICT ({columns}) DO UPDATE SET nb = nb + 1"
+        cursor.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS produits_facettes_insert AFTER INSERT ON produits
+            WHEN new.actif = 1
+            BEGIN
+                INSERT INTO facettes ({columns}, nb) VALUES ({values('new')}, 1) {increment};
+            END
+        ''')
+        cursor.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS produits_facettes_delete AFTER DELETE ON produits
+            WHEN old.actif = 1
+            BEGIN
+                UPDATE facettes SET nb = nb - 1 WHERE {match('old')};
+                DELETE FROM facettes WHERE nb <= 0 AND {match('old')};
+            END
+        ''')
+        cursor.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS produits_facettes_update
+            AFTER UPDATE OF {columns}, actif ON produits
+            WHEN old.actif = 1 OR new.actif = 1
+            BEGIN
+                UPDATE facettes SET nb = nb - 1 WHERE old.actif = 1 AND {match('old')};
+                DELETE FROM facettes WHERE nb <= 0 AND {match('old')};
+                INSERT INTO facettes ({columns}, nb) SELECT {values('new')}, 1
+                WHERE new.actif = 1 {increment};
+            END
+        ''')
+
+        if not exists:
+            # Base existante : calculer les facettes des produits deja presents
+            self.rebuild_facettes(cursor)
+
+    def rebuild_facettes(self, cursor=None):
+        """Recalcule entierement la table des facettes (apres un import en masse)"""
+        cursor = cursor or self.conn.cursor()
+        columns = ', '.join(self.FACET_COLUMNS)
+        cursor.execute("DELETE FROM facettes")
+        cursor.execute(f'''
+            INSERT INTO facettes ({columns}, nb)
+            SELECT {', '.join(f"IFNULL({col}, '')" for col in self.FACET_COLUMNS)}, COUNT(*)
+            FROM produits WHERE actif = 1
+            GROUP BY {', '.join(f"IFNULL({col}, '')" for col in self.FACET_COLUMNS)}
+        ''')
+
     def _migrate_chantiers_marge_projet(self):
         """Ajoute la colonne marge_projet aux chantiers existants"""
         cursor = self.conn.cursor()
@@ -356,13 +858,30 @@ class Database:
 
     # ==================== PARAMETRES ====================
 
+    def parametres(self) -> ParametresSnapshot:
+        """
+        Instantane type et immuable de la table parametres
+
+        Lu une fois puis conserve jusqu'a la prochaine ecriture (set_parametre,
+        annulation de transaction, validation d'un autre poste).
+
+        Returns:
+            ParametresSnapshot (marge, marge_marche, tva, taux_cout, taux_vente, ...)
+        """
+        data_version = self.conn.execute("PRAGMA data_version").fetchone()[0]
+        generation = (self._cache_epoch, data_version)
+        if self._parametres is None or self._parametres_generation != generation:
+            cursor = self.conn.cursor()
+            cursor.execute("SELECT cle, valeur FROM parametres")
+            self._parametres = ParametresSnapshot({row['cle']: row['valeur'] for row in cursor.fetchall()})
+            self._parametres_generation = generation
+        return self._parametres
+
     def get_parametre(self, cle: str, default: str = None) -> Optional[str]:
         """Recupere un parametre"""
-        cursor = self.conn.cursor()
-        cursor.execute("SELECT valeur FROM parametres WHERE cle=?", (cle,))
-        result = cursor.fetchone()
-        return result['valeur'] if result else default
+        return self.parametres().get(cle, default)
 
+    @serialized_write
     def set_parametre(self, cle: str, valeur: str, description: str = None):
         """Definit un parametre"""
         cursor = self.conn.cursor()
@@ -373,11 +892,12 @@ class Database:
             ''', (cle, valeur, description))
         else:
             cursor.execute("UPDATE parametres SET valeur=? WHERE cle=?", (valeur, cle))
-        self.conn.commit()
+        self._parametres = None  # Relu a la prochaine lecture
+        self._commit()
 
     def get_marge(self) -> float:
         """Recupere la marge par defaut"""
-        return float(self.get_parametre('marge', '20'))
+        return self.parametres().marge
 
     def set_marge(self, marge: float):
         """Definit la marge par defaut"""
@@ -385,18 +905,21 @@ class Database:
 
     # ==================== CATEGORIES ====================
 
+    @cached_query
     def get_categories(self) -> List[Dict]:
         """Recupere toutes les categories"""
         cursor = self.conn.cursor()
         cursor.execute("SELECT * FROM categories ORDER BY ordre, nom")
         return [dict(row) for row in cursor.fetchall()]
 
+    @cached_query
     def get_categories_names(self) -> List[str]:
         """Recupere les noms des categories"""
         cursor = self.conn.cursor()
         cursor.execute("SELECT DISTINCT nom FROM categories ORDER BY ordre, nom")
         return [row['nom'] for row in cursor.fetchall()]
 
+    @cached_query
     def get_subcategories_names(self, level: int = 1) -> List[str]:
         """
         Recupere les noms des sous-categories distinctes pour un niveau donne
@@ -420,6 +943,38 @@ class Database:
         cursor.execute(f"SELECT DISTINCT {field} FROM produits WHERE {field} IS NOT NULL AND {field} != '' ORDER BY {field}")
         return [row[field] for row in cursor.fetchall()]
 
+    @cached_query
+    def get_facettes(self, field: str, **filtres) -> List[tuple]:
+        """
+        Valeurs distinctes d'un filtre et nombre de produits actifs pour chacune
+
+        Lit la table facettes (aucun parcours de produits).
+
+        Args:
+            field: Colonne de facette (voir FACET_COLUMNS)
+            **filtres: Filtres en cascade colonne=valeur ("Toutes", "" ou None ignores)
+
+        Returns:
+            Liste de (valeur, nombre) triee par valeur
+        """
+        if field not in self.FACET_COLUMNS:
+            raise ValueError(f"Facette inconnue: {field}")
+
+        query = f"SELECT {field} AS valeur, SUM(nb) AS nb FROM facettes WHERE {field} != ''"
+        params = []
+        for col, value in filtres.items():
+            if col not in self.FACET_COLUMNS:
+                raise ValueError(f"Facette inconnue: {col}")
+            if value is None or value in ("Toutes", "Tous", ""):
+                continue
+            query += f" AND {col} = ?"
+            params.append(value)
+        query += f" GROUP BY {field} ORDER BY {field}"
+
+        cursor = self.conn.cursor()
+        cursor.execute(query, params)
+        return [(row['valeur'], row['nb']) for row in cursor.fetchall()]
+
     def get_subcategories_filtered(self, level: int = 1, categorie: str = None,
                                    sous_categorie: str = None, sous_categorie_2: str = None) -> List[str]:
         """
@@ -434,45 +989,42 @@ class Database:
         Returns:
             Liste des sous-categories distinctes triees
         """
-        cursor = self.conn.cursor()
-
-        if level == 1:
-            field = 'sous_categorie'
-        elif level == 2:
-            field = 'sous_categorie_2'
-        elif level == 3:
-            field = 'sous_categorie_3'
-        else:
-            return []
-
-        query = f"SELECT DISTINCT {field} FROM produits WHERE {field} IS NOT NULL AND {field} != '' AND actif = 1"
-        params = []
-
-        if categorie and categorie not in ("Toutes", ""):
-            query += " AND categorie = ?"
-            params.append(categorie)
+        return [valeur for valeur, _ in self.get_subcategory_facets(
+            level, categorie, sous_categorie, sous_categorie_2)]
 
-        if level >= 2 and sous_categorie and sous_categorie not in ("Toutes", ""):
-            query += " AND sous_categorie = ?"
-            params.append(sous_categorie)
-
-        if level == 3 and sous_categorie_2 and sous_categorie_2 not in ("Toutes", ""):
-            query += " AND sous_categorie_2 = ?"
-            params.append(sous_categorie_2)
-
-        query += f" ORDER BY {field}"
-        cursor.execute(query, params)
-        return [row[field] for row in cursor.fetchall()]
+    def get_subcategory_facets(self, level: int = 1, categorie: str = None,
+                               sous_categorie: str = None, sous_categorie_2: str = None) -> List[tuple]:
+        """
+        Sous-categories en cascade avec leur nombre de produits actifs
 
+        Returns:
+            Liste de (sous-categorie, nombre) (voir get_subcategories_filtered)
+        """
+        if level == 1:
+            return self.get_facettes('sous_categorie', categorie=categorie)
+        if level == 2:
+            return self.get_facettes('sous_categorie_2', categorie=categorie,
+                                     sous_categorie=sous_categorie)
+        if level == 3:
+            return self.get_facettes('sous_categorie_3', categorie=categorie,
+                                     sous_categorie=sous_categorie,
+                                     sous_categorie_2=sous_categorie_2)
+        return []
+
+    @serialized_write
     def add_categorie(self, nom: str, description: str = None, couleur: str = '#1F4E79'):
-        """Ajoute une categorie"""
+        """Ajoute une categorie (differee a la fin du bloc dans un batch())"""
+        if self._batch_depth:
+            self._pending_categories.setdefault(nom, (description, couleur))
+            return
         cursor = self.conn.cursor()
         cursor.execute('''
             INSERT OR IGNORE INTO categories (nom, description, couleur)
             VALUES (?, ?, ?)
         ''', (nom, description, couleur))
-        self.conn.commit()
+        self._commit()
 
+    @serialized_write
     def update_categorie(self, old_nom: str, new_nom: str, description: str = None):
         """
         Met a jour une categorie
@@ -500,8 +1052,9 @@ class Database:
                 WHERE categorie=?
             ''', (new_nom, old_nom))
 
-        self.conn.commit()
+        self._commit()
 
+    @serialized_write
     def delete_categorie(self, nom: str):
         """
         Supprime une categorie
@@ -511,8 +1064,9 @@ class Database:
         """
         cursor = self.conn.cursor()
         cursor.execute("DELETE FROM categories WHERE nom=?", (nom,))
-        self.conn.commit()
+        self._commit()
 
+    @serialized_write
     def update_produits_category(self, old_category: str, new_category: str):
         """
         Reassigne tous les produits d'une categorie vers une autre
@@ -526,8 +1080,9 @@ class Database:
             UPDATE produits SET categorie=?, date_modification=CURRENT_TIMESTAMP
             WHERE categorie=?
         ''', (new_category, old_category))
-        self.conn.commit()
+        self._commit()
 
+    @serialized_write
     def delete_produits_by_category(self, category: str, permanent: bool = True):
         """
         Supprime tous les produits d'une categorie
@@ -544,7 +1099,7 @@ class Database:
                 UPDATE produits SET actif=0, date_modification=CURRENT_TIMESTAMP
                 WHERE categorie=?
             ''', (category,))
-        self.conn.commit()
+        self._commit()
 
     def get_categorie(self, nom: str) -> Optional[Dict]:
         """Recupere une categorie par son nom"""
@@ -555,265 +1110,489 @@ class Database:
 
     # ==================== PRODUITS ====================
 
-    def search_produits(self, terme: str = "", categorie: str = "", actif_only: bool = True,
-                        hauteur: int = None, largeur: int = None,
-                        sous_categorie: str = "", sous_categorie_2: str = "",
-                        sous_categorie_3: str = "",
-                        has_fiche_technique: bool = None,
-                        has_devis_fournisseur: bool = None,
-                        marque: str = "", fournisseur: str = "",
-                        limit: int = 5000, offset: int = 0) -> List[Dict]:
+    def _fts_match_query(self, terme: str) -> str:
         """
-        Recherche des produits (optimise pour gros volumes)
+        Construit l'expression MATCH FTS5 a partir du terme saisi
 
-        Args:
-            terme: Terme de recherche (dans designation, dimensions, reference, marque)
-            categorie: Filtrer par categorie
-            actif_only: Ne retourner que les produits actifs
-            hauteur: Filtrer par hauteur exacte
-            largeur: Filtrer par largeur exacte
-            sous_categorie: Filtrer par sous-categorie 1
-            sous_categorie_2: Filtrer par sous-categorie 2
-            sous_categorie_3: Filtrer par sous-categorie 3
-            has_fiche_technique: Filtrer les produits avec fiche technique (True/False/None)
-            has_devis_fournisseur: Filtrer les produits avec devis fournisseur (True/False/None)
-            marque: Filtrer par marque
-            fournisseur: Filtrer par fournisseur
-            limit: Nombre maximum de resultats (0 = illimite, defaut 5000)
-            offset: Decalage pour pagination
+        Chaque mot devient un prefixe, tous les mots doivent etre presents.
+        Le mot exact est ajoute en alternative ("ei30" OR "ei30"*) pour que bm25
+        classe une reference exacte avant ses homonymes prefixes (EI300, ...).
+        Les accents et la casse sont ignores par le tokenizer.
 
         Returns:
-            Liste des produits correspondants
+            Expression MATCH, ou chaine vide si le terme ne contient aucun mot
         """
-        cursor = self.conn.cursor()
-        query = "SELECT * FROM produits WHERE 1=1"
+        tokens = re.findall(r'\w+', terme or '')
+        return ' AND '.join(f'("{token}" OR "{token}"*)' for token in tokens)
+
+    def _build_search_filters(self, terme: str = "", categorie: str = "", actif_only: bool = True,
+                              hauteur: int = None, largeur: int = None,
+                              sous_categorie: str = "", sous_categorie_2: str = "",
+                              sous_categorie_3: str = "",
+                              has_fiche_technique: bool = None,
+                              has_devis_fournisseur: bool = None,
+                              marque: str = "", fournisseur: str = "",
+                              fiche_valide: bool = None, liens_casses: bool = None) -> tuple:
+        """
+        Construit la clause FROM/WHERE commune a la recherche et au comptage
+
+        Le terme passe par l'index plein texte produits_fts (jointure sur rowid),
+        les filtres structures restent appliques sur la table produits (alias p).
+
+        Returns:
+            Tuple (from_where, params, ranked) - ranked indique une recherche FTS
+        """
+        from_clause = "FROM produits p"
+        conditions = []
         params = []
+        ranked = False
 
         if actif_only:
-            query += " AND actif = 1"
+            conditions.append("p.actif = 1")
 
         if terme:
-            query += " AND (designation LIKE ? OR dimensions LIKE ? OR reference LIKE ? OR sous_categorie LIKE ? OR marque LIKE ?)"
-            terme_like = f"%{terme}%"
-            params.extend([terme_like, terme_like, terme_like, terme_like, terme_like])
+            match_query = self._fts_match_query(terme) if self.has_fts else ''
+            if match_query:
+                # CROSS JOIN force SQLite a partir de l'index FTS (sinon MATCH evalue par produit)
+                from_clause = "FROM produits_fts CROSS JOIN produits p ON p.id = produits_fts.rowid"
+                conditions.append("produits_fts MATCH ?")
+                params.append(match_query)
+                ranked = True
+            else:
+                # Pas de FTS5 disponible (ou terme sans mot) : recherche LIKE
+                conditions.append("(p.designation LIKE ? OR p.dimensions LIKE ? OR p.reference LIKE ? "
+                                  "OR p.sous_categorie LIKE ? OR p.marque LIKE ?)")
+                terme_like = f"%{terme}%"
+                params.extend([terme_like] * 5)
 
         if categorie and categorie not in ("Toutes", ""):
-            query += " AND categorie = ?"
+            conditions.append("p.categorie = ?")
             params.append(categorie)
 
         if sous_categorie and sous_categorie not in ("Toutes", ""):
-            query += " AND sous_categorie = ?"
+            conditions.append("p.sous_categorie = ?")
             params.append(sous_categorie)
 
         if sous_categorie_2 and sous_categorie_2 not in ("Toutes", ""):
-            query += " AND sous_categorie_2 = ?"
+            conditions.append("p.sous_categorie_2 = ?")
             params.append(sous_categorie_2)
 
         if sous_categorie_3 and sous_categorie_3 not in ("Toutes", ""):
-            query += " AND sous_categorie_3 = ?"
+            conditions.append("p.sous_categorie_3 = ?")
             params.append(sous_categorie_3)
 
         if hauteur:
-            query += " AND hauteur = ?"
+            conditions.append("p.hauteur = ?")
             params.append(hauteur)
 
         if largeur:
-            query += " AND largeur = ?"
+            conditions.append("p.largeur = ?")
             params.append(largeur)
 
         # Filtres documents (fix issue #27)
         if has_fiche_technique is True:
-            query += " AND fiche_technique IS NOT NULL AND fiche_technique != ''"
+            conditions.append("p.fiche_technique IS NOT NULL AND p.fiche_technique != ''")
         elif has_fiche_technique is False:
-            query += " AND (fiche_technique IS NULL OR fiche_technique = '')"
+            conditions.append("(p.fiche_technique IS NULL OR p.fiche_technique = '')")
 
         if has_devis_fournisseur is True:
-            query += " AND devis_fournisseur IS NOT NULL AND devis_fournisseur != ''"
+            conditions.append("p.devis_fournisseur IS NOT NULL AND p.devis_fournisseur != ''")
         elif has_devis_fournisseur is False:
-            query += " AND (devis_fournisseur IS NULL OR devis_fournisseur = '')"
+            conditions.append("(p.devis_fournisseur IS NULL OR p.devis_fournisseur = '')")
+
+        # Validite des fichiers d'apres l'index fichiers_meta (aucun acces disque)
+        if fiche_valide is True:
+            conditions.append("EXISTS (SELECT 1 FROM fichiers_meta fm "
+                              "WHERE fm.chemin = p.fiche_technique AND fm.existe = 1)")
+        elif fiche_valide is False:
+            conditions.append("EXISTS (SELECT 1 FROM fichiers_meta fm "
+                              "WHERE fm.chemin = p.fiche_technique AND fm.existe = 0)")
+
+        if liens_casses is True:
+            conditions.append("EXISTS (SELECT 1 FROM fichiers_meta fm WHERE fm.existe = 0 "
+                              "AND fm.chemin IN (p.fiche_technique, p.devis_fournisseur))")
 
         if marque and marque not in ("Toutes", ""):
-            query += " AND marque = ?"
+            conditions.append("p.marque = ?")
             params.append(marque)
 
         if fournisseur and fournisseur not in ("Tous", ""):
-            query += " AND fournisseur = ?"
+            conditions.append("p.fournisseur = ?")
             params.append(fournisseur)
 
-        query += " ORDER BY categorie, sous_categorie, designation"
+        from_where = from_clause
+        if conditions:
+            from_where += " WHERE " + " AND ".join(conditions)
+        return from_where, params, ranked
+
+    @cached_query
+    def search_produits(self, terme: str = "", categorie: str = "", actif_only: bool = True,
+                        hauteur: int = None, largeur: int = None,
+                        sous_categorie: str = "", sous_categorie_2: str = "",
+                        sous_categorie_3: str = "",
+                        has_fiche_technique: bool = None,
+                        has_devis_fournisseur: bool = None,
+                        marque: str = "", fournisseur: str = "",
+                        limit: int = 5000, offset: int = 0,
+                        fiche_valide: bool = None, liens_casses: bool = None) -> List[Dict]:
+        """
+        Recherche des produits (optimise pour gros volumes)
+
+        Le terme est recherche via l'index plein texte FTS5 (prefixes, sans accents)
+        et les resultats sont classes par pertinence (bm25).
+
+        Args:
+            terme: Terme de recherche (dans designation, dimensions, reference, sous-categorie, marque)
+            categorie: Filtrer par categorie
+            actif_only: Ne retourner que les produits actifs
+            hauteur: Filtrer par hauteur exacte
+            largeur: Filtrer par largeur exacte
+            sous_categorie: Filtrer par sous-categorie 1
+            sous_categorie_2: Filtrer par sous-categorie 2
+            sous_categorie_3: Filtrer par sous-categorie 3
+            has_fiche_technique: Filtrer les produits avec fiche technique (True/False/None)
+            has_devis_fournisseur: Filtrer les produits avec devis fournisseur (True/False/None)
+            marque: Filtrer par marque
+            fournisseur: Filtrer par fournisseur
+            limit: Nombre maximum de resultats (0 = illimite, defaut 5000)
+            offset: Decalage pour pagination
+            fiche_valide: Fiche technique presente sur le disque (True) ou
+                          renseignee mais introuvable (False), d'apres fichiers_meta
+            liens_casses: Produits dont la fiche ou le devis est introuvable
+
+        Returns:
+            Liste des produits correspondants
+        """
+        cursor = self.conn.cursor()
+        from_where, params, ranked = self._build_search_filters(
+            terme, categorie, actif_only, hauteur, largeur,
+            sous_categorie, sous_categorie_2, sous_categorie_3,
+            has_fiche_technique, has_devis_fournisseur, marque, fournisseur,
+            fiche_valide, liens_casses)
+
+        query = f"SELECT p.* {from_where} ORDER BY "
+        if ranked:
+            query += f"{self._RANK_EXPR}, "
+        query += "p.categorie, p.sous_categorie, p.designation"
 
         # Pagination pour optimiser les gros volumes
         if limit > 0:
-            query += f" LIMIT {limit}"
-            if offset > 0:
-                query += f" OFFSET {offset}"
+            query += " LIMIT ? OFFSET ?"
+            params.extend([limit, max(offset, 0)])
 
         cursor.execute(query, params)
         return [dict(row) for row in cursor.fetchall()]
 
-    def count_search_results(self, terme: str = "", categorie: str = "", actif_only: bool = True,
-                             hauteur: int = None, largeur: int = None,
-                             sous_categorie: str = "", sous_categorie_2: str = "",
-                             sous_categorie_3: str = "",
-                             has_fiche_technique: bool = None,
-                             has_devis_fournisseur: bool = None,
-                             marque: str = "", fournisseur: str = "") -> int:
+    # Pertinence d'une recherche plein texte : la reference (code article) puis
+    # la designation pesent plus lourd
+    _RANK_EXPR = "bm25(produits_fts, 5.0, 1.0, 10.0, 2.0, 2.0)"
+
+    # Ordre de pagination par pertinence (bm25 puis id), pour une recherche avec terme
+    ORDER_PERTINENCE = 'pertinence'
+
+    # Ordres de tri de la pagination par cle : colonnes puis id (toujours unique)
+    PAGE_ORDERS = {
+        'categorie': ('categorie', 'sous_categorie', 'designation'),
+        'sous_categorie': ('sous_categorie',),
+        'sous_categorie_2': ('sous_categorie_2',),
+        'sous_categorie_3': ('sous_categorie_3',),
+        'designation': ('designation',),
+        'hauteur': ('hauteur',),
+        'largeur': ('largeur',),
+        'prix_achat': ('prix_achat',),
+        'reference': ('reference',),
+        'fournisseur': ('fournisseur',),
+        'marque': ('marque',),
+        'id': (),
+    }
+    _PAGE_NOT_NULL = ('categorie', 'designation')
+
+    def page_key(self, produit: Dict, order_by: str = 'categorie') -> tuple:
         """
-        Compte le nombre de produits correspondant aux criteres (sans les charger)
+        Calcule la cle de pagination d'un produit (meme forme que l'ORDER BY SQL)
+
+        Args:
+            produit: Ligne produit retournee par search_produits_page
+            order_by: Ordre de tri (cle de PAGE_ORDERS ou ORDER_PERTINENCE)
 
         Returns:
-            Nombre total de produits correspondants
+            Tuple des valeurs de tri suivi de l'id
+        """
+        if order_by == self.ORDER_PERTINENCE:
+            if produit.get('rang') is not None:
+                return (produit['rang'], produit['id'])
+            order_by = 'categorie'  # Recherche sans terme : ordre par defaut (voir _page_order)
+        key = []
+        for col in self.PAGE_ORDERS[order_by]:
+            value = produit.get(col)
+            key.append(value if value is not None or col in self._PAGE_NOT_NULL else '')
+        key.append(produit['id'])
+        return tuple(key)
+
+    def _page_order(self, order_by: str, ranked: bool) -> tuple:
+        """
+        Expressions SQL de l'ordre de pagination (toujours completees par p.id)
+
+        Returns:
+            Tuple (order_by effectif, expressions) ; la pertinence sans recherche
+            plein texte retombe sur l'ordre par categorie
+        """
+        if order_by == self.ORDER_PERTINENCE and ranked:
+            return order_by, [self._RANK_EXPR, "p.id"]
+        if order_by not in self.PAGE_ORDERS:
+            order_by = 'categorie'
+        exprs = [f"p.{col}" if col in self._PAGE_NOT_NULL else f"IFNULL(p.{col}, '')"
+                 for col in self.PAGE_ORDERS[order_by]]
+        exprs.append("p.id")
+        return order_by, exprs
+
+    def search_produits_page(self, after_key: tuple = None, offset: int = 0, limit: int = 100,
+                             order_by: str = 'categorie', descending: bool = False,
+                             page_keys: List[tuple] = None, **criteres) -> List[Dict]:
         """
+        Recupere une page de resultats par pagination par cle (keyset)
+
+        La page suivante se lit a partir de la cle de la derniere ligne recue
+        (after_key = page_key(derniere_ligne)) : cout constant quelle que soit la
+        position dans le catalogue. Sans cle, l'offset sert de point d'entree
+        (saut direct via la barre de defilement) : un offset multiple de limit
+        est resolu par les cles de fin de page (search_page_keys), sans OFFSET.
+        Ces cles peuvent etre fournies deja calculees (page_keys) : le saut ne
+        relit alors que la page demandee.
+
+        Args:
+            after_key: Cle de la derniere ligne de la page precedente (optionnel)
+            offset: Decalage si after_key n'est pas connu
+            limit: Taille de la page
+            order_by: Ordre de tri (cle de PAGE_ORDERS, ou ORDER_PERTINENCE pour
+                      une recherche avec terme), toujours complete par id
+            descending: Tri decroissant
+            page_keys: Cles de fin de page de la meme recherche (search_page_keys
+                       avec page_size=limit), calculees ici si absentes
+            **criteres: Memes filtres que search_produits (terme, categorie, ...)
+
+        Returns:
+            Liste des produits de la page
+        """
+        if after_key is None and offset > 0 and offset % limit == 0:
+            keys = page_keys
+            if keys is None:
+                keys = self.search_page_keys(page_size=limit, order_by=order_by,
+                                             descending=descending, **criteres)
+            page_index = offset // limit
+            if page_index > len(keys):
+                return []
+            after_key, offset = keys[page_index - 1], 0
+
         cursor = self.conn.cursor()
-        query = "SELECT COUNT(*) as cnt FROM produits WHERE 1=1"
-        params = []
+        from_where, params, ranked = self._build_search_filters(**criteres)
+        order_by, exprs = self._page_order(order_by, ranked)
+
+        # Etat des fichiers pour l'affichage (None = pas encore indexe)
+        query = ("SELECT p.*, "
+                 "(SELECT existe FROM fichiers_meta WHERE chemin = p.fiche_technique) AS fiche_existe, "
+                 "(SELECT existe FROM fichiers_meta WHERE chemin = p.devis_fournisseur) AS devis_existe")
+        if order_by == self.ORDER_PERTINENCE:
+            query += f", {self._RANK_EXPR} AS rang"
+        query += f" {from_where}"
+        if after_key is not None:
+            operator = '<' if descending else '>'
+            query += " AND " if " WHERE " in from_where else " WHERE "
+            query += f"({', '.join(exprs)}) {operator} ({', '.join('?' * len(exprs))})"
+            params.extend(after_key)
+
+        direction = " DESC" if descending else ""
+        query += " ORDER BY " + ", ".join(expr + direction for expr in exprs)
+        query += " LIMIT ?"
+        params.append(limit)
+        if after_key is None and offset > 0:
+            query += " OFFSET ?"
+            params.append(offset)
 
-        if actif_only:
-            query += " AND actif = 1"
+        cursor.execute(query, params)
+        return [dict(row) for row in cursor.fetchall()]
 
-        if terme:
-            query += " AND (designation LIKE ? OR dimensions LIKE ? OR reference LIKE ? OR sous_categorie LIKE ? OR marque LIKE ?)"
-            terme_like = f"%{terme}%"
-            params.extend([terme_like, terme_like, terme_like, terme_like, terme_like])
+    @cached_query
+    def search_page_keys(self, page_size: int = 100, order_by: str = 'categorie',
+                         descending: bool = False, **criteres) -> List[tuple]:
+        """
+        Cles de fin de chaque page complete d'une recherche (saut direct par cle)
 
-        if categorie and categorie not in ("Toutes", ""):
-            query += " AND categorie = ?"
-            params.append(categorie)
+        Un seul parcours de l'index de tri par recherche ; chaque saut de la barre
+        de defilement devient ensuite une recherche par cle au lieu d'un OFFSET
+        (qui relit toutes les lignes sautees).
 
-        if sous_categorie and sous_categorie not in ("Toutes", ""):
-            query += " AND sous_categorie = ?"
-            params.append(sous_categorie)
+        Args:
+            page_size: Taille des pages
+            order_by: Ordre de tri (voir search_produits_page)
+            descending: Tri decroissant
+            **criteres: Memes filtres que search_produits
 
-        if sous_categorie_2 and sous_categorie_2 not in ("Toutes", ""):
-            query += " AND sous_categorie_2 = ?"
-            params.append(sous_categorie_2)
+        Returns:
+            Liste des cles (meme forme que page_key) : keys[i] = derniere ligne de la page i
+        """
+        cursor = self.conn.cursor()
+        from_where, params, ranked = self._build_search_filters(**criteres)
+        _, exprs = self._page_order(order_by, ranked)
+
+        # bm25() n'est pas autorise dans une fonction de fenetre : cles calculees
+        # dans une sous-requete, puis numerotees
+        keys = [f"k{index}" for index in range(len(exprs))]
+        direction = " DESC" if descending else ""
+        inner = "SELECT " + ", ".join(f"{expr} AS {key}" for expr, key in zip(exprs, keys)) + f" {from_where}"
+        cursor.execute(f"SELECT {', '.join(keys)} FROM ("
+                       f"SELECT {', '.join(keys)}, ROW_NUMBER() OVER "
+                       f"(ORDER BY {', '.join(key + direction for key in keys)}) AS rn FROM ({inner})"
+                       f") WHERE rn % ? = 0 ORDER BY rn", params + [page_size])
+        return [tuple(row) for row in cursor.fetchall()]
+
+    # Filtres dont search_with_facets compte les valeurs
+    SEARCH_FACETS = ('categorie', 'marque', 'fournisseur', 'hauteur', 'largeur')
+
+    @cached_query
+    def search_with_facets(self, limit: int = 100, order_by: Optional[str] = 'categorie',
+                           descending: bool = False, facets: tuple = SEARCH_FACETS,
+                           **criteres) -> Dict:
+        """
+        Recherche avec total et compteurs par valeur de filtre en une seule lecture
 
-        if sous_categorie_3 and sous_categorie_3 not in ("Toutes", ""):
-            query += " AND sous_categorie_3 = ?"
-            params.append(sous_categorie_3)
+        L'ensemble filtre (tous les criteres sauf ceux des facettes) est materialise
+        une fois dans une CTE ; le total et les comptages par valeur en sont deduits
+        par une seule requete. Chaque facette est comptee avec les autres filtres
+        mais sans le sien : les valeurs alternatives restent proposees. Sans terme
+        ni filtre sur les documents, la CTE lit la table facettes au lieu de produits.
 
-        if hauteur:
-            query += " AND hauteur = ?"
-            params.append(hauteur)
+        La premiere page est lue par une requete distincte (search_produits_page,
+        pagination par cle) : la CTE ne garde que les colonnes des facettes, ou des
+        comptages deja agreges quand elle lit la table facettes.
 
-        if largeur:
-            query += " AND largeur = ?"
-            params.append(largeur)
+        Args:
+            limit: Taille de la premiere page
+            order_by: Ordre de tri de la page (cle de PAGE_ORDERS) ; None = ordre de
+                      search_produits (pertinence si un terme est saisi)
+            descending: Tri decroissant
+            facets: Colonnes dont les valeurs sont comptees (voir SEARCH_FACETS)
+            **criteres: Memes filtres que search_produits (terme, categorie, ...)
 
-        if has_fiche_technique is True:
-            query += " AND fiche_technique IS NOT NULL AND fiche_technique != ''"
-        elif has_fiche_technique is False:
-            query += " AND (fiche_technique IS NULL OR fiche_technique = '')"
+        Returns:
+            Dictionnaire {'produits': premiere page, 'total': nombre de resultats,
+                          'facettes': {colonne: [(valeur, nombre), ...]}}
+        """
+        base = dict(criteres)
+        facet_filters = {}
+        for field in facets:
+            if field not in self.SEARCH_FACETS:
+                raise ValueError(f"Facette inconnue: {field}")
+            value = base.pop(field, None)
+            if value and value not in ("Toutes", "Tous"):
+                facet_filters[field] = value
+
+        # Sans terme ni filtre documents : comptages lus dans la table des facettes
+        # (False est un filtre : has_fiche_technique=False = produits sans fiche)
+        from_facettes = base.get('actif_only', True) and not any(
+            value is not None and value != ''
+            for field, value in base.items()
+            if field not in self.FACET_COLUMNS and field != 'actif_only')
+        if from_facettes:
+            conditions, params = [], []
+            for field, value in base.items():
+                if field in self.FACET_COLUMNS and value and value not in ("Toutes", "Tous"):
+                    conditions.append(f"{field} = ?")
+                    params.append(value)
+            from_where = "FROM facettes" + (" WHERE " + " AND ".join(conditions) if conditions else "")
+            nb, prefix = "nb", ""
+        else:
+            from_where, params, _ = self._build_search_filters(**base)
+            nb, prefix = "1 AS nb", "p."
+
+        def where(*conditions, exclude: str = None) -> str:
+            conditions = [f"{field} = ?" for field in facet_filters if field != exclude] + list(conditions)
+            params.extend(value for field, value in facet_filters.items() if field != exclude)
+            return " WHERE " + " AND ".join(conditions) if conditions else ""
+
+        # MATERIALIZED (SQLite >= 3.35) : l'ensemble filtre n'est calcule qu'une fois
+        materialized = "MATERIALIZED " if sqlite3.sqlite_version_info >= (3, 35, 0) else ""
+        columns = ''.join(f"{prefix}{field}, " for field in facets)
+        parts = [f"SELECT '' AS facette, NULL AS valeur, IFNULL(SUM(nb), 0) AS nb FROM filtre{where()}"]
+        for field in facets:
+            condition = f"{field} IS NOT NULL AND {field} != ''"
+            parts.append(f"SELECT '{field}', {field}, SUM(nb) FROM filtre"
+                         f"{where(condition, exclude=field)} GROUP BY {field}")
 
-        if has_devis_fournisseur is True:
-            query += " AND devis_fournisseur IS NOT NULL AND devis_fournisseur != ''"
-        elif has_devis_fournisseur is False:
-            query += " AND (devis_fournisseur IS NULL OR devis_fournisseur = '')"
+        cursor = self.conn.cursor()
+        cursor.execute(f"WITH filtre AS {materialized}(SELECT {columns}{nb} {from_where}) "
+                       + " UNION ALL ".join(parts), params)
 
-        if marque and marque not in ("Toutes", ""):
-            query += " AND marque = ?"
-            params.append(marque)
+        total = 0
+        facettes = {field: [] for field in facets}
+        for row in cursor.fetchall():
+            if row['facette']:
+                facettes[row['facette']].append((row['valeur'], row['nb']))
+            else:
+                total = row['nb']
+        for values in facettes.values():
+            values.sort(key=lambda item: (isinstance(item[0], str), item[0]))
 
-        if fournisseur and fournisseur not in ("Tous", ""):
-            query += " AND fournisseur = ?"
-            params.append(fournisseur)
+        if order_by is None:
+            produits = self.search_produits(limit=limit, **criteres)
+        else:
+            produits = self.search_produits_page(limit=limit, order_by=order_by,
+                                                 descending=descending, **criteres)
+        return {'produits': produits, 'total': total, 'facettes': facettes}
 
-        cursor.execute(query, params)
+    @cached_query
+    def count_search_results(self, terme: str = "", categorie: str = "", actif_only: bool = True,
+                             hauteur: int = None, largeur: int = None,
+                             sous_categorie: str = "", sous_categorie_2: str = "",
+                             sous_categorie_3: str = "",
+                             has_fiche_technique: bool = None,
+                             has_devis_fournisseur: bool = None,
+                             marque: str = "", fournisseur: str = "",
+                             fiche_valide: bool = None, liens_casses: bool = None) -> int:
+        """
+        Compte le nombre de produits correspondant aux criteres (sans les charger)
+
+        Returns:
+            Nombre total de produits correspondants
+        """
+        cursor = self.conn.cursor()
+        from_where, params, _ = self._build_search_filters(
+            terme, categorie, actif_only, hauteur, largeur,
+            sous_categorie, sous_categorie_2, sous_categorie_3,
+            has_fiche_technique, has_devis_fournisseur, marque, fournisseur,
+            fiche_valide, liens_casses)
+        cursor.execute(f"SELECT COUNT(*) as cnt {from_where}", params)
         return cursor.fetchone()['cnt']
 
     def get_sous_categories(self, categorie: str = None) -> List[str]:
         """Recupere les sous-categories distinctes"""
-        cursor = self.conn.cursor()
-        if categorie and categorie not in ("Toutes", ""):
-            cursor.execute("""SELECT DISTINCT sous_categorie FROM produits
-                             WHERE actif=1 AND sous_categorie IS NOT NULL AND sous_categorie != ''
-                             AND categorie=? ORDER BY sous_categorie""", (categorie,))
-        else:
-            cursor.execute("""SELECT DISTINCT sous_categorie FROM produits
-                             WHERE actif=1 AND sous_categorie IS NOT NULL AND sous_categorie != ''
-                             ORDER BY sous_categorie""")
-        return [row['sous_categorie'] for row in cursor.fetchall()]
+        return self.get_subcategories_filtered(1, categorie)
 
     def get_sous_categories_2(self, categorie: str = None, sous_categorie: str = None) -> List[str]:
         """Recupere les sous-categories 2 distinctes"""
-        cursor = self.conn.cursor()
-        query = """SELECT DISTINCT sous_categorie_2 FROM produits
-                   WHERE actif=1 AND sous_categorie_2 IS NOT NULL AND sous_categorie_2 != ''"""
-        params = []
-        if categorie and categorie not in ("Toutes", ""):
-            query += " AND categorie=?"
-            params.append(categorie)
-        if sous_categorie and sous_categorie not in ("Toutes", ""):
-            query += " AND sous_categorie=?"
-            params.append(sous_categorie)
-        query += " ORDER BY sous_categorie_2"
-        cursor.execute(query, params)
-        return [row['sous_categorie_2'] for row in cursor.fetchall()]
+        return self.get_subcategories_filtered(2, categorie, sous_categorie)
 
     def get_sous_categories_3(self, categorie: str = None, sous_categorie: str = None,
                               sous_categorie_2: str = None) -> List[str]:
         """Recupere les sous-categories 3 distinctes"""
-        cursor = self.conn.cursor()
-        query = """SELECT DISTINCT sous_categorie_3 FROM produits
-                   WHERE actif=1 AND sous_categorie_3 IS NOT NULL AND sous_categorie_3 != ''"""
-        params = []
-        if categorie and categorie not in ("Toutes", ""):
-            query += " AND categorie=?"
-            params.append(categorie)
-        if sous_categorie and sous_categorie not in ("Toutes", ""):
-            query += " AND sous_categorie=?"
-            params.append(sous_categorie)
-        if sous_categorie_2 and sous_categorie_2 not in ("Toutes", ""):
-            query += " AND sous_categorie_2=?"
-            params.append(sous_categorie_2)
-        query += " ORDER BY sous_categorie_3"
-        cursor.execute(query, params)
-        return [row['sous_categorie_3'] for row in cursor.fetchall()]
+        return self.get_subcategories_filtered(3, categorie, sous_categorie, sous_categorie_2)
 
     def get_hauteurs_distinctes(self, categorie: str = None) -> List[int]:
         """Recupere les hauteurs distinctes"""
-        cursor = self.conn.cursor()
-        if categorie and categorie not in ("Toutes", ""):
-            cursor.execute("SELECT DISTINCT hauteur FROM produits WHERE actif=1 AND hauteur IS NOT NULL AND categorie=? ORDER BY hauteur", (categorie,))
-        else:
-            cursor.execute("SELECT DISTINCT hauteur FROM produits WHERE actif=1 AND hauteur IS NOT NULL ORDER BY hauteur")
-        return [row['hauteur'] for row in cursor.fetchall()]
+        return [valeur for valeur, _ in self.get_facettes('hauteur', categorie=categorie)]
 
     def get_largeurs_distinctes(self, categorie: str = None, hauteur: int = None) -> List[int]:
         """Recupere les largeurs distinctes"""
-        cursor = self.conn.cursor()
-        query = "SELECT DISTINCT largeur FROM produits WHERE actif=1 AND largeur IS NOT NULL"
-        params = []
-
-        if categorie and categorie not in ("Toutes", ""):
-            query += " AND categorie=?"
-            params.append(categorie)
-
-        if hauteur:
-            query += " AND hauteur=?"
-            params.append(hauteur)
-
-        query += " ORDER BY largeur"
-        cursor.execute(query, params)
-        return [row['largeur'] for row in cursor.fetchall()]
+        return [valeur for valeur, _ in self.get_facettes('largeur', categorie=categorie,
+                                                            hauteur=hauteur or None)]
 
     def get_fournisseurs_distincts(self) -> List[str]:
         """Recupere les fournisseurs distincts"""
-        cursor = self.conn.cursor()
-        query = """SELECT DISTINCT fournisseur FROM produits
-                   WHERE actif=1 AND fournisseur IS NOT NULL AND fournisseur != ''
-                   ORDER BY fournisseur"""
-        cursor.execute(query)
-        return [row['fournisseur'] for row in cursor.fetchall()]
+        return [valeur for valeur, _ in self.get_facettes('fournisseur')]
 
     def get_marques_distinctes(self) -> List[str]:
         """Recupere les marques distinctes"""
-        cursor = self.conn.cursor()
-        query = """SELECT DISTINCT marque FROM produits
-                   WHERE actif=1 AND marque IS NOT NULL AND marque != ''
-                   ORDER BY marque"""
-        cursor.execute(query)
-        return [row['marque'] for row in cursor.fetchall()]
+        return [valeur for valeur, _ in self.get_facettes('marque')]
 
     def get_produit(self, id: int) -> Optional[Dict]:
         """Recupere un produit par son ID"""
@@ -880,6 +1659,7 @@ class Database:
 
         return os.path.normpath(os.path.join(*path_parts))
 
+    @serialized_write
     def copy_pdf_to_category_folder(self, source_path: str, pdf_type: str,
                                      categorie: str, sous_categorie: str = '',
                                      sous_categorie_2: str = '', sous_categorie_3: str = '') -> str:
@@ -904,6 +1684,9 @@ class Database:
         dest_folder = self.get_pdf_category_path(pdf_type, categorie, sous_categorie,
                                                   sous_categorie_2, sous_categorie_3)
 
+        if self.pdf_store_actif():
+            return self._link_pdf_from_store(source_path, dest_folder)
+
         # Creer le dossier si necessaire
         os.makedirs(dest_folder, exist_ok=True)
 
@@ -913,9 +1696,9 @@ class Database:
 
         # Gestion des doublons : ajouter un suffixe si le fichier existe
         if os.path.exists(dest_path):
-            # Verifier si c'est le meme fichier (meme taille)
-            if os.path.getsize(source_path) == os.path.getsize(dest_path):
-                # Meme fichier, retourner le chemin existant
+            # Meme contenu (et pas seulement meme taille) : retourner le chemin existant
+            if (os.path.getsize(source_path) == os.path.getsize(dest_path)
+                    and hash_file(source_path) == hash_file(dest_path)):
                 return self.make_fiche_path_relative(dest_path)
 
             # Fichier different, ajouter un suffixe
@@ -932,6 +1715,186 @@ class Database:
         # Retourner le chemin relatif
         return self.make_fiche_path_relative(dest_path)
 
+    def pdf_store_actif(self) -> bool:
+        """Indique si les PDF sont stockes par contenu (parametre stockage_pdf)"""
+        return self.get_parametre('stockage_pdf', '0') == '1'
+
+    def _link_pdf_from_store(self, source_path: str, dest_folder: str) -> str:
+        """
+        Ajoute un PDF au stockage par contenu et cree sa vue dans le dossier de categorie
+
+        Un fichier deja stocke n'est pas recopie : seule une vue (lien) est creee,
+        ou la vue existante est reutilisee.
+
+        Returns:
+            Chemin relatif de la vue (pour stockage en base)
+        """
+        store = BlobStore(self.data_dir)
+        digest, blob, taille = store.put(source_path)
+
+        cursor = self.conn.cursor()
+        cursor.execute('''
+            INSERT OR IGNORE INTO pdf_blobs (sha256, chemin, taille) VALUES (?, ?, ?)
+        ''', (digest, self.make_fiche_path_relative(blob), taille))
+        # Pas encore reference par un produit (refcount a 0) : la date d'ajout
+        # protege le fichier du ramasse-miettes jusqu'a l'enregistrement du produit
+        cursor.execute("UPDATE pdf_blobs SET date_ajout = CURRENT_TIMESTAMP WHERE sha256 = ?",
+                       (digest,))
+
+        # Nom de la vue : nom d'origine, suffixe si un autre contenu porte deja ce nom
+        filename = os.path.basename(source_path)
+        base, ext = os.path.splitext(filename)
+        view_path = os.path.join(dest_folder, filename)
+        counter = 1
+        while os.path.exists(view_path):
+            cursor.execute("SELECT sha256 FROM pdf_vues WHERE chemin = ?",
+                           (self.make_fiche_path_relative(view_path),))
+            row = cursor.fetchone()
+            if (row and row['sha256'] == digest) or store.is_same_file(view_path, blob):
+                break  # Vue existante du meme contenu
+            view_path = os.path.join(dest_folder, f"{base}_{counter}{ext}")
+            counter += 1
+        else:
+            store.link(blob, view_path)
+
+        relative = self.make_fiche_path_relative(view_path)
+        cursor.execute("INSERT OR REPLACE INTO pdf_vues (chemin, sha256) VALUES (?, ?)",
+                       (relative, digest))
+        self._commit()
+        return relative
+
+    # Delai avant suppression d'un PDF stocke non reference (fichier joint a un
+    # produit pas encore enregistre)
+    PDF_GC_DELAI_HEURES = 24
+
+    @serialized_write
+    def gc_pdf_blobs(self, delai_heures: int = PDF_GC_DELAI_HEURES) -> int:
+        """
+        Supprime les PDF stockes qui ne sont plus references par aucun produit
+
+        Les vues (liens des dossiers de categories) sont supprimees avec eux. Un
+        fichier ajoute ou rattache depuis moins de delai_heures est conserve.
+
+        Args:
+            delai_heures: Age minimal (date_ajout) d'un fichier supprime
+
+        Returns:
+            Nombre de fichiers stockes supprimes
+        """
+        cursor = self.conn.cursor()
+        cursor.execute("SELECT sha256, chemin FROM pdf_blobs "
+                       "WHERE refcount <= 0 AND date_ajout <= datetime('now', ?)",
+                       (f'-{delai_heures} hours',))
+        orphelins = cursor.fetchall()
+
+        for blob in orphelins:
+            cursor.execute("SELECT chemin FROM pdf_vues WHERE sha256 = ?", (blob['sha256'],))
+            chemins = [row['chemin'] for row in cursor.fetchall()] + [blob['chemin']]
+            for chemin in chemins:
+                try:
+                    os.remove(self.resolve_fiche_path(chemin))
+                except FileNotFoundError:
+                    pass
+                except OSError as e:
+                    print(f"Erreur suppression {chemin}: {e}")
+            cursor.execute("DELETE FROM pdf_vues WHERE sha256 = ?", (blob['sha256'],))
+            cursor.execute("DELETE FROM pdf_blobs WHERE sha256 = ?", (blob['sha256'],))
+
+        self._commit()
+        return len(orphelins)
+
+    def _move_pdf_views(self, old_folder: str, new_folder: str):
+        """Reporte dans pdf_vues le deplacement des vues d'un dossier de categorie"""
+        old_prefix = self.make_fiche_path_relative(old_folder) + os.sep
+        new_prefix = self.make_fiche_path_relative(new_folder) + os.sep
+        cursor = self.conn.cursor()
+        cursor.execute("SELECT chemin FROM pdf_vues WHERE substr(chemin, 1, ?) = ?",
+                       (len(old_prefix), old_prefix))
+        moved = []
+        for row in cursor.fetchall():
+            new_path = new_prefix + row['chemin'][len(old_prefix):]
+            # Seules les vues effectivement deplacees (fusion : doublons laisses en place)
+            if os.path.exists(self.resolve_fiche_path(new_path)) and \
+                    not os.path.exists(self.resolve_fiche_path(row['chemin'])):
+                moved.append((new_path, row['chemin']))
+        cursor.executemany("UPDATE OR REPLACE pdf_vues SET chemin = ? WHERE chemin = ?", moved)
+        self._commit()
+
+    def _move_category_folder(self, old_path: str, new_path: str, moved: List[tuple] = None) -> bool:
+        """
+        Deplace un dossier de categorie (fusion si la destination existe)
+
+        Peut etre relancee apres une interruption : les elements deja deplaces
+        sont ignores.
+
+        Args:
+            old_path: Dossier source
+            new_path: Dossier de destination
+            moved: Liste completee des couples (source, destination) deplaces,
+                   dans l'ordre (voir _undo_category_moves)
+
+        Returns:
+            True si le dossier source existait
+        """
+        if moved is None:
+            moved = []
+        if not os.path.isdir(old_path):
+            return False
+
+        if os.path.exists(new_path):
+            # Fusionner les dossiers
+            for item in os.listdir(old_path):
+                src_item = os.path.join(old_path, item)
+                dst_item = os.path.join(new_path, item)
+                if os.path.isdir(src_item):
+                    if os.path.exists(dst_item):
+                        # Fusionner recursivement
+                        for sub_item in os.listdir(src_item):
+                            shutil.move(os.path.join(src_item, sub_item),
+                                        os.path.join(dst_item, sub_item))
+                            moved.append((os.path.join(src_item, sub_item), os.path.join(dst_item, sub_item)))
+                        os.rmdir(src_item)
+                    else:
+                        shutil.move(src_item, dst_item)
+                        moved.append((src_item, dst_item))
+                else:
+                    if not os.path.exists(dst_item):
+                        shutil.move(src_item, dst_item)
+                        moved.append((src_item, dst_item))
+            # Supprimer l'ancien dossier s'il est vide
+            if not os.listdir(old_path):
+                os.rmdir(old_path)
+        else:
+            os.makedirs(os.path.dirname(new_path), exist_ok=True)
+            os.rename(old_path, new_path)
+            moved.append((old_path, new_path))
+        return True
+
+    def _undo_category_moves(self, moved: List[tuple]) -> bool:
+        """
+        Remet en place les elements deplaces par _move_category_folder (ordre inverse)
+
+        Returns:
+            True si tout a ete remis en place
+        """
+        try:
+            for src, dst in reversed(moved):
+                os.makedirs(os.path.dirname(src), exist_ok=True)
+                shutil.move(dst, src)
+        except OSError as e:
+            print(f"Erreur lors de l'annulation du deplacement {dst}: {e}")
+            return False
+        return True
+
+    def _category_folders(self, old_name: str, new_name: str) -> List[tuple]:
+        """Couples (ancien dossier, nouveau dossier) de Fiches_techniques et Devis_fournisseur"""
+        old_sanitized = self.sanitize_folder_name(old_name)
+        new_sanitized = self.sanitize_folder_name(new_name)
+        return [(os.path.join(self.data_dir, pdf_type, old_sanitized),
+                 os.path.join(self.data_dir, pdf_type, new_sanitized))
+                for pdf_type in ['Fiches_techniques', 'Devis_fournisseur']]
+
+    @serialized_write
     def rename_category_folders(self, old_name: str, new_name: str) -> int:
         """
         Renomme les dossiers de categorie dans Fiches_techniques et Devis_fournisseur
@@ -946,46 +1909,45 @@ class Database:
         if old_name == new_name:
             return 0
 
-        old_sanitized = self.sanitize_folder_name(old_name)
-        new_sanitized = self.sanitize_folder_name(new_name)
-
         renamed_count = 0
 
-        for pdf_type in ['Fiches_techniques', 'Devis_fournisseur']:
-            old_path = os.path.join(self.data_dir, pdf_type, old_sanitized)
-            new_path = os.path.join(self.data_dir, pdf_type, new_sanitized)
-
-            if os.path.exists(old_path) and os.path.isdir(old_path):
-                try:
-                    # Verifier que la destination n'existe pas
-                    if os.path.exists(new_path):
-                        # Fusionner les dossiers
-                        for item in os.listdir(old_path):
-                            src_item = os.path.join(old_path, item)
-                            dst_item = os.path.join(new_path, item)
-                            if os.path.isdir(src_item):
-                                if os.path.exists(dst_item):
-                                    # Fusionner recursivement
-                                    for sub_item in os.listdir(src_item):
-                                        shutil.move(os.path.join(src_item, sub_item),
-                                                   os.path.join(dst_item, sub_item))
-                                    os.rmdir(src_item)
-                                else:
-                                    shutil.move(src_item, dst_item)
-                            else:
-                                if not os.path.exists(dst_item):
-                                    shutil.move(src_item, dst_item)
-                        # Supprimer l'ancien dossier s'il est vide
-                        if not os.listdir(old_path):
-                            os.rmdir(old_path)
-                    else:
-                        os.rename(old_path, new_path)
+        for old_path, new_path in self._category_folders(old_name, new_name):
+            try:
+                if self._move_category_folder(old_path, new_path):
+                    # Vues du stockage par contenu : a faire avant la mise a jour
+                    # des chemins produits (update_pdf_paths_for_category)
+                    self._move_pdf_views(old_path, new_path)
                     renamed_count += 1
-                except Exception as e:
-                    print(f"Erreur lors du renommage du dossier {old_path}: {e}")
+            except Exception as e:
+                print(f"Erreur lors du renommage du dossier {old_path}: {e}")
 
         return renamed_count
 
+    def _rewrite_path_prefix(self, cursor, old_folder: str, new_folder: str):
+        """
+        Remplace le prefixe de dossier des chemins PDF en base (requetes ensemblistes)
+
+        Produits et index des fichiers. Les chemins relatifs sont compares avec
+        les deux separateurs (base partagee entre postes Windows et Linux).
+        """
+        old_rel = self.make_fiche_path_relative(old_folder)
+        new_rel = self.make_fiche_path_relative(new_folder)
+        prefixes = {(old_rel.replace('\\', '/') + '/', new_rel.replace('\\', '/') + '/'),
+                    (old_rel.replace('/', '\\') + '\\', new_rel.replace('/', '\\') + '\\')}
+
+        for old_prefix, new_prefix in prefixes:
+            params = (new_prefix, len(old_prefix) + 1, len(old_prefix), old_prefix)
+            for field in ['fiche_technique', 'devis_fournisseur']:
+                cursor.execute(f'''
+                    UPDATE produits SET {field} = ? || substr({field}, ?)
+                    WHERE substr({field}, 1, ?) = ?
+                ''', params)
+            cursor.execute('''
+                UPDATE OR REPLACE fichiers_meta SET chemin = ? || substr(chemin, ?)
+                WHERE substr(chemin, 1, ?) = ?
+            ''', params)
+
+    @serialized_write
     def update_pdf_paths_for_category(self, old_category: str, new_category: str):
         """
         Met a jour les chemins PDF en base de donnees apres renommage d'une categorie
@@ -997,48 +1959,165 @@ class Database:
         if old_category == new_category:
             return
 
-        old_sanitized = self.sanitize_folder_name(old_category)
-        new_sanitized = self.sanitize_folder_name(new_category)
+        cursor = self.conn.cursor()
+        for old_folder, new_folder in self._category_folders(old_category, new_category):
+            self._rewrite_path_prefix(cursor, old_folder, new_folder)
+        self._commit()
 
+    @serialized_write
+    def rename_category(self, old_nom: str, new_nom: str, description: str = None) -> int:
+        """
+        Renomme une categorie : dossiers PDF, categorie, produits et chemins
+
+        Les deplacements de dossiers sont journalises (journal_renommages) avant
+        d'etre executes ; la base est ensuite mise a jour en une seule transaction
+        qui efface le journal. Apres un arret brutal, recover_category_renames()
+        termine le renommage si un dossier a commence a etre deplace, sinon
+        l'abandonne.
+
+        Args:
+            old_nom: Ancien nom de la categorie
+            new_nom: Nouveau nom de la categorie
+            description: Nouvelle description (optionnel)
+
+        Returns:
+            Nombre de dossiers renommes
+        """
+        if old_nom == new_nom:
+            self.update_categorie(old_nom, new_nom, description)
+            return 0
+
+        cursor = self.conn.cursor()
+        moves = []
+        for old_path, new_path in self._category_folders(old_nom, new_nom):
+            cursor.execute('''
+                INSERT INTO journal_renommages (ancien_nom, nouveau_nom, description, source, destination, poste)
+                VALUES (?, ?, ?, ?, ?, ?)
+            ''', (old_nom, new_nom, description, self.make_fiche_path_relative(old_path),
+                  self.make_fiche_path_relative(new_path), socket.gethostname()))
+            moves.append((cursor.lastrowid, old_path, new_path))
+        self._commit()  # Journal ecrit avant tout deplacement
+
+        return self._apply_category_rename(old_nom, new_nom, description, moves)
+
+    def _apply_category_rename(self, old_nom: str, new_nom: str, description: Optional[str],
+                               moves: List[tuple], undo_on_error: bool = True) -> int:
+        """
+        Deplace les dossiers journalises puis met a jour la base en une transaction
+
+        En cas d'erreur, les deplacements deja faits sont annules et le journal
+        efface : le renommage echoue sans rien changer, et n'est pas repris au
+        demarrage suivant. Si l'annulation echoue elle-meme, le journal est
+        conserve et recover_category_renames terminera le renommage.
+
+        Args:
+            undo_on_error: False pour une reprise (recover_category_renames) : le
+                           journal est conserve pour une nouvelle tentative
+        """
+        cursor = self.conn.cursor()
+        renamed_count = 0
+        moved = []
+        try:
+            for journal_id, old_path, new_path in moves:
+                cursor.execute("UPDATE journal_renommages SET etat = 'en_cours' WHERE id = ?", (journal_id,))
+                self._commit()
+                if self._move_category_folder(old_path, new_path, moved):
+                    renamed_count += 1
+                cursor.execute("UPDATE journal_renommages SET etat = 'deplace' WHERE id = ?", (journal_id,))
+                self._commit()
+
+            with self.batch():
+                for _, old_path, new_path in moves:
+                    # Vues d'abord : le comptage des references suit les chemins produits
+                    self._move_pdf_views(old_path, new_path)
+                    self._rewrite_path_prefix(cursor, old_path, new_path)
+                self.update_categorie(old_nom, new_nom, description)
+                cursor.executemany("DELETE FROM journal_renommages WHERE id = ?",
+                                   [(journal_id,) for journal_id, _, _ in moves])
+        except Exception:
+            if undo_on_error and self._undo_category_moves(moved):
+                cursor.executemany("DELETE FROM journal_renommages WHERE id = ?",
+                                   [(journal_id,) for journal_id, _, _ in moves])
+                self._commit()
+            raise
+        return renamed_count
+
+    @serialized_write
+    def recover_category_renames(self) -> int:
+        """
+        Reprend les renommages de categorie interrompus sur ce poste
+
+        Si un dossier a commence a etre deplace, le renommage est termine
+        (deplacements restants et mise a jour de la base) ; sinon il est abandonne.
+
+        Returns:
+            Nombre de renommages termines
+        """
         cursor = self.conn.cursor()
-
-        # Recuperer tous les produits de cette categorie avec des chemins PDF
         cursor.execute('''
-            SELECT id, fiche_technique, devis_fournisseur
-            FROM produits
-            WHERE categorie = ? AND (fiche_technique != '' OR devis_fournisseur != '')
-        ''', (new_category,))
-
+            SELECT * FROM journal_renommages WHERE poste = ? ORDER BY id
+        ''', (socket.gethostname(),))
+        renames: Dict[tuple, List] = {}
         for row in cursor.fetchall():
-            updates = {}
+            renames.setdefault((row['ancien_nom'], row['nouveau_nom'], row['description']), []).append(row)
+
+        recovered = 0
+        for (old_nom, new_nom, description), rows in renames.items():
+            if all(row['etat'] == 'prevu' for row in rows):
+                cursor.executemany("DELETE FROM journal_renommages WHERE id = ?",
+                                   [(row['id'],) for row in rows])
+                self._commit()
+                continue
+            moves = [(row['id'], self.resolve_fiche_path(row['source']),
+                      self.resolve_fiche_path(row['destination'])) for row in rows]
+            try:
+                self._apply_category_rename(old_nom, new_nom, description, moves, undo_on_error=False)
+                recovered += 1
+            except Exception as e:
+                print(f"Erreur reprise du renommage {old_nom} -> {new_nom}: {e}")
+        return recovered
 
-            for field in ['fiche_technique', 'devis_fournisseur']:
-                path = row[field]
-                if path and old_sanitized in path:
-                    new_path = path.replace(f"/{old_sanitized}/", f"/{new_sanitized}/")
-                    new_path = new_path.replace(f"\\{old_sanitized}\\", f"\\{new_sanitized}\\")
-                    updates[field] = new_path
+    def get_fichier_meta(self, chemin: str) -> Optional[Dict]:
+        """
+        Recupere l'etat indexe d'un fichier (sans acces disque)
 
-            if updates:
-                set_clause = ', '.join([f"{k}=?" for k in updates.keys()])
-                values = list(updates.values()) + [row['id']]
-                cursor.execute(f"UPDATE produits SET {set_clause} WHERE id=?", values)
+        Args:
+            chemin: Chemin du fichier (relatif au dossier data ou absolu)
 
-        self.conn.commit()
+        Returns:
+            Dictionnaire (existe, taille, mtime, sha256, date_scan) ou None si non indexe
+        """
+        cursor = self.conn.cursor()
+        cursor.execute("SELECT * FROM fichiers_meta WHERE chemin = ?",
+                       (self.make_fiche_path_relative(chemin),))
+        row = cursor.fetchone()
+        return dict(row) if row else None
+
+    @serialized_write
+    def save_fichiers_meta(self, updates: List[tuple], obsolete: List[str]):
+        """
+        Enregistre le resultat d'un passage du scanner de fichiers (file_scanner)
+
+        Args:
+            updates: Tuples (chemin, existe, taille, mtime, sha256) ajoutes ou modifies
+            obsolete: Chemins qui ne sont plus references par aucun produit
+        """
+        cursor = self.conn.cursor()
+        cursor.executemany('''
+            INSERT INTO fichiers_meta (chemin, existe, taille, mtime, sha256, date_scan)
+            VALUES (?, ?, ?, ?, ?, CURRENT_TIMESTAMP)
+            ON CONFLICT(chemin) DO UPDATE SET
+                existe = excluded.existe, taille = excluded.taille, mtime = excluded.mtime,
+                sha256 = excluded.sha256, date_scan = excluded.date_scan
+        ''', updates)
+        cursor.executemany("DELETE FROM fichiers_meta WHERE chemin = ?", [(chemin,) for chemin in obsolete])
+        self._commit()
 
     def make_fiche_path_relative(self, path: str) -> str:
         """Convertit un chemin absolu en chemin relatif au dossier data"""
-        if not path:
-            return ''
-        # Normaliser les chemins pour comparaison
-        abs_data_dir = os.path.normpath(os.path.abspath(self.data_dir))
-        abs_path = os.path.normpath(os.path.abspath(path))
-        # Si le chemin est dans le dossier data, le rendre relatif
-        if abs_path.startswith(abs_data_dir):
-            return os.path.relpath(abs_path, abs_data_dir)
-        # Sinon garder le chemin tel quel
-        return path
+        return make_path_relative(path, self.data_dir)
 
+    @serialized_write
     def add_produit(self, data: Dict) -> int:
         """
         Ajoute un produit
@@ -1077,7 +2156,7 @@ class Database:
             fiche_tech,
             devis_fournisseur
         ))
-        self.conn.commit()
+        self._commit()
 
         # Ajouter la categorie si elle n'existe pas
         if data.get('categorie'):
@@ -1085,6 +2164,7 @@ class Database:
 
         return cursor.lastrowid
 
+    @serialized_write
     def update_produit(self, id: int, data: Dict):
         """Met a jour un produit"""
         cursor = self.conn.cursor()
@@ -1126,8 +2206,9 @@ class Database:
             devis_fournisseur,
             id
         ))
-        self.conn.commit()
+        self._commit()
 
+    @serialized_write
     def delete_produit(self, id: int, permanent: bool = False):
         """
         Supprime un produit
@@ -1141,7 +2222,7 @@ class Database:
             cursor.execute("DELETE FROM produits WHERE id=?", (id,))
         else:
             cursor.execute("UPDATE produits SET actif=0, date_modification=CURRENT_TIMESTAMP WHERE id=?", (id,))
-        self.conn.commit()
+        self._commit()
 
     def count_produits(self, categorie: str = None) -> int:
         """Compte les produits"""
@@ -1162,6 +2243,7 @@ class Database:
         """
         self.clear_all_data(clear_categories=clear_categories, clear_chantiers=False)
 
+    @serialized_write
     def clear_all_data(self, clear_categories: bool = False, clear_chantiers: bool = True):
         """
         Supprime TOUTES les donnees de la base (produits, chantiers, etc.)
@@ -1196,7 +2278,7 @@ class Database:
         for table in tables_to_reset:
             cursor.execute("DELETE FROM sqlite_sequence WHERE name = ?", (table,))
 
-        self.conn.commit()
+        self._commit()
 
     # ==================== IMPORT / EXPORT ====================
 
@@ -1225,202 +2307,232 @@ class Database:
             for example in examples:
                 writer.writerow(example)
 
-    def import_csv(self, filepath: str, mapping: Dict = None, progress_callback=None) -> int:
+    @serialized_write
+    def import_csv(self, filepath: str, mapping: Dict = None, progress_callback=None,
+                   workers: int = None) -> int:
         """
         Importe des produits depuis un fichier CSV (version optimisee pour gros volumes)
 
+        Lecture en une seule passe, conversion des lignes en parallele pour les gros
+        fichiers, insertion par executemany dans une transaction unique.
+
         Args:
             filepath: Chemin du fichier CSV
             mapping: Mapping des colonnes (optionnel)
-            progress_callback: Fonction callback(current, total) pour la progression (optionnel)
+            progress_callback: Fonction callback(current, total) pour la progression (optionnel),
+                               total est estime a partir de la position dans le fichier
+            workers: Nombre de processus de conversion (None = automatique, 0 = aucun)
 
         Returns:
             Nombre de produits importes
         """
         if mapping is None:
-            mapping = {
-                'CATEGORIE': 'categorie',
-                'SOUS-CATEGORIE': 'sous_categorie',
-                'SOUS-CATEGORIE 2': 'sous_categorie_2',
-                'SOUS-CATEGORIE 3': 'sous_categorie_3',
-                'DESIGNATION': 'designation',
-                'DESCRIPTION': 'description',
-                'DIMENSIONS': 'dimensions',
-                'HAUTEUR': 'hauteur',
-                'LARGEUR': 'largeur',
-                'PRIX_UNITAIRE_HT': 'prix_achat',
-                'ARTICLE': 'reference',
-                'FOURNISSEUR': 'fournisseur',
-                'MARQUE': 'marque',
-                'CHANTIER': 'chantier',
-                'FICHE_TECHNIQUE': 'fiche_technique',
-                'FICHIER_PDF': 'devis_fournisseur'
-            }
+            mapping = DEFAULT_MAPPING
 
-        count = 0
-        categories_to_add = set()  # Collecter les categories pour ajout en batch
-        batch_size = 1000  # Nombre de lignes par batch (optimise)
-        callback_frequency = 500  # Frequence d'appel du callback (moins = plus rapide)
+        cursor = self.conn.cursor()
 
-        # Detecter l'encodage : utf-8-sig (avec BOM), utf-8, ou cp1252
-        encoding = 'utf-8-sig'
-        try:
-            with open(filepath, 'r', encoding='utf-8-sig') as test_f:
-                test_f.read(2048)
-        except UnicodeDecodeError:
-            encoding = 'cp1252'
+        def write_chunk(records):
+            cursor.executemany('''
+                INSERT INTO produits (categorie, sous_categorie, sous_categorie_2, sous_categorie_3,
+                                     designation, description, dimensions, hauteur, largeur, prix_achat,
+                                     reference, fournisseur, marque, chantier, notes,
+                                     fiche_technique, devis_fournisseur)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ''', records)
+
+        # Transaction unique : les produits, l'index plein texte et les categories
+        # sont valides ensemble (import annule ou en erreur : rien n'est conserve)
+        with self.batch():
+            # Triggers d'insertion suspendus : l'index plein texte et les references
+            # PDF sont alimentes en une requete chacun apres l'insertion
+            cursor.execute("SELECT IFNULL(MAX(id), 0) FROM produits")
+            last_id = cursor.fetchone()[0]
+            cursor.execute("DROP TRIGGER IF EXISTS produits_pdf_insert")
+            cursor.execute("DROP TRIGGER IF EXISTS produits_facettes_insert")
+            if self.has_fts:
+                cursor.execute("DROP TRIGGER IF EXISTS produits_fts_insert")
+
+            count, categories_to_add = run_import(filepath, write_chunk, mapping=mapping,
+                                                  data_dir=self.data_dir,
+                                                  progress_callback=progress_callback,
+                                                  workers=workers)
+
+            # Ajouter toutes les categories en une fois
+            cursor.executemany('''
+                INSERT OR IGNORE INTO categories (nom, description, couleur)
+                VALUES (?, ?, ?)
+            ''', [(cat, None, '#1F4E79') for cat in categories_to_add])
 
-        with open(filepath, 'r', encoding=encoding) as f:
-            # Detecter le delimiteur
-            sample = f.read(1024)
-            f.seek(0)
-            delimiter = ';' if ';' in sample else ','
+            if self.has_fts:
+                cursor.execute('''
+                    INSERT INTO produits_fts(rowid, designation, dimensions, reference, sous_categorie, marque)
+                    SELECT id, designation, dimensions, reference, sous_categorie, marque
+                    FROM produits WHERE id > ?
+                ''', (last_id,))
+                self._create_fts_index(cursor)  # Recree le trigger d'insertion
 
-            # Compter le nombre total de lignes pour la progression
-            total_lines = sum(1 for _ in f) - 1
-            f.seek(0)
+            cursor.execute('''
+                UPDATE produits SET
+                    fiche_sha256 = (SELECT sha256 FROM pdf_vues WHERE chemin = produits.fiche_technique),
+                    devis_sha256 = (SELECT sha256 FROM pdf_vues WHERE chemin = produits.devis_fournisseur)
+                WHERE id > ? AND EXISTS (SELECT 1 FROM pdf_vues
+                                         WHERE chemin IN (produits.fiche_technique, produits.devis_fournisseur))
+            ''', (last_id,))
+            self._create_pdf_store(cursor)  # Recree le trigger d'insertion
 
-            cursor = self.conn.cursor()
+            self.rebuild_facettes(cursor)
+            self._create_facettes(cursor)
 
-            # Optimisations SQLite pour import massif
-            cursor.execute("PRAGMA synchronous = OFF")
-            cursor.execute("PRAGMA journal_mode = MEMORY")
-            cursor.execute("PRAGMA cache_size = 10000")
+        return count
 
-            try:
-                reader = csv.DictReader(f, delimiter=delimiter)
-                current_line = 0
-                batch_data = []
-
-                for row in reader:
-                    current_line += 1
-                    data = {}
-                    for csv_col, db_col in mapping.items():
-                        if csv_col in row:
-                            value = row[csv_col]
-                            if db_col == 'prix_achat':
-                                try:
-                                    value = float(value.replace(',', '.')) if value and value not in ['divers', '-', ''] else 0
-                                except:
-                                    value = 0
-                            elif db_col in ('hauteur', 'largeur'):
-                                try:
-                                    value = int(value) if value and value.strip().isdigit() else None
-                                except:
-                                    value = None
-                            data[db_col] = value
-
-                    # Parser dimensions si hauteur/largeur non definis
-                    if not data.get('hauteur') and not data.get('largeur') and data.get('dimensions'):
-                        h, l = self._parse_dimensions(data['dimensions'])
-                        if h:
-                            data['hauteur'] = h
-                        if l:
-                            data['largeur'] = l
-
-                    if data.get('designation'):
-                        # Preparer les donnees pour insertion batch
-                        fiche_tech = self.make_fiche_path_relative(data.get('fiche_technique', ''))
-                        devis_fournisseur = self.make_fiche_path_relative(data.get('devis_fournisseur', ''))
-
-                        batch_data.append((
-                            data.get('categorie', ''),
-                            data.get('sous_categorie', ''),
-                            data.get('sous_categorie_2', ''),
-                            data.get('sous_categorie_3', ''),
-                            data.get('designation', ''),
-                            data.get('description', ''),
-                            data.get('dimensions', ''),
-                            data.get('hauteur'),
-                            data.get('largeur'),
-                            data.get('prix_achat', 0),
-                            data.get('reference', ''),
-                            data.get('fournisseur', ''),
-                            data.get('marque', ''),
-                            data.get('chantier', ''),
-                            data.get('notes', ''),
-                            fiche_tech,
-                            devis_fournisseur
-                        ))
-
-                        # Collecter la categorie
-                        if data.get('categorie'):
-                            categories_to_add.add(data['categorie'])
-
-                        count += 1
-
-                    # Inserer par batch pour optimiser
-                    if len(batch_data) >= batch_size:
-                        cursor.executemany('''
-                            INSERT INTO produits (categorie, sous_categorie, sous_categorie_2, sous_categorie_3,
-                                                 designation, description, dimensions, hauteur, largeur, prix_achat,
-                                                 reference, fournisseur, marque, chantier, notes,
-                                                 fiche_technique, devis_fournisseur)
-                            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-                        ''', batch_data)
-                        batch_data = []
-
-                    # Appeler le callback de progression (moins frequemment)
-                    if progress_callback and current_line % callback_frequency == 0:
-                        progress_callback(current_line, total_lines)
-
-                # Inserer les donnees restantes
-                if batch_data:
-                    cursor.executemany('''
-                        INSERT INTO produits (categorie, sous_categorie, sous_categorie_2, sous_categorie_3,
-                                             designation, description, dimensions, hauteur, largeur, prix_achat,
-                                             reference, fournisseur, marque, chantier, notes,
-                                             fiche_technique, devis_fournisseur)
-                        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-                    ''', batch_data)
+    @serialized_write
+    def import_csv_incremental(self, filepath: str, mapping: Dict = None, progress_callback=None,
+                               deactivate_missing: bool = False, workers: int = None) -> Dict:
+        """
+        Met a jour le catalogue a partir d'un tarif fournisseur (import incremental)
 
-                # Ajouter toutes les categories en une fois
-                for cat in categories_to_add:
-                    cursor.execute('''
-                        INSERT OR IGNORE INTO categories (nom, description, couleur)
-                        VALUES (?, ?, ?)
-                    ''', (cat, None, '#1F4E79'))
+        Les lignes sont rapprochees des produits existants par (reference, fournisseur) :
+        seuls les nouveaux produits sont crees et seuls les produits modifies sont mis
+        a jour (historique des prix ecrit en une requete). Les liens article_produits
+        et l'historique existant sont conserves. Le tarif est d'abord charge dans une
+        table temporaire, puis applique par quelques requetes ensemblistes.
 
-                # Commit final unique
-                self.conn.commit()
+        Args:
+            filepath: Chemin du fichier CSV (la colonne ARTICLE est obligatoire)
+            mapping: Mapping des colonnes (optionnel)
+            progress_callback: Fonction callback(current, total) pour la progression (optionnel)
+            deactivate_missing: Desactive les produits des fournisseurs du fichier qui n'y
+                                figurent plus
+            workers: Nombre de processus de conversion (None = automatique, 0 = aucun)
 
-                # Callback final
-                if progress_callback:
-                    progress_callback(total_lines, total_lines)
+        Returns:
+            Dict avec crees, modifies, inchanges, desactives, ignores (lignes sans reference)
+        """
+        if mapping is None:
+            mapping = DEFAULT_MAPPING
+
+        present = mapped_columns(filepath, mapping)
+        if 'reference' not in present:
+            raise ValueError("La colonne reference (ARTICLE) est requise pour la mise a jour du tarif")
+
+        if 'dimensions' in present:
+            present |= {'hauteur', 'largeur'}  # Deduites des dimensions a la conversion
+        # Seules les colonnes presentes dans le fichier sont comparees et mises a jour
+        compared = [col for col in PRODUIT_COLUMNS
+                    if col in present and col not in ('reference', 'fournisseur')]
+        all_columns = ', '.join(PRODUIT_COLUMNS)
+        placeholders = ', '.join('?' * len(PRODUIT_COLUMNS))
+        index_reference = PRODUIT_COLUMNS.index('reference')
+        index_fournisseur = PRODUIT_COLUMNS.index('fournisseur')
 
-            finally:
-                # Restaurer les parametres SQLite normaux
-                cursor.execute("PRAGMA synchronous = NORMAL")
-                cursor.execute("PRAGMA journal_mode = DELETE")
+        cursor = self.conn.cursor()
+        cursor.execute("DROP TABLE IF EXISTS temp.import_tarif")
+        cursor.execute(f'''
+            CREATE TEMP TABLE import_tarif (
+                {', '.join(PRODUIT_COLUMNS)},
+                produit_id INTEGER,
+                etat TEXT,
+                UNIQUE (reference, fournisseur)
+            )
+        ''')
 
-        return count
+        stats = {'crees': 0, 'modifies': 0, 'inchanges': 0, 'desactives': 0, 'ignores': 0}
+
+        def write_chunk(records):
+            rows = []
+            for record in records:
+                if not record[index_reference]:
+                    stats['ignores'] += 1
+                    continue
+                if record[index_fournisseur] is None:
+                    record = record[:index_fournisseur] + ('',) + record[index_fournisseur + 1:]
+                rows.append(record)
+            # La derniere ligne d'une meme cle l'emporte
+            cursor.executemany(f"INSERT OR REPLACE INTO import_tarif ({all_columns}) VALUES ({placeholders})",
+                               rows)
 
-    def _parse_dimensions(self, dim_str: str) -> tuple:
-        """Parse une chaine de dimensions pour extraire hauteur et largeur"""
-        import re
-        if not dim_str:
-            return None, None
-
-        # Patterns courants: "2040x830", "2040 x 830", "H2040 L830", etc.
-        patterns = [
-            r'(\d+)\s*[xX×]\s*(\d+)',  # 2040x830, 2040 x 830
-            r'[hH][\s:]*(\d+).*[lL][\s:]*(\d+)',  # H2040 L830, H:2040 L:830
-            r'(\d{3,4})\D+(\d{2,4})',  # 2040/830, 2040-830
-        ]
+        try:
+            with self.batch():
+                _, categories_to_add = run_import(filepath, write_chunk, mapping=mapping,
+                                                  data_dir=self.data_dir,
+                                                  progress_callback=progress_callback,
+                                                  workers=workers)
 
-        for pattern in patterns:
-            match = re.search(pattern, dim_str)
-            if match:
-                try:
-                    h = int(match.group(1))
-                    l = int(match.group(2))
-                    # Verifier que les valeurs sont coherentes (hauteur > largeur generalement)
-                    if h > 0 and l > 0:
-                        return (h, l) if h > l else (l, h)
-                except:
-                    pass
+                # Rapprochement : le produit le plus ancien de meme cle
+                cursor.execute('''
+                    UPDATE import_tarif SET produit_id = (
+                        SELECT MIN(p.id) FROM produits p
+                        WHERE p.reference = import_tarif.reference
+                          AND IFNULL(p.fournisseur, '') = import_tarif.fournisseur
+                    )
+                ''')
+                cursor.execute("CREATE INDEX temp.idx_import_tarif_produit ON import_tarif(produit_id)")
+
+                # Diff avec la ligne stockee (un produit desactive qui revient est reactive)
+                differences = ' OR '.join([f"p.{col} IS NOT import_tarif.{col}" for col in compared] + ['p.actif = 0'])
+                cursor.execute(f'''
+                    UPDATE import_tarif SET etat = CASE
+                        WHEN produit_id IS NULL THEN 'nouveau'
+                        WHEN EXISTS (SELECT 1 FROM produits p WHERE p.id = import_tarif.produit_id
+                                     AND ({differences})) THEN 'modifie'
+                        ELSE 'inchange'
+                    END
+                ''')
+                cursor.execute("SELECT etat, COUNT(*) FROM import_tarif GROUP BY etat")
+                etats = {row[0]: row[1] for row in cursor.fetchall()}
+                stats['crees'] = etats.get('nouveau', 0)
+                stats['modifies'] = etats.get('modifie', 0)
+                stats['inchanges'] = etats.get('inchange', 0)
+
+                # Historique des prix en une seule requete
+                if 'prix_achat' in compared:
+                    cursor.execute('''
+                        INSERT INTO historique_prix (produit_id, ancien_prix, nouveau_prix)
+                        SELECT p.id, p.prix_achat, t.prix_achat
+                        FROM import_tarif t JOIN produits p ON p.id = t.produit_id
+                        WHERE t.etat = 'modifie' AND p.prix_achat IS NOT t.prix_achat
+                    ''')
+
+                # Mise a jour des seuls produits modifies
+                if stats['modifies']:
+                    assignments = ', '.join(compared + ['actif', 'date_modification'])
+                    selected = ', '.join([f"t.{col}" for col in compared] + ['1', 'CURRENT_TIMESTAMP'])
+                    cursor.execute(f'''
+                        UPDATE produits SET ({assignments}) = (
+                            SELECT {selected} FROM import_tarif t WHERE t.produit_id = produits.id
+                        )
+                        WHERE id IN (SELECT produit_id FROM import_tarif WHERE etat = 'modifie')
+                    ''')
+
+                # Produits des fournisseurs du fichier qui n'y figurent plus
+                if deactivate_missing:
+                    cursor.execute('''
+                        UPDATE produits SET actif = 0, date_modification = CURRENT_TIMESTAMP
+                        WHERE actif = 1 AND IFNULL(reference, '') <> ''
+                          AND IFNULL(fournisseur, '') IN (SELECT DISTINCT fournisseur FROM import_tarif)
+                          AND id NOT IN (SELECT produit_id FROM import_tarif WHERE produit_id IS NOT NULL)
+                    ''')
+                    stats['desactives'] = cursor.rowcount
+
+                # Creation des nouveaux produits
+                cursor.execute(f'''
+                    INSERT INTO produits ({all_columns})
+                    SELECT {all_columns} FROM import_tarif WHERE etat = 'nouveau'
+                ''')
 
-        return None, None
+                # Ajouter toutes les categories en une fois
+                cursor.executemany('''
+                    INSERT OR IGNORE INTO categories (nom, description, couleur)
+                    VALUES (?, ?, ?)
+                ''', [(cat, None, '#1F4E79') for cat in categories_to_add])
+        finally:
+            cursor.execute("DROP TABLE IF EXISTS temp.import_tarif")
+
+        return stats
+
+    def _parse_dimensions(self, dim_str: str) -> tuple:
+        """Parse une chaine de dimensions pour extraire hauteur et largeur"""
+        return parse_dimensions(dim_str)
 
     def export_csv(self, filepath: str, produits: List[Dict] = None, marge: float = None,
                    include_prix_vente: bool = True, delimiter: str = ';') -> int:
@@ -1482,29 +2594,39 @@ class Database:
 
     # ==================== PANIER / EXPORT GROUPE ====================
 
-    def get_produits_by_ids(self, product_ids: List[int]) -> List[Dict]:
+    def get_produits_by_ids(self, product_ids: List[int], actif_only: bool = True) -> List[Dict]:
         """
-        Recupere des produits par leurs IDs
+        Recupere des produits par leurs IDs (recherche indexee par paquets)
 
         Args:
             product_ids: Liste des IDs de produits
+            actif_only: Ignorer les produits desactives
 
         Returns:
-            Liste des produits avec toutes leurs donnees
+            Liste des produits avec toutes leurs donnees, dans l'ordre des IDs demandes
         """
         if not product_ids:
             return []
 
+        ids = list(dict.fromkeys(product_ids))
         cursor = self.conn.cursor()
-        placeholders = ','.join('?' * len(product_ids))
-        query = f"SELECT * FROM produits WHERE id IN ({placeholders}) AND actif=1"
-        cursor.execute(query, product_ids)
-
-        return [dict(row) for row in cursor.fetchall()]
+        by_id = {}
+        # Par paquets pour rester sous la limite de variables SQLite
+        for i in range(0, len(ids), 500):
+            batch = ids[i:i + 500]
+            placeholders = ','.join('?' * len(batch))
+            query = f"SELECT * FROM produits WHERE id IN ({placeholders})"
+            if actif_only:
+                query += " AND actif=1"
+            cursor.execute(query, batch)
+            by_id.update((row['id'], dict(row)) for row in cursor.fetchall())
+
+        return [by_id[product_id] for product_id in ids if product_id in by_id]
 
     def export_cart_to_csv(self, product_ids: List[int], filepath: str,
                           export_dir: str = None, include_fiches: bool = False,
-                          include_devis: bool = False, marge: float = None) -> Dict:
+                          include_devis: bool = False, marge: float = None,
+                          zip_path: str = None, progress_callback=None) -> Dict:
         """
         Exporte les produits du panier avec options de copie des PDFs
 
@@ -1515,6 +2637,8 @@ class Database:
             include_fiches: Copier les fiches techniques
             include_devis: Copier les devis fournisseur
             marge: Marge a appliquer (ou marge par defaut si None)
+            zip_path: Regrouper les PDFs dans cette archive ZIP (optionnel)
+            progress_callback: Fonction callback(octets_lus, octets_total) de la copie
 
         Returns:
             Dictionnaire avec statistiques:
@@ -1536,9 +2660,10 @@ class Database:
         nb_fiches = 0
         nb_devis = 0
 
-        if export_dir and (include_fiches or include_devis):
+        if (export_dir or zip_path) and (include_fiches or include_devis):
             nb_fiches, nb_devis = self._copy_pdf_files(
-                produits, export_dir, include_fiches, include_devis
+                produits, export_dir, include_fiches, include_devis,
+                zip_path=zip_path, progress_callback=progress_callback
             )
 
         return {
@@ -1550,7 +2675,8 @@ class Database:
     def _copy_pdf_files(self, produits: List[Dict], export_dir: str,
                        include_fiches: bool, include_devis: bool,
                        produit_to_code_article: dict = None,
-                       naming_options: dict = None) -> tuple:
+                       naming_options: dict = None, zip_path: str = None,
+                       progress_callback=None) -> tuple:
         """
         Copie les fichiers PDF des produits dans un dossier d'export
 
@@ -1564,16 +2690,12 @@ class Database:
                 - prefix_code_article: Prefixer avec le code article DPGF
                 - include_id_produit: Inclure l'ID du produit
                 - include_designation: Inclure la designation du produit
+            zip_path: Archive ZIP a creer a la place des sous-dossiers (optionnel)
+            progress_callback: Fonction callback(octets_lus, octets_total)
 
         Returns:
             Tuple (nb_fiches_copiees, nb_devis_copies)
         """
-        import os
-        import shutil
-
-        fiches_copied = 0
-        devis_copied = 0
-
         # Options par defaut (compatibilite ascendante)
         if naming_options is None:
             naming_options = {
@@ -1584,25 +2706,16 @@ class Database:
         if produit_to_code_article is None:
             produit_to_code_article = {}
 
-        # Creer les sous-dossiers
-        if include_fiches:
-            fiches_dir = os.path.join(export_dir, "Fiches_techniques")
-            os.makedirs(fiches_dir, exist_ok=True)
+        fiches_dir = "Fiches_techniques"
+        devis_dir = "Devis_fournisseur"
 
-        if include_devis:
-            devis_dir = os.path.join(export_dir, "Devis_fournisseur")
-            os.makedirs(devis_dir, exist_ok=True)
-
-        # Copier les fichiers
+        # Liste des copies (source, nom relatif) ; la copie est faite par pdf_bundle
+        files = []
         for product in produits:
             product_id = product['id']
-            designation = product['designation']
-
-            # Nettoyer la designation pour le nom de fichier
-            safe_designation = "".join(c for c in designation if c.isalnum() or c in (' ', '-', '_')).strip()
-            safe_designation = safe_designation[:50]  # Limiter la longueur
+            designation = product['designation'] or ''
 
-            # Construire le nom de fichier selon les options (issue #22)
+            # Nom de fichier construit une fois par produit (fiche et devis)
             name_parts = []
 
             # Code article DPGF en prefix
@@ -1618,44 +2731,41 @@ class Database:
             if naming_options.get('include_id_produit', True):
                 name_parts.append(str(product_id))
 
-            # Designation
+            # Designation nettoyee pour le nom de fichier
             if naming_options.get('include_designation', True):
+                safe_designation = "".join(c for c in designation if c.isalnum() or c in (' ', '-', '_')).strip()
+                safe_designation = safe_designation[:50]  # Limiter la longueur
                 if safe_designation:
                     name_parts.append(safe_designation)
 
-            # Construire le prefixe du nom de fichier
-            if name_parts:
-                name_prefix = "_".join(name_parts)
-            else:
-                # Fallback si aucune option selectionnee
-                name_prefix = str(product_id)
+            # Construire le prefixe du nom de fichier (fallback : ID produit)
+            name_prefix = "_".join(name_parts) if name_parts else str(product_id)
 
-            # Copier la fiche technique
             if include_fiches and product.get('fiche_technique'):
                 src_path = self.resolve_fiche_path(product['fiche_technique'])
-                if src_path and os.path.exists(src_path):
-                    try:
-                        ext = os.path.splitext(src_path)[1]
-                        dst_name = f"{name_prefix}_fiche{ext}"
-                        dst_path = os.path.join(fiches_dir, dst_name)
-                        shutil.copy2(src_path, dst_path)
-                        fiches_copied += 1
-                    except Exception as e:
-                        print(f"Erreur copie fiche {product_id}: {e}")
-
-            # Copier le devis fournisseur
+                if src_path:
+                    ext = os.path.splitext(src_path)[1]
+                    files.append((src_path, f"{fiches_dir}/{name_prefix}_fiche{ext}"))
+
             if include_devis and product.get('devis_fournisseur'):
                 src_path = self.resolve_fiche_path(product['devis_fournisseur'])
-                if src_path and os.path.exists(src_path):
-                    try:
-                        ext = os.path.splitext(src_path)[1]
-                        dst_name = f"{name_prefix}_devis{ext}"
-                        dst_path = os.path.join(devis_dir, dst_name)
-                        shutil.copy2(src_path, dst_path)
-                        devis_copied += 1
-                    except Exception as e:
-                        print(f"Erreur copie devis {product_id}: {e}")
-
+                if src_path:
+                    ext = os.path.splitext(src_path)[1]
+                    files.append((src_path, f"{devis_dir}/{name_prefix}_devis{ext}"))
+
+        if zip_path is None:
+            # Sous-dossiers crees meme vides (comportement existant)
+            if include_fiches:
+                os.makedirs(os.path.join(export_dir, fiches_dir), exist_ok=True)
+            if include_devis:
+                os.makedirs(os.path.join(export_dir, devis_dir), exist_ok=True)
+        if not files:
+            return (0, 0)
+
+        result = copy_bundle(files, export_dir=export_dir, zip_path=zip_path,
+                             progress_callback=progress_callback)
+        fiches_copied = sum(1 for name in result['fichiers'] if name.startswith(fiches_dir + '/'))
+        devis_copied = sum(1 for name in result['fichiers'] if name.startswith(devis_dir + '/'))
         return (fiches_copied, devis_copied)
 
     # ==================== STATISTIQUES ====================
@@ -1709,8 +2819,15 @@ class Database:
         # Chemin de la nouvelle base
         target_db_path = os.path.join(target_data_dir, "catalogue.db")
 
-        # Copier le fichier
-        shutil.copy2(source_db_path, target_db_path)
+        # Copier via l'API de sauvegarde SQLite : copie coherente, y compris les
+        # transactions encore dans le journal WAL
+        source = sqlite3.connect(source_db_path)
+        target = sqlite3.connect(target_db_path)
+        try:
+            source.backup(target)
+        finally:
+            target.close()
+            source.close()
 
         # Créer les sous-dossiers nécessaires
         os.makedirs(os.path.join(target_data_dir, "Devis_fournisseur"), exist_ok=True)
@@ -1731,20 +2848,7 @@ class Database:
                 'pose': {'cout': 32.0, 'vente': 42.0},
             }
         """
-        return {
-            'conception': {
-                'cout': float(self.get_parametre('taux_cout_conception', '35')),
-                'vente': float(self.get_parametre('taux_vente_conception', '45')),
-            },
-            'fabrication': {
-                'cout': float(self.get_parametre('taux_cout_fabrication', '28')),
-                'vente': float(self.get_parametre('taux_vente_fabrication', '38')),
-            },
-            'pose': {
-                'cout': float(self.get_parametre('taux_cout_pose', '32')),
-                'vente': float(self.get_parametre('taux_vente_pose', '42')),
-            },
-        }
+        return self.parametres().taux_horaires()
 
     def get_taux_horaires_simples(self) -> Dict[str, float]:
         """Recupere uniquement les taux de vente (compatibilite)"""
@@ -1757,7 +2861,7 @@ class Database:
 
     def get_marge_marche(self) -> float:
         """Recupere la marge par defaut pour les marches"""
-        return float(self.get_parametre('marge_marche', '25'))
+        return self.parametres().marge_marche
 
     # ==================== CHANTIERS ====================
 
@@ -1786,6 +2890,7 @@ class Database:
         row = cursor.fetchone()
         return dict(row) if row else None
 
+    @serialized_write
     def add_chantier(self, data: Dict) -> int:
         """Ajoute un nouveau chantier"""
         cursor = self.conn.cursor()
@@ -1803,9 +2908,10 @@ class Database:
             data.get('resultat', 'EN_COURS'),
             data.get('montant_ht', 0)
         ))
-        self.conn.commit()
+        self._commit()
         return cursor.lastrowid
 
+    @serialized_write
     def update_chantier(self, chantier_id: int, data: Dict):
         """Met a jour un chantier"""
         cursor = self.conn.cursor()
@@ -1831,8 +2937,9 @@ class Database:
             data.get('notes', ''),
             chantier_id
         ))
-        self.conn.commit()
+        self._commit()
 
+    @serialized_write
     def delete_chantier(self, chantier_id: int):
         """Supprime un chantier et toutes ses donnees associees"""
         cursor = self.conn.cursor()
@@ -1847,10 +2954,14 @@ class Database:
         cursor.execute("DELETE FROM dpgf_structure WHERE chantier_id = ?", (chantier_id,))
         # Supprimer le chantier
         cursor.execute("DELETE FROM chantiers WHERE id = ?", (chantier_id,))
-        self.conn.commit()
+        self._commit()
 
+    @serialized_write
     def update_chantier_montant(self, chantier_id: int):
-        """Recalcule le montant total d'un chantier"""
+        """Recalcule le montant total d'un chantier (differe dans un batch())"""
+        if self._batch_depth:
+            self._pending_chantiers.add(chantier_id)
+            return
         cursor = self.conn.cursor()
         cursor.execute('''
             SELECT SUM(prix_total_ht) as total
@@ -1862,7 +2973,7 @@ class Database:
             UPDATE chantiers SET montant_ht = ?, date_modification = CURRENT_TIMESTAMP
             WHERE id = ?
         ''', (total, chantier_id))
-        self.conn.commit()
+        self._commit()
 
     def get_chantier_recap(self, chantier_id: int) -> Dict:
         """Calcule le recapitulatif complet d'un chantier
@@ -1919,6 +3030,26 @@ class Database:
             'marge_projet': marge_projet
         }
 
+    def simulation_chantier(self, chantier_id: int) -> SimulationChantier:
+        """
+        Charge un chantier pour simuler marges et taux horaires sans ecrire en base
+
+        Args:
+            chantier_id: ID du chantier
+
+        Returns:
+            SimulationChantier (lots = structure de niveau 1)
+        """
+        cursor = self.conn.cursor()
+        cursor.execute('''
+            SELECT code, designation FROM dpgf_structure
+            WHERE chantier_id = ? AND niveau = 1
+            ORDER BY sort_key
+        ''', (chantier_id,))
+        lots = {lot_article(row['code']): row['designation'] for row in cursor.fetchall()}
+        return SimulationChantier(self.iter_articles_dpgf(chantier_id), self.parametres(), lots)
+
+    @serialized_write
     def set_chantier_marge_projet(self, chantier_id: int, marge: float):
         """Definit la marge projet personnalisee et recalcule tous les articles"""
         cursor = self.conn.cursor()
@@ -1928,31 +3059,80 @@ class Database:
             UPDATE chantiers SET marge_projet = ?, date_modification = CURRENT_TIMESTAMP
             WHERE id = ?
         ''', (marge, chantier_id))
-        self.conn.commit()
 
         # Appliquer la marge a tous les articles du chantier
-        cursor.execute("SELECT id FROM prix_marche WHERE chantier_id = ?", (chantier_id,))
-        for row in cursor.fetchall():
-            cursor.execute("UPDATE prix_marche SET marge_pct = ? WHERE id = ?", (marge, row['id']))
-        self.conn.commit()
+        cursor.execute("UPDATE prix_marche SET marge_pct = ? WHERE chantier_id = ?", (marge, chantier_id))
 
-        # Recalculer tous les articles
-        cursor.execute("SELECT id FROM prix_marche WHERE chantier_id = ?", (chantier_id,))
-        for row in cursor.fetchall():
-            self.recalculer_article_dpgf(row['id'])
+        # Recalculer tous les articles (meme transaction, un seul commit)
+        self.recalculer_articles_dpgf(chantier_id=chantier_id)
 
     # ==================== ARTICLES DPGF (PRIX_MARCHE) ====================
 
+    # Au-dela, une modification est notee pour le chantier entier (import, actualisation)
+    _DPGF_CHANGES_MAX = 1000
+
+    def _note_dpgf_change(self, chantier_id: int, article_ids: List[int] = None):
+        """Note des articles DPGF modifies (None = tout le chantier), voir dpgf_changes"""
+        self._dpgf_version += 1
+        changes = self._dpgf_changes.setdefault(chantier_id, [0, OrderedDict()])
+        if article_ids is None or len(changes[1]) + len(article_ids) > self._DPGF_CHANGES_MAX:
+            changes[0] = self._dpgf_version
+            changes[1].clear()
+            return
+        for article_id in article_ids:
+            changes[1][article_id] = self._dpgf_version
+            changes[1].move_to_end(article_id)
+
+    def dpgf_changes(self, chantier_id: int, since: int = 0) -> tuple:
+        """
+        Articles d'un chantier modifies par cette connexion depuis une version
+
+        Toute modification des couts passe par recalculer_articles_dpgf (ou
+        delete_article_dpgf) : liaison de produits, actualisation des prix,
+        marge projet, autre fenetre... Les ecritures des autres connexions sont
+        signalees par data_version (voir parametres()).
+
+        Args:
+            chantier_id: Chantier suivi
+            since: Version deja connue (retour precedent, 0 au chargement)
+
+        Returns:
+            Tuple (version courante, ids des articles modifies depuis since, ou
+            None si tout le chantier est a relire)
+        """
+        changes = self._dpgf_changes.get(chantier_id)
+        if changes is None:
+            return self._dpgf_version, []
+        if changes[0] > since:
+            return self._dpgf_version, None
+        article_ids = []
+        for article_id, version in reversed(changes[1].items()):
+            if version <= since:
+                break
+            article_ids.append(article_id)
+        return self._dpgf_version, article_ids
+
     def get_articles_dpgf(self, chantier_id: int) -> List[Dict]:
         """Recupere tous les articles d'un chantier"""
         cursor = self.conn.cursor()
         cursor.execute('''
             SELECT * FROM prix_marche
             WHERE chantier_id = ?
-            ORDER BY code, id
+            ORDER BY sort_key, id
         ''', (chantier_id,))
         return [dict(row) for row in cursor.fetchall()]
 
+    def iter_articles_dpgf(self, chantier_id: int):
+        """Parcourt les articles d'un chantier sans les charger tous (exports en flux)"""
+        cursor = self.conn.cursor()
+        cursor.execute('''
+            SELECT * FROM prix_marche
+            WHERE chantier_id = ?
+            ORDER BY sort_key, id
+        ''', (chantier_id,))
+        for row in cursor:
+            yield dict(row)
+
     def get_article_dpgf(self, article_id: int) -> Optional[Dict]:
         """Recupere un article DPGF par son ID"""
         cursor = self.conn.cursor()
@@ -1960,20 +3140,22 @@ class Database:
         row = cursor.fetchone()
         return dict(row) if row else None
 
+    @serialized_write
     def add_article_dpgf(self, chantier_id: int, data: Dict) -> int:
         """Ajoute un article DPGF"""
         cursor = self.conn.cursor()
         cursor.execute('''
             INSERT INTO prix_marche (
-                chantier_id, code, niveau, designation, description, presentation, categorie,
+                chantier_id, code, sort_key, niveau, designation, description, presentation, categorie,
                 largeur_mm, hauteur_mm, caracteristiques, unite,
                 quantite, localisation, notes, marge_pct, taux_tva,
                 temps_conception, temps_fabrication, temps_pose,
                 prix_manuel, fournitures_additionnelles
-            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
         ''', (
             chantier_id,
             data.get('code', ''),
+            self.dpgf_sort_key(data.get('code')),
             data.get('niveau', 4),
             data.get('designation', ''),
             data.get('description', ''),
@@ -1986,7 +3168,7 @@ class Database:
             data.get('quantite', 1),
             data.get('localisation', ''),
             data.get('notes', ''),
-            data.get('marge_pct', self.get_marge_marche()),
+            data.get('marge_pct', self.parametres().marge_marche),
             data.get('taux_tva', 20),
             data.get('temps_conception', 0),
             data.get('temps_fabrication', 0),
@@ -1994,18 +3176,19 @@ class Database:
             data.get('prix_manuel'),
             data.get('fournitures_additionnelles', 0)
         ))
-        self.conn.commit()
+        self._commit()
         article_id = cursor.lastrowid
         # Recalculer les couts initiaux
         self.recalculer_article_dpgf(article_id)
         return article_id
 
+    @serialized_write
     def update_article_dpgf(self, article_id: int, data: Dict):
         """Met a jour un article DPGF"""
         cursor = self.conn.cursor()
         cursor.execute('''
             UPDATE prix_marche SET
-                code = ?, designation = ?, description = ?, presentation = ?, categorie = ?,
+                code = ?, sort_key = ?, designation = ?, description = ?, presentation = ?, categorie = ?,
                 largeur_mm = ?, hauteur_mm = ?, caracteristiques = ?,
                 unite = ?, quantite = ?, localisation = ?, notes = ?,
                 temps_conception = ?, temps_fabrication = ?, temps_pose = ?,
@@ -2014,6 +3197,7 @@ class Database:
             WHERE id = ?
         ''', (
             data.get('code', ''),
+            self.dpgf_sort_key(data.get('code')),
             data.get('designation', ''),
             data.get('description', ''),
             data.get('presentation', ''),
@@ -2034,10 +3218,11 @@ class Database:
             data.get('fournitures_additionnelles', 0),
             article_id
         ))
-        self.conn.commit()
+        self._commit()
         # Recalculer les couts
         self.recalculer_article_dpgf(article_id)
 
+    @serialized_write
     def delete_article_dpgf(self, article_id: int):
         """Supprime un article DPGF"""
         cursor = self.conn.cursor()
@@ -2049,11 +3234,13 @@ class Database:
         cursor.execute("DELETE FROM article_produits WHERE prix_marche_id = ?", (article_id,))
         # Supprimer l'article
         cursor.execute("DELETE FROM prix_marche WHERE id = ?", (article_id,))
-        self.conn.commit()
+        self._commit()
         # Mettre a jour le montant du chantier
         if chantier_id:
+            self._note_dpgf_change(chantier_id, [article_id])
             self.update_chantier_montant(chantier_id)
 
+    @serialized_write
     def recalculer_article_dpgf(self, article_id: int):
         """Recalcule les couts d'un article DPGF
 
@@ -2064,68 +3251,124 @@ class Database:
 
         Si prix_manuel est renseigne, il override le calcul automatique du prix_unitaire_ht
         Les fournitures_additionnelles s'ajoutent au cout des materiaux
+
+        Dans un batch(), le recalcul est differe et fait une seule fois par article.
         """
-        article = self.get_article_dpgf(article_id)
-        if not article:
+        if self._batch_depth:
+            self._pending_articles.add(article_id)
             return
+        self.recalculer_articles_dpgf(article_ids=[article_id])
 
-        taux = self.get_taux_horaires()
+    @serialized_write
+    def recalculer_articles_dpgf(self, chantier_id: int = None, article_ids: List[int] = None,
+                                 parametres: ParametresSnapshot = None) -> int:
+        """Recalcule les couts de plusieurs articles DPGF en une seule passe
 
-        # Calculer le cout des materiaux (somme des produits lies)
-        cursor = self.conn.cursor()
-        cursor.execute('''
-            SELECT SUM(quantite * prix_unitaire) as total
-            FROM article_produits WHERE prix_marche_id = ?
-        ''', (article_id,))
-        result = cursor.fetchone()
-        cout_produits = result['total'] if result and result['total'] else 0
-
-        # Ajouter les fournitures additionnelles au cout materiaux
-        fournitures_add = article.get('fournitures_additionnelles') or 0
-        cout_materiaux = cout_produits + fournitures_add
-
-        # Calculer les COUTS MO (cout entreprise)
-        cout_mo_conception = article['temps_conception'] * taux['conception']['cout']
-        cout_mo_fabrication = article['temps_fabrication'] * taux['fabrication']['cout']
-        cout_mo_pose = article['temps_pose'] * taux['pose']['cout']
-        cout_mo_total = cout_mo_conception + cout_mo_fabrication + cout_mo_pose
-
-        # Calculer les PRIX DE VENTE MO
-        vente_mo_conception = article['temps_conception'] * taux['conception']['vente']
-        vente_mo_fabrication = article['temps_fabrication'] * taux['fabrication']['vente']
-        vente_mo_pose = article['temps_pose'] * taux['pose']['vente']
-        vente_mo_total = vente_mo_conception + vente_mo_fabrication + vente_mo_pose
-
-        # Calculer la marge MO automatique
-        marge_mo_pct = ((vente_mo_total - cout_mo_total) / cout_mo_total * 100) if cout_mo_total > 0 else 0
-
-        # Cout de revient = materiaux + cout MO entreprise
-        cout_revient = cout_materiaux + cout_mo_total
-
-        # Prix de vente : utiliser prix_manuel si renseigne, sinon calcul automatique
-        prix_manuel = article.get('prix_manuel')
-        if prix_manuel is not None:
-            # Prix manuel override le calcul automatique
-            prix_unitaire_ht = prix_manuel
+        Meme calcul que recalculer_article_dpgf, mais ensembliste : une requete
+        d'agregation des produits lies et un UPDATE ... FROM pour tous les articles,
+        puis le montant_ht des chantiers concernes est mis a jour une seule fois.
+        Le tout dans une seule transaction.
+
+        Args:
+            chantier_id: Recalcule tous les articles de ce chantier
+            article_ids: Recalcule uniquement ces articles
+            (sans argument : tous les articles de la base)
+            parametres: Jeu de taux horaires a appliquer (defaut : instantane courant)
+
+        Returns:
+            Nombre d'articles recalcules
+        """
+        params = (parametres or self.parametres()).sql_params()
+
+        if article_ids is not None:
+            article_ids = list(dict.fromkeys(article_ids))
+            # Par paquets pour rester sous la limite de variables SQLite
+            batches = [article_ids[i:i + 500] for i in range(0, len(article_ids), 500)]
         else:
-            # Calcul automatique : materiaux avec marge + vente MO
-            marge_materiaux = article['marge_pct'] / 100
-            prix_materiaux_vente = cout_materiaux * (1 + marge_materiaux)
-            prix_unitaire_ht = prix_materiaux_vente + vente_mo_total
+            batches = [None]
 
-        prix_total_ht = prix_unitaire_ht * article['quantite']
+        cursor = self.conn.cursor()
+        count = 0
+        chantier_ids = set()
+        changed: Dict[int, List[int]] = {}  # Articles recalcules par chantier (voir dpgf_changes)
+
+        for batch in batches:
+            if batch is not None:
+                marks = ', '.join(f':a{i}' for i in range(len(batch)))
+                where = f"id IN ({marks})"
+                batch_params = dict(params, **{f'a{i}': article_id for i, article_id in enumerate(batch)})
+            elif chantier_id is not None:
+                where = "chantier_id = :chantier_id"
+                batch_params = dict(params, chantier_id=chantier_id)
+            else:
+                where = "1"
+                batch_params = params
+
+            changes = self.conn.total_changes
+            cursor.execute(f'''
+                WITH materiaux AS (
+                    SELECT prix_marche_id, SUM(quantite * prix_unitaire) AS total
+                    FROM article_produits
+                    WHERE prix_marche_id IN (SELECT id FROM prix_marche WHERE {where})
+                    GROUP BY prix_marche_id
+                ),
+                calcul AS (
+                    SELECT pm.id,
+                           IFNULL(m.total, 0) + IFNULL(pm.fournitures_additionnelles, 0) AS cout_materiaux,
+                           IFNULL(pm.temps_conception, 0) * :cout_conception
+                             + IFNULL(pm.temps_fabrication, 0) * :cout_fabrication
+                             + IFNULL(pm.temps_pose, 0) * :cout_pose AS cout_mo,
+                           IFNULL(pm.temps_conception, 0) * :vente_conception
+                             + IFNULL(pm.temps_fabrication, 0) * :vente_fabrication
+                             + IFNULL(pm.temps_pose, 0) * :vente_pose AS vente_mo
+                    FROM prix_marche pm
+                    LEFT JOIN materiaux m ON m.prix_marche_id = pm.id
+                    WHERE pm.id IN (SELECT id FROM prix_marche WHERE {where})
+                ),
+                prix AS (
+                    SELECT calcul.*,
+                           CASE WHEN pm.prix_manuel IS NOT NULL THEN pm.prix_manuel
+                                ELSE calcul.cout_materiaux * (1 + IFNULL(pm.marge_pct, 0) / 100.0) + calcul.vente_mo
+                           END AS prix_unitaire_ht
+                    FROM calcul JOIN prix_marche pm ON pm.id = calcul.id
+                )
+                UPDATE prix_marche SET
+                    cout_materiaux = prix.cout_materiaux,
+                    cout_mo_total = prix.vente_mo,
+                    cout_revient = prix.cout_materiaux + prix.cout_mo,
+                    prix_unitaire_ht = prix.prix_unitaire_ht,
+                    prix_total_ht = prix.prix_unitaire_ht * IFNULL(prix_marche.quantite, 0)
+                FROM prix
+                WHERE prix_marche.id = prix.id
+            ''', batch_params)
+            count += self.conn.total_changes - changes  # rowcount non renseigne pour WITH ... UPDATE
+
+            if batch is not None:
+                cursor.execute(f"SELECT id, chantier_id FROM prix_marche WHERE {where}", batch_params)
+                for row in cursor.fetchall():
+                    changed.setdefault(row['chantier_id'], []).append(row['id'])
+                chantier_ids.update(changed)
+            else:
+                cursor.execute(f"SELECT DISTINCT chantier_id FROM prix_marche WHERE {where}", batch_params)
+                chantier_ids.update(row['chantier_id'] for row in cursor.fetchall())
 
-        # Mettre a jour l'article
-        cursor.execute('''
-            UPDATE prix_marche SET
-                cout_materiaux = ?, cout_mo_total = ?, cout_revient = ?,
-                prix_unitaire_ht = ?, prix_total_ht = ?
-            WHERE id = ?
-        ''', (cout_materiaux, vente_mo_total, cout_revient, prix_unitaire_ht, prix_total_ht, article_id))
-        self.conn.commit()
+        for changed_chantier_id in chantier_ids:
+            self._note_dpgf_change(changed_chantier_id, changed.get(changed_chantier_id))
 
-        # Mettre a jour le montant du chantier
-        self.update_chantier_montant(article['chantier_id'])
+        # Montant des chantiers concernes, une seule fois chacun
+        self._update_chantiers_montant(cursor, chantier_ids)
+        self._commit()
+        return count
+
+    def _update_chantiers_montant(self, cursor, chantier_ids):
+        """Recalcule montant_ht de plusieurs chantiers (sans commit)"""
+        cursor.executemany('''
+            UPDATE chantiers SET
+                montant_ht = IFNULL((SELECT SUM(prix_total_ht) FROM prix_marche
+                                     WHERE chantier_id = chantiers.id), 0),
+                date_modification = CURRENT_TIMESTAMP
+            WHERE id = ?
+        ''', [(chantier_id,) for chantier_id in chantier_ids])
 
     # ==================== PRODUITS LIES (ARTICLE_PRODUITS) ====================
 
@@ -2142,6 +3385,34 @@ class Database:
         ''', (article_id,))
         return [dict(row) for row in cursor.fetchall()]
 
+    def get_produits_lies_chantier(self, chantier_id: int) -> Dict[int, List[Dict]]:
+        """
+        Recupere en une requete les produits lies a tous les articles d'un chantier
+
+        Args:
+            chantier_id: ID du chantier
+
+        Returns:
+            Dictionnaire prix_marche_id -> liste des produits lies (memes champs
+            que get_produits_article, plus fiche_technique et devis_fournisseur)
+        """
+        cursor = self.conn.cursor()
+        cursor.execute('''
+            SELECT ap.*, p.designation as produit_designation, p.reference,
+                   p.categorie, p.prix_achat as prix_catalogue,
+                   p.fiche_technique, p.devis_fournisseur
+            FROM prix_marche pm
+            JOIN article_produits ap ON ap.prix_marche_id = pm.id
+            JOIN produits p ON ap.produit_id = p.id
+            WHERE pm.chantier_id = ?
+            ORDER BY ap.prix_marche_id, ap.id
+        ''', (chantier_id,))
+        produits_lies = {}
+        for row in cursor:
+            produits_lies.setdefault(row['prix_marche_id'], []).append(dict(row))
+        return produits_lies
+
+    @serialized_write
     def add_produit_article(self, article_id: int, produit_id: int, quantite: float = 1) -> int:
         """Ajoute un produit a un article DPGF"""
         # Recuperer le prix actuel du produit
@@ -2154,13 +3425,14 @@ class Database:
             INSERT INTO article_produits (prix_marche_id, produit_id, quantite, prix_unitaire)
             VALUES (?, ?, ?, ?)
         ''', (article_id, produit_id, quantite, produit['prix_achat']))
-        self.conn.commit()
+        self._commit()
 
         # Recalculer l'article
         self.recalculer_article_dpgf(article_id)
 
         return cursor.lastrowid
 
+    @serialized_write
     def update_produit_article(self, liaison_id: int, quantite: float, prix_unitaire: float = None):
         """Met a jour la quantite/prix d'un produit lie"""
         cursor = self.conn.cursor()
@@ -2174,7 +3446,7 @@ class Database:
                 UPDATE article_produits SET quantite = ?
                 WHERE id = ?
             ''', (quantite, liaison_id))
-        self.conn.commit()
+        self._commit()
 
         # Recuperer l'article_id pour recalculer
         cursor.execute("SELECT prix_marche_id FROM article_produits WHERE id = ?", (liaison_id,))
@@ -2182,6 +3454,7 @@ class Database:
         if row:
             self.recalculer_article_dpgf(row['prix_marche_id'])
 
+    @serialized_write
     def remove_produit_article(self, liaison_id: int):
         """Supprime un produit d'un article DPGF"""
         cursor = self.conn.cursor()
@@ -2191,12 +3464,118 @@ class Database:
         article_id = row['prix_marche_id'] if row else None
 
         cursor.execute("DELETE FROM article_produits WHERE id = ?", (liaison_id,))
-        self.conn.commit()
+        self._commit()
 
         # Recalculer l'article
         if article_id:
             self.recalculer_article_dpgf(article_id)
 
+    # ==================== ACTUALISATION DES PRIX DPGF ====================
+
+    # Liens article <-> produit dont le prix fige differe du catalogue parce que
+    # le catalogue a change depuis : le prix du lien est un ancien prix catalogue
+    # (historique_prix). Un prix saisi a la main (prix negocie) n'est pas concerne.
+    _LIENS_PRIX_OBSOLETES = '''
+        SELECT ap.id AS liaison_id, ap.prix_marche_id, ap.produit_id, ap.quantite,
+               ap.prix_unitaire AS ancien_prix, p.prix_achat AS nouveau_prix,
+               pm.chantier_id, pm.quantite AS quantite_article, pm.marge_pct, pm.prix_manuel
+        FROM article_produits ap
+        JOIN produits p ON p.id = ap.produit_id
+        JOIN prix_marche pm ON pm.id = ap.prix_marche_id
+        WHERE p.prix_achat IS NOT NULL AND ap.prix_unitaire IS NOT p.prix_achat
+          AND EXISTS (SELECT 1 FROM historique_prix h
+                      WHERE h.produit_id = ap.produit_id AND h.ancien_prix = ap.prix_unitaire)
+    '''
+
+    def get_ecarts_prix_dpgf(self, resultat: Optional[str] = 'EN_COURS') -> List[Dict]:
+        """
+        Impact par chantier des prix catalogue modifies depuis la liaison des produits
+
+        Args:
+            resultat: Limiter aux chantiers de ce resultat (None = tous)
+
+        Returns:
+            Liste de dicts par chantier : chantier_id, nom, montant_ht, nb_liens,
+            nb_articles, ecart_materiaux (cout d'achat), ecart_ht (montant HT, hors
+            articles a prix manuel), derniere_modification (historique_prix)
+        """
+        where = "WHERE c.resultat = ?" if resultat else ""
+        params = (resultat,) if resultat else ()
+        cursor = self.conn.cursor()
+        cursor.execute(f'''
+            WITH ecarts AS ({self._LIENS_PRIX_OBSOLETES})
+            SELECT c.id AS chantier_id, c.nom, c.montant_ht,
+                   COUNT(*) AS nb_liens,
+                   COUNT(DISTINCT e.prix_marche_id) AS nb_articles,
+                   SUM(e.quantite * (e.nouveau_prix - e.ancien_prix)) AS ecart_materiaux,
+                   SUM(CASE WHEN e.prix_manuel IS NULL
+                            THEN e.quantite * (e.nouveau_prix - e.ancien_prix)
+                                 * (1 + IFNULL(e.marge_pct, 0) / 100.0) * IFNULL(e.quantite_article, 0)
+                            ELSE 0 END) AS ecart_ht,
+                   (SELECT MAX(h.date_modification) FROM historique_prix h
+                    WHERE h.produit_id IN (SELECT produit_id FROM ecarts WHERE chantier_id = c.id))
+                       AS derniere_modification
+            FROM ecarts e
+            JOIN chantiers c ON c.id = e.chantier_id
+            {where}
+            GROUP BY c.id
+            ORDER BY c.nom
+        ''', params)
+        return [dict(row) for row in cursor.fetchall()]
+
+    @serialized_write
+    def actualiser_prix_dpgf(self, chantier_ids: List[int], progress_callback=None) -> Dict:
+        """
+        Reporte les prix catalogue actuels sur les produits lies des chantiers
+
+        Une requete ensembliste par chantier, le tout dans une seule transaction ;
+        les articles touches sont recalcules en une passe a la fin (voir batch()).
+        Depuis un thread de travail, appeler sur une connexion dediee (open_writer).
+
+        Args:
+            chantier_ids: Chantiers a actualiser
+            progress_callback: Fonction callback(current, total) ; une exception
+                               levee (ex. InterruptedError) annule tout
+
+        Returns:
+            Dict avec chantiers, liens (prix mis a jour), articles (recalcules)
+        """
+        stats = {'chantiers': 0, 'liens': 0, 'articles': 0}
+        total = len(chantier_ids)
+        cursor = self.conn.cursor()
+
+        with self.batch():
+            for index, chantier_id in enumerate(chantier_ids):
+                if progress_callback:
+                    progress_callback(index, total)
+
+                cursor.execute(f'''
+                    SELECT liaison_id, prix_marche_id FROM ({self._LIENS_PRIX_OBSOLETES})
+                    WHERE chantier_id = ?
+                ''', (chantier_id,))
+                liens = cursor.fetchall()
+                if not liens:
+                    continue
+
+                cursor.execute(f'''
+                    UPDATE article_produits SET prix_unitaire = p.prix_achat
+                    FROM produits p
+                    WHERE p.id = article_produits.produit_id
+                      AND article_produits.id IN (SELECT liaison_id FROM ({self._LIENS_PRIX_OBSOLETES})
+                                                  WHERE chantier_id = ?)
+                ''', (chantier_id,))
+
+                article_ids = {row['prix_marche_id'] for row in liens}
+                self._pending_articles.update(article_ids)
+                stats['chantiers'] += 1
+                stats['liens'] += len(liens)
+                stats['articles'] += len(article_ids)
+
+            if progress_callback:
+                progress_callback(total, total)
+
+        return stats
+
     # ==================== STRUCTURE DPGF ====================
 
     def get_structure_dpgf(self, chantier_id: int) -> List[Dict]:
@@ -2209,28 +3588,103 @@ class Database:
         ''', (chantier_id,))
         return [dict(row) for row in cursor.fetchall()]
 
+    @serialized_write
     def add_structure_dpgf(self, chantier_id: int, data: Dict) -> int:
         """Ajoute un element de structure DPGF"""
         cursor = self.conn.cursor()
         cursor.execute('''
-            INSERT INTO dpgf_structure (chantier_id, code, niveau, designation, parent_id, ordre)
-            VALUES (?, ?, ?, ?, ?, ?)
+            INSERT INTO dpgf_structure (chantier_id, code, sort_key, niveau, designation, parent_id, ordre)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
         ''', (
             chantier_id,
             data.get('code', ''),
+            self.dpgf_sort_key(data.get('code')),
             data.get('niveau', 1),
             data.get('designation', ''),
             data.get('parent_id'),
             data.get('ordre', 0)
         ))
-        self.conn.commit()
+        self._commit()
         return cursor.lastrowid
 
     # ==================== IMPORT/EXPORT DPGF ====================
 
+    @serialized_write
     def import_dpgf_csv(self, chantier_id: int, filepath: str) -> int:
-        """Importe un fichier DPGF CSV"""
-        count = 0
+        """
+        Importe un fichier DPGF CSV
+
+        Les lignes sont lues en entier puis inserees par executemany dans une
+        seule transaction ; les parent_id de la structure sont resolus en memoire
+        a partir des codes et les prix sont recalcules en une passe a la fin.
+
+        Returns:
+            Nombre d'articles importes
+        """
+        structures, articles = self._parse_dpgf_csv(filepath)
+        cursor = self.conn.cursor()
+
+        with self.batch():
+            # Ids attribues a l'avance : les parents sont connus avant l'insertion
+            cursor.execute("SELECT IFNULL(MAX(id), 0) FROM dpgf_structure")
+            next_id = cursor.fetchone()[0] + 1
+            ids_by_code = {}
+            stack = []  # (niveau, id) des elements ouverts
+            structure_rows = []
+            for item in structures:
+                structure_id = next_id
+                next_id += 1
+                code, niveau = item['code'], item['niveau']
+
+                parent_id = self._dpgf_parent_from_code(code, ids_by_code)
+                while stack and stack[-1][0] >= niveau:
+                    stack.pop()
+                if parent_id is None and stack:
+                    # Code sans prefixe connu : parent = dernier niveau superieur
+                    parent_id = stack[-1][1]
+                stack.append((niveau, structure_id))
+                if code:
+                    ids_by_code[self._normalize_dpgf_code(code)] = structure_id
+
+                structure_rows.append((structure_id, chantier_id, code, self.dpgf_sort_key(code),
+                                       niveau, item['designation'], parent_id, 0))
+
+            cursor.executemany('''
+                INSERT INTO dpgf_structure (id, chantier_id, code, sort_key, niveau, designation, parent_id, ordre)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+            ''', structure_rows)
+
+            marge = self.parametres().marge_marche
+            cursor.execute("SELECT IFNULL(MAX(id), 0) FROM prix_marche")
+            last_id = cursor.fetchone()[0]
+            cursor.executemany('''
+                INSERT INTO prix_marche (
+                    chantier_id, code, sort_key, niveau, designation, description, categorie,
+                    largeur_mm, hauteur_mm, caracteristiques, unite,
+                    quantite, localisation, notes, marge_pct, taux_tva
+                ) VALUES (?, ?, ?, 4, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ''', [(
+                chantier_id, a['code'], self.dpgf_sort_key(a['code']), a['designation'],
+                a['description'], a['categorie'],
+                a['largeur_mm'], a['hauteur_mm'], a['caracteristiques'], a['unite'],
+                a['quantite'], a['localisation'], a['notes'], marge, a['taux_tva']
+            ) for a in articles])
+
+            # Recalcul ensembliste unique a la sortie du bloc (voir _flush_batch)
+            cursor.execute("SELECT id FROM prix_marche WHERE chantier_id = ? AND id > ?",
+                           (chantier_id, last_id))
+            self._pending_articles.update(row[0] for row in cursor.fetchall())
+            self._pending_chantiers.add(chantier_id)
+
+        return len(articles)
+
+    def _parse_dpgf_csv(self, filepath: str) -> tuple:
+        """
+        Lit un fichier DPGF CSV
+
+        Returns:
+            (elements de structure niveaux 1-3, articles niveau 4), dans l'ordre du fichier
+        """
         encoding = 'utf-8-sig'
         try:
             with open(filepath, 'r', encoding='utf-8-sig') as test_f:
@@ -2238,6 +3692,8 @@ class Database:
         except UnicodeDecodeError:
             encoding = 'cp1252'
 
+        structures = []
+        articles = []
         with open(filepath, 'r', encoding=encoding) as f:
             sample = f.read(1024)
             f.seek(0)
@@ -2249,58 +3705,130 @@ class Database:
 
                 if niveau < 4:
                     # Structure hierarchique (niveau 1-3)
-                    self.add_structure_dpgf(chantier_id, {
+                    structures.append({
                         'code': row.get('CODE', ''),
                         'niveau': niveau,
                         'designation': row.get('DESIGNATION', ''),
                     })
-                else:
-                    # Article chiffrable (niveau 4)
-                    try:
-                        quantite = float(row.get('QUANTITE', '1').replace(',', '.')) if row.get('QUANTITE') else 1
-                    except:
-                        quantite = 1
-
-                    try:
-                        largeur = int(row.get('LARGEUR_MM', '')) if row.get('LARGEUR_MM', '').isdigit() else None
-                    except:
-                        largeur = None
-
-                    try:
-                        hauteur = int(row.get('HAUTEUR_MM', '')) if row.get('HAUTEUR_MM', '').isdigit() else None
-                    except:
-                        hauteur = None
-
-                    # Taux TVA
-                    try:
-                        taux_tva = float(row.get('TVA', '20').replace(',', '.')) if row.get('TVA') else 20
-                    except:
-                        taux_tva = 20
-
-                    self.add_article_dpgf(chantier_id, {
-                        'code': row.get('CODE', ''),
-                        'niveau': 4,
-                        'designation': row.get('DESIGNATION', ''),
-                        'description': row.get('DESCRIPTION', ''),
-                        'categorie': row.get('CATEGORIE', ''),
-                        'largeur_mm': largeur,
-                        'hauteur_mm': hauteur,
-                        'caracteristiques': row.get('CARACTERISTIQUES', ''),
-                        'unite': row.get('UNITE', 'U'),
-                        'quantite': quantite,
-                        'localisation': row.get('LOCALISATION', ''),
-                        'notes': row.get('NOTES', ''),
-                        'taux_tva': taux_tva,
-                    })
-                    count += 1
+                    continue
 
-        return count
+                # Article chiffrable (niveau 4)
+                try:
+                    quantite = float(row.get('QUANTITE', '1').replace(',', '.')) if row.get('QUANTITE') else 1
+                except:
+                    quantite = 1
+
+                try:
+                    largeur = int(row.get('LARGEUR_MM', '')) if row.get('LARGEUR_MM', '').isdigit() else None
+                except:
+                    largeur = None
+
+                try:
+                    hauteur = int(row.get('HAUTEUR_MM', '')) if row.get('HAUTEUR_MM', '').isdigit() else None
+                except:
+                    hauteur = None
+
+                # Taux TVA
+                try:
+                    taux_tva = float(row.get('TVA', '20').replace(',', '.')) if row.get('TVA') else 20
+                except:
+                    taux_tva = 20
+
+                articles.append({
+                    'code': row.get('CODE', ''),
+                    'designation': row.get('DESIGNATION', ''),
+                    'description': row.get('DESCRIPTION', ''),
+                    'categorie': row.get('CATEGORIE', ''),
+                    'largeur_mm': largeur,
+                    'hauteur_mm': hauteur,
+                    'caracteristiques': row.get('CARACTERISTIQUES', ''),
+                    'unite': row.get('UNITE', 'U'),
+                    'quantite': quantite,
+                    'localisation': row.get('LOCALISATION', ''),
+                    'notes': row.get('NOTES', ''),
+                    'taux_tva': taux_tva,
+                })
+
+        return structures, articles
+
+    @staticmethod
+    def dpgf_sort_key(code: Optional[str]) -> str:
+        """
+        Cle de tri d'un code DPGF, comparable octet par octet
+
+        Ordre naturel des segments ('1.2.10' apres '1.2.9') : segments numeriques
+        completes par des zeros et places avant les segments texte.
+        Exemple : '1.2-B' -> '00000000001', '00000000002', '1B' joints par chr(1)
+        """
+        parts = []
+        for part in (code or '').replace('-', '.').replace('/', '.').split('.'):
+            try:
+                parts.append(f"0{int(part):010d}")
+            except ValueError:
+                parts.append(f"1{part}")
+        # Separateur inferieur a tout caractere : '1.2' avant '1.2.1' et '1.2A'
+        return '\x01'.join(parts)
+
+    def _fill_dpgf_sort_keys(self, cursor):
+        """Calcule les cles de tri manquantes (bases anterieures, autres versions)"""
+        for table in ('prix_marche', 'dpgf_structure'):
+            cursor.execute(f"SELECT id, code FROM {table} WHERE sort_key IS NULL")
+            rows = [(self.dpgf_sort_key(row['code']), row['id']) for row in cursor.fetchall()]
+            if rows:
+                cursor.executemany(f"UPDATE {table} SET sort_key = ? WHERE id = ?", rows)
+
+    # Colonnes des lignes DPGF (structure et articles) renvoyees par iter_lignes_dpgf
+    DPGF_LIGNE_COLUMNS = (
+        'id', 'code', 'niveau', 'designation', 'description', 'presentation', 'categorie',
+        'largeur_mm', 'hauteur_mm', 'caracteristiques', 'unite', 'quantite', 'localisation',
+        'notes', 'temps_conception', 'temps_fabrication', 'temps_pose', 'cout_materiaux',
+        'fournitures_additionnelles', 'cout_mo_total', 'cout_revient', 'marge_pct', 'taux_tva',
+        'prix_manuel', 'prix_unitaire_ht', 'prix_total_ht',
+    )
+
+    def iter_lignes_dpgf(self, chantier_id: int):
+        """
+        Parcourt le DPGF dans l'ordre hierarchique : structure (niveaux 1-3) et
+        articles (niveau 4) fusionnes et tries en SQL sur sort_key
+
+        A code egal : niveau croissant, structure avant article.
+        Chaque ligne porte 'type' ('structure' ou 'article') ; les colonnes
+        propres aux articles valent None pour la structure.
+        """
+        structure_cols = ('id', 'code', 'niveau', 'designation')
+        cols = ', '.join(self.DPGF_LIGNE_COLUMNS)
+        structure_select = ', '.join(col if col in structure_cols else f"NULL AS {col}"
+                                     for col in self.DPGF_LIGNE_COLUMNS)
+        cursor = self.conn.cursor()
+        cursor.execute(f'''
+            SELECT 'structure' AS type, {structure_select}, sort_key, 0 AS rang
+            FROM dpgf_structure WHERE chantier_id = ?
+            UNION ALL
+            SELECT 'article' AS type, {cols}, sort_key, 1 AS rang
+            FROM prix_marche WHERE chantier_id = ?
+            ORDER BY sort_key, niveau, rang, id
+        ''', (chantier_id, chantier_id))
+        for row in cursor:
+            yield dict(row)
+
+    @staticmethod
+    def _normalize_dpgf_code(code: str) -> str:
+        """Normalise un code DPGF ('1-2/3' -> '1.2.3')"""
+        return code.strip().replace('-', '.').replace('/', '.').strip('.')
+
+    def _dpgf_parent_from_code(self, code: str, ids_by_code: Dict) -> Optional[int]:
+        """Retourne l'id du plus long prefixe de code deja connu (1.2.3 -> 1.2 -> 1)"""
+        parts = self._normalize_dpgf_code(code or '').split('.')
+        for length in range(len(parts) - 1, 0, -1):
+            parent_id = ids_by_code.get('.'.join(parts[:length]))
+            if parent_id is not None:
+                return parent_id
+        return None
 
     def export_dpgf_csv(self, chantier_id: int, filepath: str, version_client: bool = False) -> int:
         """Exporte un DPGF vers CSV"""
-        articles = self.get_articles_dpgf(chantier_id)
-        structure = self.get_structure_dpgf(chantier_id)
-        taux = self.get_taux_horaires()
+        # Produits lies de tous les articles en une requete (colonne PRODUITS_LIES)
+        produits_par_article = {} if version_client else self.get_produits_lies_chantier(chantier_id)
 
         with open(filepath, 'w', encoding='utf-8-sig', newline='') as f:
             if version_client:
@@ -2317,49 +3845,19 @@ class Database:
             writer = csv.writer(f, delimiter=';')
             writer.writerow(headers)
 
-            # Fusionner structure et articles pour export dans le bon ordre (fix issue #24)
-            items_list = []
-            for s in structure:
-                items_list.append({
-                    'type': 'structure',
-                    'code': s['code'] or '',
-                    'niveau': s['niveau'],
-                    'designation': s['designation'],
-                    'ordre': s['ordre']
-                })
-            for a in articles:
-                items_list.append({
-                    'type': 'article',
-                    'code': a['code'] or '',
-                    'data': a
-                })
-
-            # Trier par code pour respecter la hierarchie
-            def sort_key(item):
-                code = item['code'] or ''
-                code_normalized = code.replace('-', '.').replace('/', '.')
-                parts = code_normalized.split('.')
-                key_parts = []
-                for p in parts:
-                    try:
-                        key_parts.append((0, int(p), ''))
-                    except ValueError:
-                        key_parts.append((1, 0, p))
-                return (key_parts, item.get('niveau', 4), item['type'] == 'article')
-
-            items_list.sort(key=sort_key)
+            # Structure et articles deja fusionnes et ordonnes par la base (fix issue #24)
+            nb_articles = 0
 
             # Ecrire les items dans l'ordre
-            for item in items_list:
+            for item in self.iter_lignes_dpgf(chantier_id):
                 if item['type'] == 'structure':
                     if version_client:
-                        writer.writerow([item['code'], item['designation'], '', '', '', ''])
+                        writer.writerow([item['code'] or '', item['designation'], '', '', '', ''])
                     else:
-                        writer.writerow([item['code'], item['niveau'], item['designation']] + [''] * 19)
+                        writer.writerow([item['code'] or '', item['niveau'], item['designation']] + [''] * 19)
                 else:
-                    a = item['data']
-                    produits_lies = self.get_produits_article(a['id'])
-                    produits_str = ' | '.join([f"{p['produit_designation']} x{p['quantite']}" for p in produits_lies])
+                    a = item
+                    nb_articles += 1
 
                     if version_client:
                         writer.writerow([
@@ -2376,6 +3874,8 @@ class Database:
                         cout_produits = a['cout_materiaux'] - fournitures_add
                         prix_manuel = a.get('prix_manuel')
                         prix_manuel_str = f"{prix_manuel:.2f}" if prix_manuel is not None else ''
+                        produits_lies = produits_par_article.get(a['id'], [])
+                        produits_str = ' | '.join([f"{p['produit_designation']} x{p['quantite']}" for p in produits_lies])
 
                         writer.writerow([
                             a['code'],
@@ -2402,11 +3902,12 @@ class Database:
                             produits_str
                         ])
 
-        return len(articles)
+        return nb_articles
 
     def export_dpgf_files(self, chantier_id: int, export_dir: str,
                          include_fiches: bool = True, include_devis: bool = True,
-                         naming_options: dict = None) -> tuple:
+                         naming_options: dict = None, zip_path: str = None,
+                         progress_callback=None) -> tuple:
         """
         Exporte les fichiers PDF (fiches techniques et devis) des produits lies aux articles DPGF
 
@@ -2419,38 +3920,42 @@ class Database:
                 - prefix_code_article: Prefixer avec le code article DPGF
                 - include_id_produit: Inclure l'ID du produit
                 - include_designation: Inclure la designation du produit
+            zip_path: Regrouper les PDFs dans cette archive ZIP (optionnel)
+            progress_callback: Fonction callback(octets_lus, octets_total) de la copie
 
         Returns:
             Tuple (nb_fiches_copiees, nb_devis_copies)
         """
-        # Recuperer tous les produits lies aux articles du chantier
-        articles = self.get_articles_dpgf(chantier_id)
+        # Recuperer tous les produits lies aux articles du chantier (une requete)
+        produits_par_article = self.get_produits_lies_chantier(chantier_id)
 
         # Creer le mapping produit_id -> code_article (issue #22)
         # Un produit peut etre lie a plusieurs articles, on prend le premier code trouve
         produit_to_code_article = {}
-        produits_ids = set()
 
-        for article in articles:
-            produits_lies = self.get_produits_article(article['id'])
+        for article in self.iter_articles_dpgf(chantier_id):
             code_article = article.get('code', '') or ''
-            for p in produits_lies:
+            for p in produits_par_article.get(article['id'], []):
                 produit_id = p['produit_id']
-                produits_ids.add(produit_id)
                 # Ne pas ecraser si deja defini (garder le premier code)
                 if produit_id not in produit_to_code_article and code_article:
                     produit_to_code_article[produit_id] = code_article
 
-        # Recuperer les informations completes des produits
-        produits = []
-        for produit_id in produits_ids:
-            produit = self.get_produit(produit_id)
-            if produit:
-                produits.append(produit)
+        # Recuperer les informations completes des produits en une requete
+        cursor = self.conn.cursor()
+        cursor.execute('''
+            SELECT * FROM produits WHERE id IN (
+                SELECT ap.produit_id FROM article_produits ap
+                JOIN prix_marche pm ON ap.prix_marche_id = pm.id
+                WHERE pm.chantier_id = ?
+            )
+        ''', (chantier_id,))
+        produits = [dict(row) for row in cursor.fetchall()]
 
         # Utiliser la methode existante de copie avec les nouvelles options
         return self._copy_pdf_files(produits, export_dir, include_fiches, include_devis,
-                                   produit_to_code_article, naming_options)
+                                   produit_to_code_article, naming_options,
+                                   zip_path=zip_path, progress_callback=progress_callback)
 
     def export_dpgf_odoo(self, chantier_id: int, filepath: str) -> int:
         """
@@ -2473,7 +3978,6 @@ class Database:
         if not chantier:
             return 0
 
-        articles = self.get_articles_dpgf(chantier_id)
         nom_client = chantier.get('nom_client', '') or chantier.get('nom', '')
         reference = chantier.get('lot', '') or ''
 
@@ -2492,9 +3996,10 @@ class Database:
             ]
             writer.writerow(headers)
 
-            # Ecrire les articles
+            # Ecrire les articles au fil de la lecture
             first_article = True
-            for article in articles:
+            count = 0
+            for article in self.iter_articles_dpgf(chantier_id):
                 # Formatter le taux de TVA pour Odoo
                 taux_tva = article.get('taux_tva', 20) or 20
                 if taux_tva == int(taux_tva):
@@ -2530,8 +4035,9 @@ class Database:
                     ])
 
                 first_article = False
+                count += 1
 
-        return len(articles)
+        return count
 
     def create_dpgf_template(self, filepath: str):
         """Cree un template DPGF CSV vierge"""
@@ -2587,7 +4093,9 @@ class Database:
         return stats
 
     def close(self):
-        """Ferme la connexion"""
+        """Ferme la connexion (et les lecteurs du pool)"""
+        if self.pool is not None:
+            self.pool.close()
         self.conn.close()
 
     def __enter__(self):
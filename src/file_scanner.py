@@ -0,0 +1,192 @@
+"""
+DestriChiffrage - Index des fichiers PDF
+========================================
+Tient a jour la table fichiers_meta (existence, taille, date, empreinte) des
+fiches techniques et devis references par les produits, hors du thread Tk :
+- un seul os.scandir par dossier (les infos de fichier viennent du listing,
+  pas d'un stat par fichier : sur un partage reseau chaque acces coute 5-50 ms)
+- dossier inchange depuis le dernier passage (date du dossier) : l'existence
+  des fichiers l'est aussi, un dossier ne contenant que des liens casses n'est
+  pas relu ; un fichier reecrit sur place ne change pas la date du dossier, sa
+  taille et sa date sont donc toujours comparees a celles du listing
+- nouveau passage periodique (surveillance legere, sans dependance externe)
+
+Le passage lit la base sur le lecteur du thread (WAL) et n'ecrit, par
+l'ecrivain unique de la base, que s'il a trouve des changements : un passage
+sans changement n'invalide ni le cache des lectures ni celui du chiffrage.
+
+Le thread de l'interface lit ensuite l'etat des fichiers en base, sans
+toucher au disque (badges de liens casses, filtre "PDF valide").
+"""
+
+import os
+import sqlite3
+import threading
+from typing import Callable, Dict, List, Optional, Tuple, TYPE_CHECKING
+
+from blob_store import hash_file
+
+if TYPE_CHECKING:
+    from database import Database
+
+
+SCAN_INTERVAL = 300  # Secondes entre deux passages automatiques
+
+
+def scan_directory(directory: str) -> Optional[Dict[str, Tuple[int, float]]]:
+    """
+    Liste les fichiers d'un dossier avec taille et date de modification
+
+    Returns:
+        Dictionnaire nom -> (taille, mtime), None si le dossier est inaccessible
+    """
+    entries = {}
+    try:
+        with os.scandir(directory) as it:
+            for entry in it:
+                try:
+                    if entry.is_file():
+                        # Windows : stat() issu du listing, sans acces supplementaire
+                        info = entry.stat()
+                        entries[os.path.normcase(entry.name)] = (info.st_size, info.st_mtime)
+                except OSError:
+                    continue
+    except OSError:
+        return None
+    return entries
+
+
+class FileScanner:
+    """Indexe en arriere-plan les fichiers references par les produits"""
+
+    def __init__(self, db: 'Database', interval: float = SCAN_INTERVAL,
+                 compute_hash: bool = False, on_scan: Callable = None):
+        """
+        Initialise le scanner
+
+        Args:
+            db: Base principale (chemin de la base et dossier data)
+            interval: Secondes entre deux passages (0 = un seul passage)
+            compute_hash: Calculer l'empreinte SHA-256 des fichiers nouveaux ou modifies
+            on_scan: Callback(nb_changements) appele dans le thread du scanner
+                     apres chaque passage
+        """
+        self.db = db
+        self.interval = interval
+        self.compute_hash = compute_hash
+        self.on_scan = on_scan
+
+        self._dir_mtimes: Dict[str, float] = {}
+        self._wake = threading.Event()
+        self._closed = False
+        self._thread = None
+
+    def start(self):
+        """Demarre le thread de scan"""
+        self._thread = threading.Thread(target=self._worker, name="pdf-file-scanner")
+        self._thread.daemon = True
+        self._thread.start()
+
+    def scan_now(self):
+        """Demande un nouveau passage immediat (ex. apres un import)"""
+        self._dir_mtimes.clear()
+        self._wake.set()
+
+    def close(self):
+        """Arrete le thread de scan"""
+        self._closed = True
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join(timeout=2)
+
+    def _worker(self):
+        """Boucle du thread : un passage, puis attente de l'intervalle"""
+        try:
+            while not self._closed:
+                try:
+                    changes = self.scan(self.db.pool.get_reader())
+                    if self.on_scan and not self._closed:
+                        self.on_scan(changes)
+                except sqlite3.Error as e:
+                    print(f"Erreur index fichiers: {e}")
+                if not self.interval:
+                    return
+                self._wake.wait(self.interval)
+                self._wake.clear()
+        finally:
+            self.db.pool.release_reader()
+
+    # ==================== PASSAGE ====================
+
+    def scan(self, reader: 'Database' = None) -> int:
+        """
+        Met a jour fichiers_meta pour tous les chemins references
+
+        Args:
+            reader: Base utilisee pour les lectures (defaut : base principale) ;
+                    les ecritures passent toujours par la base principale
+
+        Returns:
+            Nombre d'entrees ajoutees, modifiees ou supprimees
+        """
+        reader = reader or self.db
+        if not os.path.isdir(self.db.data_dir):
+            return 0  # Partage reseau indisponible : ne pas marquer tous les liens casses
+        cursor = reader.conn.cursor()
+        cursor.execute('''
+            SELECT fiche_technique FROM produits WHERE fiche_technique IS NOT NULL AND fiche_technique != ''
+            UNION
+            SELECT devis_fournisseur FROM produits WHERE devis_fournisseur IS NOT NULL AND devis_fournisseur != ''
+        ''')
+        chemins = [row[0] for row in cursor.fetchall()]
+
+        cursor.execute("SELECT chemin, existe, taille, mtime, sha256 FROM fichiers_meta")
+        known = {row[0]: row[1:] for row in cursor.fetchall()}
+
+        # Regrouper par dossier : un seul listing par dossier
+        by_dir: Dict[str, List[Tuple[str, str]]] = {}
+        for chemin in chemins:
+            absolute = self.db.resolve_fiche_path(chemin)
+            by_dir.setdefault(os.path.dirname(absolute), []).append((chemin, absolute))
+
+        updates = []
+        for directory, files in by_dir.items():
+            if self._closed:
+                return 0
+            try:
+                dir_mtime = os.stat(directory).st_mtime
+            except OSError:
+                dir_mtime = None
+            # Dossier inchange : aucun fichier cree ni supprime. Seuls les fichiers
+            # absents peuvent etre repris sans listing (un fichier present a pu etre
+            # reecrit sur place sans changer la date du dossier)
+            if dir_mtime is not None and self._dir_mtimes.get(directory) == dir_mtime \
+                    and all(chemin in known and not known[chemin][0] for chemin, _ in files):
+                continue
+
+            listing = scan_directory(directory) if dir_mtime is not None else None
+            for chemin, absolute in files:
+                info = listing.get(os.path.normcase(os.path.basename(absolute))) if listing else None
+                if info is None:
+                    state = (0, None, None, None)
+                else:
+                    previous = known.get(chemin)
+                    sha256 = previous[3] if previous and previous[1:3] == info else None
+                    if sha256 is None and self.compute_hash:
+                        try:
+                            sha256 = hash_file(absolute)
+                        except OSError:
+                            pass
+                    state = (1, info[0], info[1], sha256)
+                if known.get(chemin) != state:
+                    updates.append((chemin,) + state)
+            if dir_mtime is not None:
+                self._dir_mtimes[directory] = dir_mtime
+
+        obsolete = sorted(known.keys() - set(chemins))
+
+        # Aucune ecriture sans changement (data_version et caches intacts)
+        if updates or obsolete:
+            self.db.save_fichiers_meta(updates, obsolete)
+        return len(updates) + len(obsolete)
+
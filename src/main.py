@@ -6,6 +6,7 @@ Application de chiffrage et approvisionnement professionnel
 
 import tkinter as tk
 from tkinter import ttk, messagebox, filedialog
+import multiprocessing
 import os
 import sys
 
@@ -59,4 +60,6 @@ def main():
 
 
 if __name__ == "__main__":
+    # Requis pour le pool de processus de l'import CSV dans l'executable PyInstaller
+    multiprocessing.freeze_support()
     main()
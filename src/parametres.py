@@ -0,0 +1,74 @@
+"""
+DestriChiffrage - Instantane des parametres
+===========================================
+La table parametres est lue une fois et convertie en valeurs typees
+(marges, TVA, taux horaires). L'instantane est immuable : un recalcul en masse
+qui le recoit travaille avec un jeu de taux coherent de bout en bout.
+Database le recharge apres chaque set_parametre (voir Database.parametres).
+"""
+
+from types import MappingProxyType
+from typing import Dict, Optional
+
+
+POSTES_MO = ('conception', 'fabrication', 'pose')
+
+# Taux horaires par defaut (cout entreprise, prix de vente) en EUR/h
+DEFAULT_TAUX = {
+    'conception': (35.0, 45.0),
+    'fabrication': (28.0, 38.0),
+    'pose': (32.0, 42.0),
+}
+
+
+def _to_float(valeur: Optional[str], default: float) -> float:
+    """Conversion tolerante (virgule decimale, valeur vide ou invalide)"""
+    if valeur is None or str(valeur).strip() == '':
+        return default
+    try:
+        return float(str(valeur).replace(',', '.'))
+    except ValueError:
+        return default
+
+
+class ParametresSnapshot:
+    """Valeurs typees de la table parametres a un instant donne (lecture seule)"""
+
+    __slots__ = ('_valeurs', 'marge', 'marge_marche', 'tva', 'taux_cout', 'taux_vente')
+
+    def __init__(self, valeurs: Dict[str, str]):
+        """
+        Construit l'instantane
+
+        Args:
+            valeurs: Dictionnaire cle -> valeur (texte) de la table parametres
+        """
+        set_attr = object.__setattr__
+        set_attr(self, '_valeurs', dict(valeurs))
+        set_attr(self, 'marge', _to_float(valeurs.get('marge'), 20.0))
+        set_attr(self, 'marge_marche', _to_float(valeurs.get('marge_marche'), 25.0))
+        set_attr(self, 'tva', _to_float(valeurs.get('tva'), 20.0))
+        set_attr(self, 'taux_cout', MappingProxyType({
+            poste: _to_float(valeurs.get(f'taux_cout_{poste}'), cout)
+            for poste, (cout, _) in DEFAULT_TAUX.items()}))
+        set_attr(self, 'taux_vente', MappingProxyType({
+            poste: _to_float(valeurs.get(f'taux_vente_{poste}'), vente)
+            for poste, (_, vente) in DEFAULT_TAUX.items()}))
+
+    def __setattr__(self, name, value):
+        raise AttributeError("Instantane des parametres en lecture seule")
+
+    def get(self, cle: str, default: str = None) -> Optional[str]:
+        """Valeur brute (texte) d'un parametre"""
+        return self._valeurs.get(cle, default)
+
+    def taux_horaires(self) -> Dict[str, Dict[str, float]]:
+        """Taux horaires au format de Database.get_taux_horaires (copie)"""
+        return {poste: {'cout': self.taux_cout[poste], 'vente': self.taux_vente[poste]}
+                for poste in POSTES_MO}
+
+    def sql_params(self) -> Dict[str, float]:
+        """Taux horaires en parametres nommes (:cout_pose, :vente_pose, ...) pour les requetes"""
+        params = {f'cout_{poste}': taux for poste, taux in self.taux_cout.items()}
+        params.update({f'vente_{poste}': taux for poste, taux in self.taux_vente.items()})
+        return params
@@ -0,0 +1,253 @@
+"""
+DestriChiffrage - Copie des dossiers PDF
+========================================
+Moteur de copie des fiches techniques et devis (export panier et DPGF) :
+- chaque fichier source n'est lu qu'une fois (dedoublonnage par chemin, puis
+  par contenu pour les fichiers de meme taille)
+- copie legere (reflink) quand la source et la destination sont sur le meme
+  volume ; les doublons du dossier exporte sont des copies independantes
+  (reflink si possible) : modifier un fichier exporte ne touche pas les autres
+- copies en parallele sur un pool de threads borne (latence du NAS)
+- progression en octets
+- ecriture dans une archive ZIP en flux, bloc par bloc (aucun fichier entier en memoire)
+"""
+
+import os
+import shutil
+import sys
+import threading
+import zipfile
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Callable, Dict, List, Sequence, Tuple
+
+from blob_store import hash_file
+
+
+COPY_WORKERS = 4  # Copies simultanees
+COPY_BUFFER = 1024 * 1024  # Taille des blocs lus/ecrits
+PROGRESS_INTERVAL = 0.1  # Secondes entre deux appels de progression
+
+_FICLONE = 0x40049409  # ioctl Linux (btrfs, xfs) : copie par reference
+
+
+# ==================== SOURCES ====================
+
+def _file_key(path: str) -> str:
+    """Cle de dedoublonnage par chemin (casse et liens resolus)"""
+    return os.path.normcase(os.path.realpath(path))
+
+
+def group_sources(files: Sequence[Tuple[str, str]]) -> List[Tuple[str, int, List[str]]]:
+    """
+    Regroupe les fichiers a copier par contenu source
+
+    Args:
+        files: Couples (chemin source, nom de destination relatif)
+
+    Returns:
+        Liste de (chemin source, taille, noms de destination), une entree par
+        contenu distinct ; les sources absentes sont ignorees
+    """
+    by_path: Dict[str, Tuple[str, int, List[str]]] = {}
+    for src, dst in files:
+        key = _file_key(src)
+        entry = by_path.get(key)
+        if entry is None:
+            try:
+                size = os.path.getsize(src)
+            except OSError:
+                continue
+            entry = by_path[key] = (src, size, [])
+        if dst not in entry[2]:
+            entry[2].append(dst)
+
+    # Meme contenu sous des chemins differents : seules les tailles en
+    # collision sont hachees
+    by_size: Dict[int, List[Tuple[str, int, List[str]]]] = {}
+    for entry in by_path.values():
+        by_size.setdefault(entry[1], []).append(entry)
+
+    groups = []
+    for size, entries in by_size.items():
+        if len(entries) == 1:
+            groups.extend(entries)
+            continue
+        by_hash: Dict[str, Tuple[str, int, List[str]]] = {}
+        for src, _, names in entries:
+            try:
+                digest = hash_file(src)
+            except OSError:
+                continue
+            if digest in by_hash:
+                by_hash[digest][2].extend(name for name in names if name not in by_hash[digest][2])
+            else:
+                by_hash[digest] = (src, size, list(names))
+        groups.extend(by_hash.values())
+    return groups
+
+
+# ==================== COPIE ====================
+
+def _reflink(src: str, dst: str) -> bool:
+    """Copie par reference (meme volume, systeme de fichiers compatible)"""
+    if not sys.platform.startswith('linux'):
+        return False
+    import fcntl
+    try:
+        if os.stat(src).st_dev != os.stat(os.path.dirname(dst)).st_dev:
+            return False
+        with open(src, 'rb') as fsrc, open(dst, 'wb') as fdst:
+            fcntl.ioctl(fdst.fileno(), _FICLONE, fsrc.fileno())
+        shutil.copystat(src, dst)
+        return True
+    except OSError:
+        try:
+            os.remove(dst)
+        except OSError:
+            pass
+    return False
+
+
+def _remove(path: str):
+    """Supprime une destination existante (ne pas ecrire a travers un ancien lien physique)"""
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+class _Progress:
+    """Compteur d'octets partage entre les threads de copie"""
+
+    def __init__(self, total: int):
+        self.total = total
+        self.done = 0
+        self._lock = threading.Lock()
+
+    def add(self, count: int):
+        with self._lock:
+            self.done += count
+
+
+def _copy_to_dir(src: str, size: int, names: List[str], export_dir: str,
+                 progress: _Progress) -> List[str]:
+    """Copie un contenu vers sa premiere destination, puis les doublons depuis celle-ci"""
+    first = os.path.join(export_dir, names[0])
+    os.makedirs(os.path.dirname(first), exist_ok=True)
+    _remove(first)
+    if _reflink(src, first):
+        progress.add(size)
+    else:
+        with open(src, 'rb') as fsrc, open(first, 'wb') as fdst:
+            while True:
+                block = fsrc.read(COPY_BUFFER)
+                if not block:
+                    break
+                fdst.write(block)
+                progress.add(len(block))
+        shutil.copystat(src, first)
+
+    written = [names[0]]
+    for name in names[1:]:
+        dst = os.path.join(export_dir, name)
+        os.makedirs(os.path.dirname(dst), exist_ok=True)
+        _remove(dst)
+        # Doublon : copie locale (pas de relecture de la source), jamais un lien physique
+        if not _reflink(first, dst):
+            shutil.copy2(first, dst)
+        written.append(name)
+    return written
+
+
+def _write_to_zip(archive: zipfile.ZipFile, src: str, size: int, names: List[str],
+                  progress: _Progress) -> List[str]:
+    """Ecrit un contenu dans l'archive en flux, une entree par nom de destination"""
+    for index, name in enumerate(names):
+        with open(src, 'rb') as fsrc, archive.open(name.replace(os.sep, '/'), 'w',
+                                                   force_zip64=size > zipfile.ZIP64_LIMIT) as fdst:
+            shutil.copyfileobj(fsrc, fdst, COPY_BUFFER)
+        if index == 0:
+            progress.add(size)  # Doublons : relus depuis le cache du systeme
+    return list(names)
+
+
+def _bundle_to_zip(groups, zip_path: str, progress: _Progress, progress_callback: Callable,
+                   written: List[str], errors: List[Tuple[str, str]]):
+    """Export ZIP : un seul ecrivain, entrees ecrites en flux dans le thread appelant"""
+    with zipfile.ZipFile(zip_path, 'w', zipfile.ZIP_STORED, allowZip64=True) as archive:
+        for src, size, names in groups:
+            try:
+                written.extend(_write_to_zip(archive, src, size, names, progress))
+            except Exception as e:
+                print(f"Erreur copie {src}: {e}")
+                errors.append((src, str(e)))
+            if progress_callback:
+                progress_callback(progress.done, progress.total)
+
+
+def _bundle_to_dir(groups, export_dir: str, progress: _Progress, progress_callback: Callable,
+                   written: List[str], errors: List[Tuple[str, str]], workers: int):
+    """Export dossier : copies en parallele, progression suivie dans le thread appelant"""
+    os.makedirs(export_dir, exist_ok=True)
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        pending = {}
+        queue = list(groups)
+        queue.reverse()
+        # Fenetre bornee : pas de file de taches proportionnelle au panier
+        window = max(1, workers) * 2
+        while queue or pending:
+            while queue and len(pending) < window:
+                group = queue.pop()
+                src, size, names = group
+                pending[pool.submit(_copy_to_dir, src, size, names, export_dir, progress)] = group
+
+            finished, _ = wait(pending, timeout=PROGRESS_INTERVAL, return_when=FIRST_COMPLETED)
+            for future in finished:
+                src = pending.pop(future)[0]
+                try:
+                    written.extend(future.result())
+                except Exception as e:
+                    print(f"Erreur copie {src}: {e}")
+                    errors.append((src, str(e)))
+            if progress_callback:
+                progress_callback(progress.done, progress.total)
+
+
+def copy_bundle(files: Sequence[Tuple[str, str]], export_dir: str = None, zip_path: str = None,
+                progress_callback: Callable = None, workers: int = COPY_WORKERS) -> Dict:
+    """
+    Copie un ensemble de fichiers vers un dossier ou une archive ZIP
+
+    Args:
+        files: Couples (chemin source, nom de destination relatif, ex.
+               'Fiches_techniques/12_Porte_fiche.pdf')
+        export_dir: Dossier de destination (ignore si zip_path est fourni)
+        zip_path: Archive ZIP a creer (les PDF sont stockes sans recompression)
+        progress_callback: Fonction callback(octets_lus, octets_total), appelee
+                           dans le thread appelant
+        workers: Nombre de copies simultanees (export dossier)
+
+    Returns:
+        Dictionnaire {'fichiers': noms ecrits, 'octets': octets lus,
+                      'doublons': destinations servies sans nouvelle lecture,
+                      'erreurs': liste de (source, message)}
+    """
+    groups = group_sources(files)
+    progress = _Progress(sum(size for _, size, _ in groups))
+    written: List[str] = []
+    errors: List[Tuple[str, str]] = []
+
+    if zip_path:
+        _bundle_to_zip(groups, zip_path, progress, progress_callback, written, errors)
+    else:
+        _bundle_to_dir(groups, export_dir, progress, progress_callback, written, errors, workers)
+
+    if progress_callback:
+        progress_callback(progress.total, progress.total)
+
+    return {
+        'fichiers': written,
+        'octets': progress.done,
+        'doublons': len(written) - len(groups) + len(errors),
+        'erreurs': errors,
+    }
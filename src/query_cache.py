@@ -0,0 +1,154 @@
+"""
+DestriChiffrage - Cache des lectures
+====================================
+Memoisation des methodes de lecture de Database :
+- cle = nom de la methode + arguments normalises (positionnels ou nommes,
+  valeurs par defaut comprises)
+- eviction LRU bornee en nombre d'entrees et en nombre total de lignes
+  (une recherche peut renvoyer des milliers de produits)
+- chaque entree porte la generation d'ecriture de la base au moment de la
+  lecture : toute ecriture (de cette connexion ou d'une autre) la rend
+  obsolete, une entree perimee n'est jamais servie
+- compteurs de succes / echecs
+"""
+
+import functools
+import inspect
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Optional
+
+
+CACHE_SIZE = 256  # Nombre maximal de resultats conserves
+CACHE_MAX_ROWS = 20000  # Nombre maximal de lignes conservees, tous resultats confondus
+
+
+def _row_count(value: Any) -> int:
+    """Poids d'un resultat dans le cache : nombre de lignes (1 pour une valeur simple)"""
+    if isinstance(value, list):
+        return max(1, len(value))
+    if isinstance(value, dict):
+        return max(1, sum(_row_count(v) for v in value.values() if isinstance(v, (list, dict))))
+    return 1
+
+
+def _copy_result(value: Any) -> Any:
+    """Copie d'un resultat (les appelants modifient parfois les dictionnaires recus)"""
+    if isinstance(value, dict):
+        return {k: _copy_result(v) for k, v in value.items()}
+    if isinstance(value, list):
+        return [_copy_result(v) for v in value]
+    return value
+
+
+class QueryCache:
+    """Cache LRU de resultats de requetes, invalide par generation"""
+
+    def __init__(self, maxsize: int = CACHE_SIZE, max_rows: int = CACHE_MAX_ROWS):
+        """
+        Initialise le cache
+
+        Args:
+            maxsize: Nombre maximal d'entrees (les moins recemment utilisees sont evincees)
+            max_rows: Nombre maximal de lignes, toutes entrees confondues ; un
+                      resultat plus gros n'est pas conserve
+        """
+        self.maxsize = maxsize
+        self.max_rows = max_rows
+        self.hits = 0
+        self.misses = 0
+        self.rows = 0  # Lignes actuellement conservees
+        self._entries: 'OrderedDict[Hashable, tuple]' = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable, generation: Hashable) -> tuple:
+        """
+        Recherche un resultat
+
+        Returns:
+            (trouve, resultat) ; une entree d'une autre generation est supprimee
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] == generation:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return True, entry[1]
+            if entry is not None:
+                self._remove(key)
+            self.misses += 1
+            return False, None
+
+    def put(self, key: Hashable, generation: Hashable, value: Any):
+        """Enregistre un resultat (eviction LRU au-dela de maxsize entrees ou max_rows lignes)"""
+        rows = _row_count(value)
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            if rows > self.max_rows:
+                return  # Trop gros : relu a chaque appel plutot que de vider le cache
+            self._entries[key] = (generation, value, rows)
+            self.rows += rows
+            while len(self._entries) > self.maxsize or self.rows > self.max_rows:
+                self._remove(next(iter(self._entries)))
+
+    def _remove(self, key: Hashable):
+        """Supprime une entree (verrou deja pris)"""
+        self.rows -= self._entries.pop(key)[2]
+
+    def clear(self):
+        """Vide le cache (les compteurs sont conserves)"""
+        with self._lock:
+            self._entries.clear()
+            self.rows = 0
+
+    def stats(self) -> Dict[str, Any]:
+        """Compteurs du cache : succes, echecs, taux de succes, taille et lignes"""
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'ratio': self.hits / total if total else 0.0,
+                'taille': len(self._entries),
+                'lignes': self.rows,
+            }
+
+
+def cached_query(method: Callable) -> Callable:
+    """
+    Decorateur des methodes de lecture de Database
+
+    L'instance doit fournir query_cache (QueryCache ou None pour desactiver)
+    et cache_generation() (identifiant de l'etat de la base).
+    """
+    signature = inspect.signature(method)
+
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        cache: Optional[QueryCache] = self.query_cache
+        if cache is None:
+            return method(self, *args, **kwargs)
+
+        # Cle normalisee : f(a, b=1) et f(a) designent la meme lecture
+        bound = signature.bind(self, *args, **kwargs)
+        bound.apply_defaults()
+        arguments = []
+        for name, value in list(bound.arguments.items())[1:]:
+            if isinstance(value, dict):
+                value = tuple(sorted(value.items()))
+            arguments.append((name, value))
+        key = (method.__name__, tuple(arguments))
+        try:
+            hash(key)
+        except TypeError:
+            return method(self, *args, **kwargs)  # Argument non hachable : pas de cache
+
+        generation = self.cache_generation()
+        found, result = cache.get(key, generation)
+        if not found:
+            result = method(self, *args, **kwargs)
+            cache.put(key, generation, result)
+        return _copy_result(result)
+
+    return wrapper
@@ -0,0 +1,140 @@
+"""
+DestriChiffrage - Simulation de chiffrage
+=========================================
+Evaluation "et si" de la marge et des taux horaires d'un chantier, en memoire,
+sans rien ecrire en base (set_chantier_marge_projet / set_parametre recalculent
+et reecrivent tous les articles).
+
+Le prix d'un article est lineaire en la marge et en chaque taux horaire :
+    prix_total = quantite * (materiaux * (1 + marge / 100) + somme(heures * taux_vente))
+Les articles sont donc reduits une fois pour toutes, par lot, a quelques sommes
+(materiaux, heures par poste, prix manuels) ; chaque scenario s'evalue ensuite
+en temps constant, quel que soit le nombre d'articles.
+"""
+
+from typing import Dict, Iterable, List, Optional
+
+from parametres import POSTES_MO, ParametresSnapshot
+
+
+class _Sommes:
+    """Sommes d'un groupe d'articles (un lot ou le chantier entier)"""
+
+    __slots__ = ('qte_materiaux', 'qte_materiaux_marge', 'qte_heures', 'prix_manuels',
+                 'materiaux', 'heures', 'nb_articles')
+
+    def __init__(self):
+        self.qte_materiaux = 0.0        # Articles a prix calcule : somme quantite * materiaux
+        self.qte_materiaux_marge = 0.0  # ... ponderee par la marge propre de chaque article
+        self.qte_heures = dict.fromkeys(POSTES_MO, 0.0)  # ... somme quantite * heures
+        self.prix_manuels = 0.0         # Articles a prix manuel : somme quantite * prix
+        self.materiaux = 0.0            # Tous les articles, par unite (voir get_chantier_recap)
+        self.heures = dict.fromkeys(POSTES_MO, 0.0)
+        self.nb_articles = 0
+
+    def ajouter(self, article: Dict):
+        """Ajoute un article aux sommes"""
+        quantite = article.get('quantite') or 0
+        materiaux = article.get('cout_materiaux') or 0
+        heures = {poste: article.get(f'temps_{poste}') or 0 for poste in POSTES_MO}
+
+        self.nb_articles += 1
+        self.materiaux += materiaux
+        for poste in POSTES_MO:
+            self.heures[poste] += heures[poste]
+
+        prix_manuel = article.get('prix_manuel')
+        if prix_manuel is not None:
+            self.prix_manuels += quantite * prix_manuel
+            return
+        self.qte_materiaux += quantite * materiaux
+        self.qte_materiaux_marge += quantite * materiaux * (article.get('marge_pct') or 0) / 100.0
+        for poste in POSTES_MO:
+            self.qte_heures[poste] += quantite * heures[poste]
+
+    def prix_total(self, marge: Optional[float], taux_vente: Dict[str, float]) -> float:
+        """Prix total HT (marge None = marge propre de chaque article)"""
+        marge_materiaux = self.qte_materiaux_marge if marge is None else self.qte_materiaux * marge / 100.0
+        vente_mo = sum(self.qte_heures[poste] * taux_vente[poste] for poste in POSTES_MO)
+        return self.qte_materiaux + marge_materiaux + vente_mo + self.prix_manuels
+
+
+class SimulationChantier:
+    """Simulation de marge et de taux horaires sur les articles d'un chantier"""
+
+    def __init__(self, articles: Iterable[Dict], parametres: ParametresSnapshot,
+                 lots: Dict[str, str] = None):
+        """
+        Reduit les articles en sommes par lot (seul passage sur les articles)
+
+        Args:
+            articles: Articles DPGF (champs de prix_marche)
+            parametres: Taux horaires de reference (instantane des parametres)
+            lots: Code de lot -> designation (structure de niveau 1, optionnel)
+        """
+        self.parametres = parametres
+        self.lots = dict(lots or {})
+        self._total = _Sommes()
+        self._par_lot: Dict[str, _Sommes] = {}
+
+        for article in articles:
+            self._total.ajouter(article)
+            self._par_lot.setdefault(lot_article(article.get('code')), _Sommes()).ajouter(article)
+
+    @property
+    def nb_articles(self) -> int:
+        """Nombre d'articles simules"""
+        return self._total.nb_articles
+
+    def evaluer(self, marge: Optional[float] = None, taux_vente: Dict[str, float] = None,
+                taux_cout: Dict[str, float] = None) -> Dict:
+        """
+        Evalue un scenario
+
+        Args:
+            marge: Marge produits appliquee a tous les articles (None = marges actuelles)
+            taux_vente: Taux de vente par poste a remplacer (ex. {'pose': 45})
+            taux_cout: Taux de cout par poste a remplacer
+
+        Returns:
+            Dict avec: marge, prix_total, cout_materiaux, cout_mo, cout_revient,
+            marge_globale (memes definitions que Database.get_chantier_recap),
+            lots (code de lot -> prix total HT)
+        """
+        vente = dict(self.parametres.taux_vente, **(taux_vente or {}))
+        cout = dict(self.parametres.taux_cout, **(taux_cout or {}))
+
+        total = self._total
+        prix_total = total.prix_total(marge, vente)
+        cout_revient = total.materiaux + sum(total.heures[poste] * cout[poste] for poste in POSTES_MO)
+
+        return {
+            'marge': marge,
+            'prix_total': prix_total,
+            'cout_materiaux': total.materiaux,
+            'cout_mo': sum(total.heures[poste] * vente[poste] for poste in POSTES_MO),
+            'cout_revient': cout_revient,
+            'marge_globale': ((prix_total - cout_revient) / cout_revient * 100) if cout_revient > 0 else 0,
+            'lots': {lot: sommes.prix_total(marge, vente) for lot, sommes in self._par_lot.items()},
+        }
+
+    def evaluer_marges(self, marges: Iterable[float], taux_vente: Dict[str, float] = None,
+                       taux_cout: Dict[str, float] = None) -> List[Dict]:
+        """Evalue une serie de marges candidates (memes taux pour toutes)"""
+        return [self.evaluer(marge, taux_vente, taux_cout) for marge in marges]
+
+    def sensibilite(self, marge: float, ecart: int = 10, pas: int = 1,
+                    taux_vente: Dict[str, float] = None, taux_cout: Dict[str, float] = None) -> List[Dict]:
+        """
+        Table de sensibilite autour d'une marge (ex. -10 a +10 points par pas de 1)
+
+        Returns:
+            Liste de scenarios (voir evaluer), marges croissantes
+        """
+        marges = [marge + delta for delta in range(-ecart, ecart + 1, pas)]
+        return self.evaluer_marges(marges, taux_vente, taux_cout)
+
+
+def lot_article(code: Optional[str]) -> str:
+    """Code du lot d'un article : premier segment du code DPGF ('2.1.3' -> '2')"""
+    return (code or '').strip().replace('-', '.').replace('/', '.').strip('.').split('.')[0]
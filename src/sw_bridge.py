@@ -439,79 +439,81 @@ class SolidWorksBridge:
 
         stats = {'created': 0, 'updated': 0, 'skipped': 0, 'errors': 0}
 
-        for comp in components:
-            try:
-                code = comp.get('code', '').strip()
-                if not code:
-                    stats['skipped'] += 1
-                    continue
-
-                # Chercher par reference dans la BDD
-                existing = self.db.search_produits(
-                    terme=code,
-                    categorie=DEFAULT_HARDWARE_CATEGORY,
-                    actif_only=True,
-                    limit=10
-                )
-
-                # Filtrer pour correspondance exacte de reference
-                match = None
-                for prod in existing:
-                    if prod.get('reference', '').strip().upper() == code.strip().upper():
-                        match = prod
-                        break
-
-                if match:
-                    # Produit existant - mettre a jour si necessaire
-                    if update_prices and comp.get('cost', 0) > 0:
-                        if abs(match.get('prix_achat', 0) - comp['cost']) > 0.01:
-                            self.db.update_produit(match['id'], {
-                                'categorie': match.get('categorie', DEFAULT_HARDWARE_CATEGORY),
-                                'sous_categorie': match.get('sous_categorie', ''),
-                                'sous_categorie_2': match.get('sous_categorie_2', ''),
-                                'sous_categorie_3': match.get('sous_categorie_3', ''),
-                                'designation': match.get('designation', ''),
-                                'description': match.get('description', ''),
-                                'dimensions': match.get('dimensions', ''),
-                                'hauteur': match.get('hauteur'),
-                                'largeur': match.get('largeur'),
-                                'prix_achat': comp['cost'],
-                                'reference': match.get('reference', ''),
-                                'fournisseur': comp.get('supplier', '') or match.get('fournisseur', ''),
-                                'marque': match.get('marque', ''),
-                                'chantier': match.get('chantier', ''),
-                                'notes': match.get('notes', ''),
-                                'fiche_technique': match.get('fiche_technique', ''),
-                                'devis_fournisseur': match.get('devis_fournisseur', ''),
-                            })
-                            stats['updated'] += 1
-                            self._add_log("INFO",
-                                f"Prix mis a jour: {code} ({match['prix_achat']:.2f} -> {comp['cost']:.2f})")
+        # Une seule transaction pour toute la synchronisation
+        with self.db.batch():
+            for comp in components:
+                try:
+                    code = comp.get('code', '').strip()
+                    if not code:
+                        stats['skipped'] += 1
+                        continue
+
+                    # Chercher par reference dans la BDD
+                    existing = self.db.search_produits(
+                        terme=code,
+                        categorie=DEFAULT_HARDWARE_CATEGORY,
+                        actif_only=True,
+                        limit=10
+                    )
+
+                    # Filtrer pour correspondance exacte de reference
+                    match = None
+                    for prod in existing:
+                        if prod.get('reference', '').strip().upper() == code.strip().upper():
+                            match = prod
+                            break
+
+                    if match:
+                        # Produit existant - mettre a jour si necessaire
+                        if update_prices and comp.get('cost', 0) > 0:
+                            if abs(match.get('prix_achat', 0) - comp['cost']) > 0.01:
+                                self.db.update_produit(match['id'], {
+                                    'categorie': match.get('categorie', DEFAULT_HARDWARE_CATEGORY),
+                                    'sous_categorie': match.get('sous_categorie', ''),
+                                    'sous_categorie_2': match.get('sous_categorie_2', ''),
+                                    'sous_categorie_3': match.get('sous_categorie_3', ''),
+                                    'designation': match.get('designation', ''),
+                                    'description': match.get('description', ''),
+                                    'dimensions': match.get('dimensions', ''),
+                                    'hauteur': match.get('hauteur'),
+                                    'largeur': match.get('largeur'),
+                                    'prix_achat': comp['cost'],
+                                    'reference': match.get('reference', ''),
+                                    'fournisseur': comp.get('supplier', '') or match.get('fournisseur', ''),
+                                    'marque': match.get('marque', ''),
+                                    'chantier': match.get('chantier', ''),
+                                    'notes': match.get('notes', ''),
+                                    'fiche_technique': match.get('fiche_technique', ''),
+                                    'devis_fournisseur': match.get('devis_fournisseur', ''),
+                                })
+                                stats['updated'] += 1
+                                self._add_log("INFO",
+                                    f"Prix mis a jour: {code} ({match['prix_achat']:.2f} -> {comp['cost']:.2f})")
+                            else:
+                                stats['skipped'] += 1
                         else:
                             stats['skipped'] += 1
+
+                    elif create_if_missing:
+                        # Creer le produit
+                        new_id = self.db.add_produit({
+                            'categorie': DEFAULT_HARDWARE_CATEGORY,
+                            'sous_categorie': comp.get('finish', ''),
+                            'designation': comp.get('description', code),
+                            'description': f"Import SolidWorks - {comp.get('name', '')}",
+                            'prix_achat': comp.get('cost', 0),
+                            'reference': code,
+                            'fournisseur': comp.get('supplier', ''),
+                            'notes': f"Import auto SWOOD {datetime.now().strftime('%d/%m/%Y %H:%M')}",
+                        })
+                        stats['created'] += 1
+                        self._add_log("INFO", f"Nouveau produit cree: {code} (ID: {new_id})")
                     else:
                         stats['skipped'] += 1
 
-                elif create_if_missing:
-                    # Creer le produit
-                    new_id = self.db.add_produit({
-                        'categorie': DEFAULT_HARDWARE_CATEGORY,
-                        'sous_categorie': comp.get('finish', ''),
-                        'designation': comp.get('description', code),
-                        'description': f"Import SolidWorks - {comp.get('name', '')}",
-                        'prix_achat': comp.get('cost', 0),
-                        'reference': code,
-                        'fournisseur': comp.get('supplier', ''),
-                        'notes': f"Import auto SWOOD {datetime.now().strftime('%d/%m/%Y %H:%M')}",
-                    })
-                    stats['created'] += 1
-                    self._add_log("INFO", f"Nouveau produit cree: {code} (ID: {new_id})")
-                else:
-                    stats['skipped'] += 1
-
-            except Exception as e:
-                stats['errors'] += 1
-                self._add_log("ERREUR", f"Erreur sync composant '{comp.get('code', '?')}': {str(e)}")
+                except Exception as e:
+                    stats['errors'] += 1
+                    self._add_log("ERREUR", f"Erreur sync composant '{comp.get('code', '?')}': {str(e)}")
 
         self._add_log("INFO",
             f"Synchronisation terminee: {stats['created']} crees, "
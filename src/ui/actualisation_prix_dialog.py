@@ -0,0 +1,245 @@
+"""
+DestriChiffrage - Dialogue d'actualisation des prix
+====================================================
+Reporte les prix catalogue modifies (tarifs fournisseurs) sur les produits
+lies des chantiers, en arriere-plan avec progression
+"""
+
+import tkinter as tk
+from tkinter import ttk, messagebox
+import os
+import sys
+import threading
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
+from ui.theme import Theme
+
+
+class ActualisationPrixDialog:
+    """Dialogue d'actualisation des prix catalogue sur les chantiers"""
+
+    def __init__(self, parent, db):
+        self.db = db
+        self.parent = parent
+        self.result = False
+
+        # Etat partage avec le thread de travail
+        self._thread = None
+        self._progress = (0, 0)
+        self._cancelled = False
+        self._stats = None
+        self._error = None
+
+        self.dialog = tk.Toplevel(parent)
+        self.dialog.title("Actualiser les prix catalogue")
+        self.dialog.geometry("900x520")
+        self.dialog.minsize(800, 450)
+        self.dialog.transient(parent)
+        self.dialog.grab_set()
+        self.dialog.configure(bg=Theme.COLORS['bg'])
+        self.dialog.protocol("WM_DELETE_WINDOW", self._on_close)
+
+        # Centrer
+        self.dialog.update_idletasks()
+        x = parent.winfo_x() + (parent.winfo_width() - 900) // 2
+        y = parent.winfo_y() + (parent.winfo_height() - 520) // 2
+        self.dialog.geometry(f"+{x}+{y}")
+
+        self.en_cours_var = tk.BooleanVar(value=True)
+
+        self._create_widgets()
+        self._load_ecarts()
+        self.dialog.wait_window()
+
+    def _create_widgets(self):
+        """Cree les widgets"""
+        main_frame = tk.Frame(self.dialog, bg=Theme.COLORS['bg'], padx=20, pady=16)
+        main_frame.pack(fill=tk.BOTH, expand=True)
+
+        tk.Label(main_frame, text="Chantiers dont des produits ont change de prix au catalogue",
+                font=Theme.FONTS['body_bold'],
+                bg=Theme.COLORS['bg'],
+                fg=Theme.COLORS['text']).pack(anchor='w')
+
+        tk.Label(main_frame, text="Les prix saisis a la main sur un produit lie sont conserves.",
+                font=Theme.FONTS['small'],
+                bg=Theme.COLORS['bg'],
+                fg=Theme.COLORS['text_muted']).pack(anchor='w', pady=(2, 8))
+
+        tk.Checkbutton(main_frame, text="Chantiers en cours uniquement",
+                      variable=self.en_cours_var,
+                      font=Theme.FONTS['small'],
+                      bg=Theme.COLORS['bg'],
+                      fg=Theme.COLORS['text'],
+                      activebackground=Theme.COLORS['bg'],
+                      command=self._load_ecarts).pack(anchor='w', pady=(0, 8))
+
+        # Tableau des ecarts par chantier
+        table_frame = tk.Frame(main_frame, bg=Theme.COLORS['bg_alt'],
+                              highlightbackground=Theme.COLORS['border'], highlightthickness=1)
+        table_frame.pack(fill=tk.BOTH, expand=True)
+
+        columns = ('id', 'nom', 'articles', 'liens', 'ecart_achat', 'ecart_ht', 'montant', 'depuis')
+        self.tree = ttk.Treeview(table_frame, columns=columns, show='headings',
+                                 height=12, selectmode='extended')
+
+        col_config = {
+            'id': ('ID', 50, 'center'),
+            'nom': ('Chantier', 220, 'w'),
+            'articles': ('Articles', 70, 'center'),
+            'liens': ('Produits', 70, 'center'),
+            'ecart_achat': ('Ecart achat', 110, 'e'),
+            'ecart_ht': ('Ecart HT', 110, 'e'),
+            'montant': ('Montant HT actuel', 130, 'e'),
+            'depuis': ('Prix modifie le', 110, 'center'),
+        }
+
+        for col, (text, width, anchor) in col_config.items():
+            self.tree.heading(col, text=text)
+            self.tree.column(col, width=width, anchor=anchor, minwidth=40)
+
+        vsb = ttk.Scrollbar(table_frame, orient="vertical", command=self.tree.yview)
+        self.tree.configure(yscrollcommand=vsb.set)
+        self.tree.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+        vsb.pack(side=tk.RIGHT, fill=tk.Y)
+
+        # Progression
+        progress_frame = tk.Frame(main_frame, bg=Theme.COLORS['bg'])
+        progress_frame.pack(fill=tk.X, pady=(12, 0))
+
+        self.progress_var = tk.DoubleVar(value=0)
+        self.progressbar = ttk.Progressbar(progress_frame, variable=self.progress_var,
+                                           maximum=100, mode='determinate')
+        self.progressbar.pack(fill=tk.X)
+
+        self.status_label = tk.Label(progress_frame, text="",
+                                     font=Theme.FONTS['small'],
+                                     bg=Theme.COLORS['bg'],
+                                     fg=Theme.COLORS['text_muted'])
+        self.status_label.pack(anchor='w', pady=(4, 0))
+
+        # Boutons
+        btn_frame = tk.Frame(main_frame, bg=Theme.COLORS['bg'])
+        btn_frame.pack(fill=tk.X, pady=(12, 0))
+
+        self.close_btn = tk.Button(btn_frame, text="Fermer",
+                                   font=Theme.FONTS['body'],
+                                   bg=Theme.COLORS['bg_dark'],
+                                   fg=Theme.COLORS['text'],
+                                   bd=0, padx=20, pady=10, cursor='hand2',
+                                   command=self._on_close)
+        self.close_btn.pack(side=tk.RIGHT)
+
+        self.apply_btn = tk.Button(btn_frame, text="Actualiser la selection",
+                                   font=Theme.FONTS['body_bold'],
+                                   bg=Theme.COLORS['accent'],
+                                   fg=Theme.COLORS['white'],
+                                   bd=0, padx=20, pady=10, cursor='hand2',
+                                   command=self._start)
+        self.apply_btn.pack(side=tk.RIGHT, padx=(0, 8))
+
+    def _load_ecarts(self):
+        """Charge l'impact des prix modifies, par chantier"""
+        resultat = 'EN_COURS' if self.en_cours_var.get() else None
+        ecarts = self.db.get_ecarts_prix_dpgf(resultat=resultat)
+
+        self.tree.delete(*self.tree.get_children())
+        for e in ecarts:
+            self.tree.insert('', tk.END, values=(
+                e['chantier_id'],
+                e['nom'],
+                e['nb_articles'],
+                e['nb_liens'],
+                f"{e['ecart_materiaux']:+.2f} EUR",
+                f"{e['ecart_ht']:+.2f} EUR",
+                f"{e['montant_ht'] or 0:.2f} EUR",
+                (e['derniere_modification'] or '')[:10],
+            ))
+
+        # Tout selectionner par defaut
+        self.tree.selection_set(self.tree.get_children())
+        self.progress_var.set(0)
+        if ecarts:
+            total_ht = sum(e['ecart_ht'] for e in ecarts)
+            self.status_label.config(text=f"{len(ecarts)} chantier(s) concerne(s), "
+                                          f"ecart total {total_ht:+.2f} EUR HT")
+            self.apply_btn.config(state='normal')
+        else:
+            self.status_label.config(text="Tous les prix des chantiers sont a jour")
+            self.apply_btn.config(state='disabled')
+
+    # ==================== ACTUALISATION EN ARRIERE-PLAN ====================
+
+    def _start(self):
+        """Lance l'actualisation des chantiers selectionnes"""
+        chantier_ids = [self.tree.item(item)['values'][0] for item in self.tree.selection()]
+        if not chantier_ids:
+            messagebox.showwarning("Attention", "Selectionnez au moins un chantier", parent=self.dialog)
+            return
+
+        self.apply_btn.config(state='disabled')
+        self.close_btn.config(text="Annuler")
+        self._progress = (0, len(chantier_ids))
+        self._cancelled = False
+        self._stats = None
+        self._error = None
+
+        self._thread = threading.Thread(target=self._run, args=(chantier_ids,), name="actualisation-prix")
+        self._thread.daemon = True
+        self._thread.start()
+        self._poll()
+
+    def _run(self, chantier_ids):
+        """Actualisation (thread de travail, aucun acces a Tk)"""
+        # Connexion propre au thread : la transaction ne melange pas les ecritures
+        # du thread Tk, qui voit les nouveaux prix une fois valides (data_version)
+        try:
+            db = self.db.open_writer()
+        except Exception as e:
+            self._error = e
+            return
+        try:
+            self._stats = db.actualiser_prix_dpgf(chantier_ids, progress_callback=self._on_progress)
+        except Exception as e:
+            self._error = e
+        finally:
+            db.close()
+
+    def _on_progress(self, current, total):
+        """Progression (thread de travail) ; leve InterruptedError si annule"""
+        if self._cancelled:
+            raise InterruptedError("Actualisation annulee par l'utilisateur")
+        self._progress = (current, total)
+
+    def _poll(self):
+        """Suit le thread de travail depuis le thread Tk"""
+        current, total = self._progress
+        if total:
+            self.progress_var.set(current * 100 / total)
+            self.status_label.config(text=f"Actualisation... {current}/{total} chantier(s)")
+
+        if self._thread.is_alive():
+            self.dialog.after(100, self._poll)
+            return
+
+        self._thread = None
+        self.close_btn.config(text="Fermer")
+        if isinstance(self._error, InterruptedError):
+            messagebox.showinfo("Actualisation annulee", "Aucun prix n'a ete modifie", parent=self.dialog)
+        elif self._error is not None:
+            messagebox.showerror("Erreur", f"Erreur d'actualisation:\n{self._error}", parent=self.dialog)
+        else:
+            self.result = True
+            messagebox.showinfo("Actualisation terminee",
+                                f"{self._stats['liens']} prix mis a jour\n"
+                                f"{self._stats['articles']} article(s) recalcule(s)\n"
+                                f"{self._stats['chantiers']} chantier(s)",
+                                parent=self.dialog)
+        self._load_ecarts()
+
+    def _on_close(self):
+        """Ferme le dialogue (ou annule l'actualisation en cours)"""
+        if self._thread is not None:
+            self._cancelled = True
+            return
+        self.dialog.destroy()
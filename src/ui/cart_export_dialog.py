@@ -50,6 +50,7 @@ class CartExportDialog(tk.Toplevel):
         self.export_dir_var = tk.StringVar()
         self.include_fiches_var = tk.BooleanVar(value=False)
         self.include_devis_var = tk.BooleanVar(value=False)
+        self.zip_var = tk.BooleanVar(value=False)
         self.progress_var = tk.IntVar(value=0)
 
         # Creer les widgets d'abord
@@ -145,6 +146,12 @@ class CartExportDialog(tk.Toplevel):
                       selectcolor=Theme.COLORS['bg'], activebackground=Theme.COLORS['bg_alt'],
                       cursor='hand2').pack(anchor='w')
 
+        tk.Checkbutton(options_frame, text="Regrouper les PDFs dans une archive ZIP",
+                      variable=self.zip_var, font=Theme.FONTS['body'],
+                      bg=Theme.COLORS['bg_alt'], fg=Theme.COLORS['text'],
+                      selectcolor=Theme.COLORS['bg'], activebackground=Theme.COLORS['bg_alt'],
+                      cursor='hand2').pack(anchor='w', pady=(5, 0))
+
         # Barre de progression (cachee par defaut)
         self.progress_frame = tk.Frame(main_frame, bg=Theme.COLORS['bg'])
         self.progress_frame.pack(fill=tk.X, pady=(0, 15))
@@ -197,6 +204,14 @@ class CartExportDialog(tk.Toplevel):
         self.result = None
         self.destroy()
 
+    def _on_copy_progress(self, done: int, total: int):
+        """Progression de la copie des PDFs (en octets)"""
+        if str(self.progress_bar['mode']) != 'determinate':
+            self.progress_bar.stop()
+            self.progress_bar.configure(mode='determinate')
+        self.progress_bar.configure(maximum=max(total, 1), value=done)
+        self.update()
+
     def _on_export(self):
         """Lance l'export"""
         # Validation
@@ -224,13 +239,21 @@ class CartExportDialog(tk.Toplevel):
             # Recuperer les IDs des produits du panier
             product_ids = self.cart_manager.get_product_ids()
 
+            # Archive ZIP a cote des PDFs (meme nom que le CSV)
+            zip_path = None
+            if (include_fiches or include_devis) and self.zip_var.get():
+                zip_name = os.path.splitext(os.path.basename(csv_path))[0] + "_PDF.zip"
+                zip_path = os.path.join(export_dir, zip_name)
+
             # Exporter
             stats = self.db.export_cart_to_csv(
                 product_ids=product_ids,
                 filepath=csv_path,
                 export_dir=export_dir if (include_fiches or include_devis) else None,
                 include_fiches=include_fiches,
-                include_devis=include_devis
+                include_devis=include_devis,
+                zip_path=zip_path,
+                progress_callback=self._on_copy_progress
             )
 
             # Arreter la barre de progression
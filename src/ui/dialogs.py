@@ -644,29 +644,13 @@ class EditCategoryDialog:
             messagebox.showerror("Erreur", "Le nom est obligatoire")
             return
 
-        # Si le nom change, renommer aussi les dossiers de fichiers
-        if self.old_nom != new_nom:
-            try:
-                # Renommer les dossiers Fiches_techniques et Devis_fournisseur
-                renamed = self.db.rename_category_folders(self.old_nom, new_nom)
-                if renamed > 0:
-                    # Mettre a jour les chemins en base apres le renommage de la categorie
-                    # Note: on fait cela apres update_categorie car les produits auront la nouvelle categorie
-                    pass
-            except Exception as e:
-                messagebox.showwarning("Attention",
-                    f"Les dossiers n'ont pas pu etre renommes:\n{e}\n\n"
-                    f"La categorie sera quand meme mise a jour.")
-
-        # Mettre a jour la categorie (met aussi a jour les produits si le nom change)
-        self.db.update_categorie(self.old_nom, new_nom, new_desc)
-
-        # Mettre a jour les chemins PDF apres le renommage
-        if self.old_nom != new_nom:
-            try:
-                self.db.update_pdf_paths_for_category(self.old_nom, new_nom)
-            except Exception as e:
-                print(f"Erreur mise a jour chemins PDF: {e}")
+        # Renommage en une operation : dossiers PDF (journalises), categorie,
+        # produits et chemins des fichiers
+        try:
+            self.db.rename_category(self.old_nom, new_nom, new_desc)
+        except Exception as e:
+            messagebox.showerror("Erreur", f"Le renommage de la categorie a echoue:\n{e}")
+            return
 
         self.callback()
         self.dialog.destroy()
@@ -835,6 +819,23 @@ class SettingsDialog:
         self.entries['data_dir'] = data_entry
         row += 1
 
+        # Stockage des PDF par contenu (une seule copie, dossiers de categories = liens)
+        stockage_var = tk.StringVar(value=self.db.get_parametre('stockage_pdf', '0'))
+        tk.Checkbutton(general_frame, text="Stocker chaque PDF une seule fois (liens par categorie)",
+                      variable=stockage_var, onvalue='1', offvalue='0',
+                      font=Theme.FONTS['body'], bg=Theme.COLORS['bg_alt'], fg=Theme.COLORS['text'],
+                      selectcolor=Theme.COLORS['bg'], activebackground=Theme.COLORS['bg_alt'],
+                      cursor='hand2').grid(row=row, column=1, sticky='w', padx=5, pady=(0, 14))
+        self.entries['stockage_pdf'] = stockage_var
+        row += 1
+
+        # Maintenance : suppression des PDF stockes qui ne servent plus
+        tk.Button(general_frame, text="Nettoyer le stockage des PDF", font=Theme.FONTS['small'],
+                 bg=Theme.COLORS['bg_dark'], fg=Theme.COLORS['text'],
+                 bd=0, padx=8, pady=4, cursor='hand2',
+                 command=self._clean_pdf_store).grid(row=row, column=1, sticky='w', padx=5, pady=(0, 14))
+        row += 1
+
         # Autres paramètres
         params = [
             ('entreprise', "Nom de l'entreprise"),
@@ -1022,6 +1023,16 @@ class SettingsDialog:
             entry_widget.delete(0, tk.END)
             entry_widget.insert(0, directory)
 
+    def _clean_pdf_store(self):
+        """Supprime les PDF stockes qui ne sont plus references par aucun produit"""
+        try:
+            count = self.db.gc_pdf_blobs()
+        except Exception as e:
+            messagebox.showerror("Erreur", f"Erreur lors du nettoyage:\n{e}", parent=self.dialog)
+            return
+        messagebox.showinfo("Stockage des PDF",
+                           f"{count} fichier(s) supprime(s) du stockage.", parent=self.dialog)
+
     def _save(self):
         """Enregistre les parametres"""
         import sys
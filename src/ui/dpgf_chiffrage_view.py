@@ -14,6 +14,7 @@ import platform
 sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
 from ui.theme import Theme
 from ui.product_search_dialog import ProductSearchDialog, MultiProductSearchDialog
+from chiffrage_cache import ChiffrageCache
 
 
 class DPGFChiffrageView:
@@ -26,6 +27,8 @@ class DPGFChiffrageView:
         self.on_close_callback = on_close_callback
         self.current_article_id = None
         self._is_loading = False  # Flag pour eviter les evenements pendant le rechargement
+        self._totaux_articles = {}  # id article -> prix total HT affiche (total du header)
+        self.pricing = ChiffrageCache(db, chantier_id)  # Detail et recap sans requete
 
         # Charger les donnees du chantier
         self.chantier = self.db.get_chantier(chantier_id) or {}
@@ -236,6 +239,32 @@ class DPGFChiffrageView:
                 bg=Theme.COLORS['bg_alt'],
                 fg=Theme.COLORS['text_muted']).pack(side=tk.LEFT, padx=(8, 0))
 
+        # Simulation de la marge (en memoire, rien n'est enregistre)
+        simulation_frame = tk.Frame(self.recap_frame, bg=Theme.COLORS['bg_alt'])
+        simulation_frame.pack(fill=tk.X, pady=(0, 8))
+
+        tk.Label(simulation_frame, text="Simulation (points)",
+                font=Theme.FONTS['small'],
+                bg=Theme.COLORS['bg_alt'],
+                fg=Theme.COLORS['text_light']).pack(side=tk.LEFT)
+
+        self._simulation = None
+        self.simulation_var = tk.IntVar(value=0)
+        tk.Scale(simulation_frame, from_=-10, to=10, resolution=1, orient=tk.HORIZONTAL,
+                variable=self.simulation_var, showvalue=True, length=160,
+                font=Theme.FONTS['tiny'],
+                bg=Theme.COLORS['bg_alt'],
+                fg=Theme.COLORS['text'],
+                highlightthickness=0, bd=0,
+                command=lambda v: self._update_simulation()).pack(side=tk.LEFT, padx=(8, 8))
+
+        self.simulation_label = tk.Label(self.recap_frame, text="",
+                                         font=Theme.FONTS['small'],
+                                         bg=Theme.COLORS['bg_alt'],
+                                         fg=Theme.COLORS['text_muted'],
+                                         anchor='w')
+        self.simulation_label.pack(fill=tk.X)
+
         ttk.Separator(self.recap_frame, orient='horizontal').pack(fill=tk.X, pady=12)
 
         # Section heures
@@ -316,7 +345,7 @@ class DPGFChiffrageView:
 
     def _update_recap(self):
         """Met a jour l'affichage du recapitulatif projet"""
-        recap = self.db.get_chantier_recap(self.chantier_id)
+        recap = self.pricing.recap()
 
         # Marge dans le champ de saisie
         marge_projet = recap.get('marge_projet')
@@ -348,6 +377,27 @@ class DPGFChiffrageView:
             Theme.COLORS['warning'] if marge >= 10 else Theme.COLORS['danger'])
         self.recap_couts['marge_globale'].config(text=f"{marge:.1f} %", fg=color)
 
+        # Simulation sur les articles en cache (recalculee a chaque recap)
+        self._simulation = self.pricing.simulation()
+        self.simulation_var.set(0)
+        self._update_simulation()
+
+    def _update_simulation(self):
+        """Affiche le total simule pour la marge produits +/- l'ecart du curseur"""
+        if self._simulation is None:
+            return
+        try:
+            marge_base = float(self.marge_entry.get().replace(',', '.'))
+        except ValueError:
+            self.simulation_label.config(text="")
+            return
+
+        marge = marge_base + self.simulation_var.get()
+        scenario = self._simulation.evaluer(marge)
+        self.simulation_label.config(
+            text=f"Marge {marge:.0f} % : {scenario['prix_total']:.2f} EUR HT, "
+                 f"marge globale {scenario['marge_globale']:.1f} %")
+
     def _apply_marge_projet(self):
         """Applique la marge projet a tous les articles"""
         try:
@@ -357,7 +407,7 @@ class DPGFChiffrageView:
                 return
 
             # Confirmer l'action
-            nb_articles = len(self.db.get_articles_dpgf(self.chantier_id))
+            nb_articles = self.pricing.recap()['nb_articles']
             if nb_articles > 0:
                 if not messagebox.askyesno("Confirmer",
                     f"Appliquer une marge de {marge:.0f}% a tous les {nb_articles} articles ?\n\n"
@@ -679,71 +729,20 @@ class DPGFChiffrageView:
         """
         # Activer le flag pour bloquer les evenements de selection
         self._is_loading = True
+        self.pricing.invalidate()
 
         # Sauvegarder l'article actuellement selectionne
         selected_article_id = self.current_article_id
 
-        # Recuperer la structure (niveaux 1-3) et les articles (niveau 4)
-        structure = self.db.get_structure_dpgf(self.chantier_id)
-        articles = self.db.get_articles_dpgf(self.chantier_id)
-
-        # Fusionner structure et articles dans une liste unifiee
-        # Structure: type='structure', niveau=1-3
-        # Articles: type='article', niveau=4
-        items_list = []
-
-        for s in structure:
-            items_list.append({
-                'type': 'structure',
-                'id': f"S{s['id']}",  # Prefixe S pour structure
-                'code': s['code'] or '',
-                'niveau': s['niveau'],
-                'designation': s['designation'],
-                'ordre': s['ordre']
-            })
-
-        for a in articles:
-            items_list.append({
-                'type': 'article',
-                'id': a['id'],
-                'code': a['code'] or '',
-                'niveau': 4,
-                'designation': a['designation'],
-                'quantite': a['quantite'],
-                'cout_materiaux': a['cout_materiaux'],
-                'cout_mo_total': a['cout_mo_total'],
-                'prix_unitaire_ht': a['prix_unitaire_ht'],
-                'prix_total_ht': a['prix_total_ht'],
-                'ordre': 0  # Les articles n'ont pas d'ordre explicite
-            })
-
-        # Trier par code pour respecter la hierarchie du DPGF
-        def sort_key(item):
-            # Extraire les parties numeriques du code pour tri naturel
-            code = item['code'] or ''
-            # Remplacer les separateurs par des points puis splitter
-            code_normalized = code.replace('-', '.').replace('/', '.')
-            parts = code_normalized.split('.')
-            # Convertir en tuples (numero, lettre) pour tri correct
-            key_parts = []
-            for p in parts:
-                try:
-                    key_parts.append((0, int(p), ''))
-                except ValueError:
-                    # Si pas un nombre, trier alphabetiquement
-                    key_parts.append((1, 0, p))
-            return (key_parts, item['niveau'], item['type'] == 'article')
-
-        items_list.sort(key=sort_key)
-
         # Effacer les anciens items
-        for item in self.articles_tree.get_children():
-            self.articles_tree.delete(item)
+        self.articles_tree.delete(*self.articles_tree.get_children())
+        self._totaux_articles = {}
 
-        total = 0
         selected_item = None
 
-        for item in items_list:
+        # Structure (niveaux 1-3) et articles (niveau 4) fusionnes et ordonnes
+        # par code hierarchique en base (sort_key)
+        for item in self.db.iter_lignes_dpgf(self.chantier_id):
             if item['type'] == 'structure':
                 # Element de structure (niveau 1-3)
                 niveau = item['niveau']
@@ -752,7 +751,7 @@ class DPGFChiffrageView:
                 designation = f"{indent}{item['designation']}"
 
                 tag = f"niveau{niveau}"
-                item_id = self.articles_tree.insert('', tk.END, values=(
+                item_id = self.articles_tree.insert('', tk.END, iid=f"S{item['id']}", values=(
                     '',  # Pas d'ID affiche pour la structure
                     item['code'] or '',
                     designation,
@@ -765,23 +764,16 @@ class DPGFChiffrageView:
 
             else:
                 # Article chiffrable (niveau 4)
-                item_id = self.articles_tree.insert('', tk.END, values=(
-                    item['id'],
-                    item['code'] or '-',
-                    item['designation'],
-                    item['quantite'],
-                    f"{item['cout_materiaux']:.2f}",
-                    f"{item['cout_mo_total']:.2f}",
-                    f"{item['prix_unitaire_ht']:.2f}",
-                    f"{item['prix_total_ht']:.2f}",
-                ), tags=('article',))
-                total += item['prix_total_ht']
+                item_id = self.articles_tree.insert('', tk.END, iid=self._article_iid(item['id']),
+                                                    values=self._article_values(item),
+                                                    tags=('article',))
+                self._totaux_articles[item['id']] = item['prix_total_ht']
 
                 # Memoriser l'item correspondant a l'article selectionne
                 if item['id'] == selected_article_id:
                     selected_item = item_id
 
-        self.total_label.config(text=f"Total: {total:.2f} EUR HT")
+        self._update_total()
 
         # Restaurer la selection si un article etait selectionne
         if selected_item:
@@ -803,11 +795,53 @@ class DPGFChiffrageView:
         self._update_recap()
 
     def _update_total(self):
-        """Met a jour le total affiche dans le header"""
-        articles = self.db.get_articles_dpgf(self.chantier_id)
-        total = sum(a['prix_total_ht'] for a in articles)
+        """Met a jour le total affiche dans le header (totaux des lignes affichees)"""
+        total = sum(self._totaux_articles.values())
         self.total_label.config(text=f"Total: {total:.2f} EUR HT")
 
+    @staticmethod
+    def _article_iid(article_id) -> str:
+        """Identifiant de la ligne d'un article dans le treeview"""
+        return f"A{article_id}"
+
+    @staticmethod
+    def _article_values(article) -> tuple:
+        """Valeurs affichees pour un article (niveau 4)"""
+        return (
+            article['id'],
+            article['code'] or '-',
+            article['designation'],
+            article['quantite'],
+            f"{article['cout_materiaux']:.2f}",
+            f"{article['cout_mo_total']:.2f}",
+            f"{article['prix_unitaire_ht']:.2f}",
+            f"{article['prix_total_ht']:.2f}",
+        )
+
+    def _refresh_article(self, article_id):
+        """
+        Met a jour la ligne d'un article modifie et le total, sans recharger la liste
+
+        Le code et la designation ne changent pas lors du chiffrage : la position
+        de la ligne reste valable (sinon utiliser _load_articles). L'article est lu
+        dans le cache de chiffrage (ChiffrageCache), rafraichi apres chaque
+        modification du DPGF. Si l'article n'existe plus ou n'est pas affiche, la
+        liste complete est rechargee (_load_articles).
+
+        Returns:
+            L'article lu dans le cache de chiffrage, None s'il n'existe plus
+        """
+        article = self.pricing.article(article_id)
+        iid = self._article_iid(article_id)
+        if article is None or not self.articles_tree.exists(iid):
+            self._load_articles()
+            return article
+
+        self.articles_tree.item(iid, values=self._article_values(article))
+        self._totaux_articles[article_id] = article['prix_total_ht']
+        self._update_total()
+        return article
+
     def _on_tree_click(self, event):
         """Gere le clic sur le treeview - deselectionne si clic sur zone vide
 
@@ -876,8 +910,8 @@ class DPGFChiffrageView:
         self.recap_frame.pack_forget()
         self.detail_content.pack(fill=tk.BOTH, expand=True)
 
-        # Charger les donnees
-        article = self.db.get_article_dpgf(article_id)
+        # Charger les donnees (cache de chiffrage)
+        article = self.pricing.article(article_id)
         if not article:
             return
 
@@ -932,7 +966,7 @@ class DPGFChiffrageView:
         if not self.current_article_id:
             return
 
-        produits = self.db.get_produits_article(self.current_article_id)
+        produits = self.pricing.produits(self.current_article_id)
 
         for item in self.produits_tree.get_children():
             self.produits_tree.delete(item)
@@ -946,36 +980,30 @@ class DPGFChiffrageView:
             ))
 
     def _update_couts_display(self):
-        """Met a jour l'affichage des couts"""
+        """Met a jour l'affichage des couts (cache de chiffrage)"""
         if not self.current_article_id:
             return
 
-        article = self.db.get_article_dpgf(self.current_article_id)
-        if not article:
+        couts = self.pricing.couts(self.current_article_id)
+        if not couts:
             return
 
-        # Calculer le cout des produits lies (sans fournitures add.)
-        produits = self.db.get_produits_article(self.current_article_id)
-        cout_produits = sum(p['quantite'] * p['prix_unitaire'] for p in produits)
-        fournitures_add = article.get('fournitures_additionnelles') or 0
-
-        self.couts_labels['materiaux'].config(text=f"{cout_produits:.2f} EUR")
-        self.couts_labels['fournitures'].config(text=f"{fournitures_add:.2f} EUR")
-        self.couts_labels['mo'].config(text=f"{article['cout_mo_total']:.2f} EUR")
-        self.couts_labels['revient'].config(text=f"{article['cout_revient']:.2f} EUR")
+        self.couts_labels['materiaux'].config(text=f"{couts['cout_produits']:.2f} EUR")
+        self.couts_labels['fournitures'].config(text=f"{couts['fournitures']:.2f} EUR")
+        self.couts_labels['mo'].config(text=f"{couts['vente_mo']:.2f} EUR")
+        self.couts_labels['revient'].config(text=f"{couts['cout_revient']:.2f} EUR")
 
         # Afficher si prix manuel ou calcule
-        prix_manuel = article.get('prix_manuel')
-        if prix_manuel is not None:
+        if couts['prix_manuel'] is not None:
             self.couts_labels['prix_unit'].config(
-                text=f"{article['prix_unitaire_ht']:.2f} EUR (manuel)",
+                text=f"{couts['prix_unitaire_ht']:.2f} EUR (manuel)",
                 fg=Theme.COLORS['warning'])
         else:
             self.couts_labels['prix_unit'].config(
-                text=f"{article['prix_unitaire_ht']:.2f} EUR",
+                text=f"{couts['prix_unitaire_ht']:.2f} EUR",
                 fg=Theme.COLORS['text'])
 
-        self.couts_labels['prix_total'].config(text=f"{article['prix_total_ht']:.2f} EUR")
+        self.couts_labels['prix_total'].config(text=f"{couts['prix_total_ht']:.2f} EUR")
 
     def _update_fournitures(self):
         """Met a jour les fournitures additionnelles"""
@@ -987,7 +1015,7 @@ class DPGFChiffrageView:
         except ValueError:
             return
 
-        article = self.db.get_article_dpgf(self.current_article_id)
+        article = self.pricing.article(self.current_article_id)
         if not article:
             return
 
@@ -1014,8 +1042,9 @@ class DPGFChiffrageView:
         }
 
         self.db.update_article_dpgf(self.current_article_id, data)
+        self.pricing.mark_dirty(self.current_article_id)
+        self._refresh_article(self.current_article_id)
         self._update_couts_display()
-        self._load_articles()
 
     def _toggle_prix_manuel(self):
         """Active/desactive le mode prix manuel"""
@@ -1023,7 +1052,7 @@ class DPGFChiffrageView:
             self.prix_manuel_entry.config(state='normal')
             # Initialiser avec le prix calcule actuel
             if self.current_article_id:
-                article = self.db.get_article_dpgf(self.current_article_id)
+                article = self.pricing.article(self.current_article_id)
                 if article:
                     self.prix_manuel_entry_var.set(f"{article['prix_unitaire_ht']:.2f}")
         else:
@@ -1036,7 +1065,7 @@ class DPGFChiffrageView:
         if not self.current_article_id:
             return
 
-        article = self.db.get_article_dpgf(self.current_article_id)
+        article = self.pricing.article(self.current_article_id)
         if not article:
             return
 
@@ -1063,8 +1092,9 @@ class DPGFChiffrageView:
         }
 
         self.db.update_article_dpgf(self.current_article_id, data)
+        self.pricing.mark_dirty(self.current_article_id)
+        self._refresh_article(self.current_article_id)
         self._update_couts_display()
-        self._load_articles()
 
     def _update_prix_manuel(self):
         """Met a jour le prix manuel"""
@@ -1076,7 +1106,7 @@ class DPGFChiffrageView:
         except ValueError:
             return
 
-        article = self.db.get_article_dpgf(self.current_article_id)
+        article = self.pricing.article(self.current_article_id)
         if not article:
             return
 
@@ -1103,8 +1133,9 @@ class DPGFChiffrageView:
         }
 
         self.db.update_article_dpgf(self.current_article_id, data)
+        self.pricing.mark_dirty(self.current_article_id)
+        self._refresh_article(self.current_article_id)
         self._update_couts_display()
-        self._load_articles()
 
     def _add_article(self):
         """Ajoute un nouvel article"""
@@ -1126,9 +1157,10 @@ class DPGFChiffrageView:
                 'marge_pct': 20.0,
                 'taux_tva': 20.0
             }
-            article_id = self.db.add_article_dpgf(self.chantier_id, article_data)
-            # Lier le produit a l'article
-            self.db.add_produit_article(article_id, produit['id'], quantite=1)
+            with self.db.batch():
+                article_id = self.db.add_article_dpgf(self.chantier_id, article_data)
+                # Lier le produit a l'article
+                self.db.add_produit_article(article_id, produit['id'], quantite=1)
             self._load_articles()
 
     def _import_dpgf(self):
@@ -1181,7 +1213,7 @@ class DPGFChiffrageView:
             article_id = item_data['values'][0]
 
             # Verifier si l'article a des produits lies avec fiche/devis
-            produits = self.db.get_produits_article(article_id)
+            produits = self.pricing.produits(article_id)
             has_fiche = False
             has_devis = False
             for p in produits:
@@ -1227,7 +1259,7 @@ class DPGFChiffrageView:
         if selection:
             item = self.articles_tree.item(selection[0])
             article_id = item['values'][0]
-            article = self.db.get_article_dpgf(article_id)
+            article = self.pricing.article(article_id)
             if article:
                 text = f"Code: {article.get('code', '')}\n"
                 text += f"Designation: {article.get('designation', '')}\n"
@@ -1281,11 +1313,10 @@ class DPGFChiffrageView:
         if dialog.result:
             self._load_articles()
             # Reselectionner l'article
-            for item in self.articles_tree.get_children():
-                if self.articles_tree.item(item)['values'][0] == article_id:
-                    self.articles_tree.selection_set(item)
-                    self._on_article_select(None)
-                    break
+            iid = self._article_iid(article_id)
+            if self.articles_tree.exists(iid):
+                self.articles_tree.selection_set(iid)
+                self._on_article_select(None)
 
     def _add_produit(self):
         """Ajoute un produit a l'article"""
@@ -1299,9 +1330,10 @@ class DPGFChiffrageView:
                 dialog.selected_product['id'],
                 dialog.selected_quantity
             )
+            self.pricing.mark_dirty(self.current_article_id)
             self._load_produits_lies()
+            self._refresh_article(self.current_article_id)
             self._update_couts_display()
-            self._load_articles()
 
     def _remove_produit(self):
         """Retire un produit de l'article"""
@@ -1313,9 +1345,10 @@ class DPGFChiffrageView:
         liaison_id = item['values'][0]
 
         self.db.remove_produit_article(liaison_id)
+        self.pricing.mark_dirty(self.current_article_id)
         self._load_produits_lies()
+        self._refresh_article(self.current_article_id)
         self._update_couts_display()
-        self._load_articles()
 
     def _on_produit_double_click(self, event):
         """Gere le double-clic pour editer la quantite directement"""
@@ -1391,9 +1424,10 @@ class DPGFChiffrageView:
         self.qty_edit_entry = None
 
         # Rafraichir l'affichage
+        self.pricing.mark_dirty(self.current_article_id)
         self._load_produits_lies()
+        self._refresh_article(self.current_article_id)
         self._update_couts_display()
-        self._load_articles()
 
     def _cancel_quantity_inline(self, event=None):
         """Annule l'edition de la quantite"""
@@ -1413,7 +1447,7 @@ class DPGFChiffrageView:
         except ValueError:
             return
 
-        article = self.db.get_article_dpgf(self.current_article_id)
+        article = self.pricing.article(self.current_article_id)
         if not article:
             return
 
@@ -1440,8 +1474,9 @@ class DPGFChiffrageView:
         }
 
         self.db.update_article_dpgf(self.current_article_id, data)
+        self.pricing.mark_dirty(self.current_article_id)
+        self._refresh_article(self.current_article_id)
         self._update_couts_display()
-        self._load_articles()
 
     def _save_description(self):
         """Sauvegarde la description de l'article"""
@@ -1451,7 +1486,7 @@ class DPGFChiffrageView:
         description = self.description_text.get('1.0', tk.END).strip()
         presentation = self.presentation_text.get('1.0', tk.END).strip()
 
-        article = self.db.get_article_dpgf(self.current_article_id)
+        article = self.pricing.article(self.current_article_id)
         if not article:
             return
 
@@ -1478,6 +1513,7 @@ class DPGFChiffrageView:
         }
 
         self.db.update_article_dpgf(self.current_article_id, data)
+        self.pricing.mark_dirty(self.current_article_id)
 
     def _save_presentation(self):
         """Sauvegarde la presentation de l'article"""
@@ -1495,7 +1531,7 @@ class DPGFChiffrageView:
         except ValueError:
             taux_tva = 20
 
-        article = self.db.get_article_dpgf(self.current_article_id)
+        article = self.pricing.article(self.current_article_id)
         if not article:
             return
 
@@ -1522,6 +1558,7 @@ class DPGFChiffrageView:
         }
 
         self.db.update_article_dpgf(self.current_article_id, data)
+        self.pricing.mark_dirty(self.current_article_id)
 
     def _export_dpgf(self):
         """Exporte le DPGF"""
@@ -51,6 +51,7 @@ class DPGFExportDialog:
         self.export_dir_var = tk.StringVar()
         self.include_fiches_var = tk.BooleanVar(value=False)
         self.include_devis_var = tk.BooleanVar(value=False)
+        self.zip_var = tk.BooleanVar(value=False)
 
         # Options de nommage des fichiers PDF (issue #22)
         self.prefix_code_article_var = tk.BooleanVar(value=True)
@@ -237,6 +238,12 @@ class DPGFExportDialog:
                       selectcolor=Theme.COLORS['bg'], activebackground=Theme.COLORS['bg_alt'],
                       cursor='hand2', command=self._toggle_naming_options).pack(anchor='w')
 
+        tk.Checkbutton(self.pdf_card, text="Regrouper les PDFs dans une archive ZIP",
+                      variable=self.zip_var, font=Theme.FONTS['body'],
+                      bg=Theme.COLORS['bg_alt'], fg=Theme.COLORS['text'],
+                      selectcolor=Theme.COLORS['bg'], activebackground=Theme.COLORS['bg_alt'],
+                      cursor='hand2').pack(anchor='w', pady=(4, 0))
+
         tk.Label(self.pdf_card,
                 text="Les fichiers seront copies dans des sous-dossiers Fiches_techniques/ et Devis_fournisseur/",
                 font=Theme.FONTS['tiny'],
@@ -368,6 +375,14 @@ class DPGFExportDialog:
 
         self.naming_preview_label.config(text=preview)
 
+    def _on_copy_progress(self, done: int, total: int):
+        """Progression de la copie des PDFs (en octets)"""
+        if str(self.progress_bar['mode']) != 'determinate':
+            self.progress_bar.stop()
+            self.progress_bar.configure(mode='determinate')
+        self.progress_bar.configure(maximum=max(total, 1), value=done)
+        self.dialog.update()
+
     def _export(self):
         """Execute l'export"""
         version = self.version_var.get()
@@ -428,12 +443,18 @@ class DPGFExportDialog:
                     'include_id_produit': self.include_id_produit_var.get(),
                     'include_designation': self.include_designation_var.get()
                 }
+                zip_path = None
+                if self.zip_var.get():
+                    zip_name = os.path.splitext(os.path.basename(filepath))[0] + "_PDF.zip"
+                    zip_path = os.path.join(export_dir, zip_name)
                 nb_fiches, nb_devis = self.db.export_dpgf_files(
                     self.chantier_id,
                     export_dir,
                     include_fiches,
                     include_devis,
-                    naming_options
+                    naming_options,
+                    zip_path=zip_path,
+                    progress_callback=self._on_copy_progress
                 )
 
             # Arreter la barre de progression
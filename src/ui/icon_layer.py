@@ -0,0 +1,225 @@
+"""
+Calque d'icones pour les colonnes du Treeview
+
+Un seul Canvas recouvre les colonnes d'icones contigues (fiche, devis, devis
+rapide). Il contient un pool fixe d'elements par ligne visible, reutilise a
+chaque defilement : seules les lignes dont le contenu ou la selection a change
+sont modifiees, et les positions sont calculees a partir d'une seule mesure de
+ligne au lieu d'un bbox par cellule.
+"""
+
+import tkinter as tk
+from tkinter import ttk
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+import sys
+import os
+
+# Ajouter le dossier parent au path
+sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
+
+from ui.theme import Theme
+
+
+class IconColumnsLayer:
+    """Dessine les icones de colonnes contigues d'un Treeview sur un Canvas unique"""
+
+    def __init__(self, tree: ttk.Treeview, columns: Sequence[str],
+                 draw_cell: Callable, on_click: Callable = None,
+                 on_double_click: Callable = None, on_context_menu: Callable = None,
+                 font=('Segoe UI', 12, 'bold')):
+        """
+        Initialise le calque
+
+        Args:
+            tree: Treeview recouvert
+            columns: Colonnes d'icones, contigues et dans l'ordre d'affichage
+            draw_cell: draw_cell(column, tags) -> None, ('image', photo)
+                       ou ('text', texte, couleur)
+            on_click: on_click(column, iid) appele au clic sur une icone
+            on_double_click: Gestionnaire <Double-1> du Treeview (evenement
+                             ramene aux coordonnees du Treeview)
+            on_context_menu: Gestionnaire <Button-3> du Treeview (idem)
+            font: Police des icones texte
+        """
+        self.tree = tree
+        self.columns = list(columns)
+        self.draw_cell = draw_cell
+        self.on_click = on_click
+        self.on_double_click = on_double_click
+        self.on_context_menu = on_context_menu
+        self.font = font
+
+        self.canvas = tk.Canvas(tree.master, bg=Theme.COLORS['bg_alt'],
+                                highlightthickness=0, bd=0, cursor='hand2')
+        self._placed = None  # (x, y, largeur, hauteur) du canvas
+        self._geometry = None  # (decalage x, largeurs des colonnes, hauteur de ligne)
+        self._pool: List[Dict] = []  # Elements du canvas par ligne visible
+        self._slots: List[str] = []
+        self._row_height = 0
+
+        self.canvas.bind('<Button-1>', self._on_click)
+        self.canvas.bind('<Double-1>', lambda e: self._forward(e, self.on_double_click))
+        self.canvas.bind('<Button-3>', lambda e: self._forward(e, self.on_context_menu))
+        self.canvas.bind('<MouseWheel>', lambda e: self.tree.event_generate('<MouseWheel>', delta=e.delta))
+        self.canvas.bind('<Button-4>', lambda e: self.tree.event_generate('<Button-4>'))
+        self.canvas.bind('<Button-5>', lambda e: self.tree.event_generate('<Button-5>'))
+
+    # ==================== MISE A JOUR ====================
+
+    def update(self, slots: List[Tuple[str, Sequence[str]]], selected: Optional[str] = None):
+        """
+        Met a jour le calque pour les lignes visibles
+
+        Args:
+            slots: Couples (iid, tags) des lignes visibles, de haut en bas
+            selected: iid de la ligne selectionnee (fond de selection)
+        """
+        self._slots = [iid for iid, _ in slots]
+        geometry = self._measure()
+        if not slots or geometry is None:
+            self._hide()
+            return
+
+        strip_x, widths, row_height, top = geometry
+        tree_width = self.tree.winfo_width()
+        left = max(strip_x, 0)
+        right = min(strip_x + sum(widths), tree_width)
+        if right <= left:
+            self._hide()
+            return
+
+        placed = (left, top, right - left, row_height * len(slots))
+        if placed != self._placed:
+            self.canvas.place(in_=self.tree, x=placed[0], y=placed[1],
+                              width=placed[2], height=placed[3])
+            self._placed = placed
+
+        offset_x = strip_x - left
+        layout = (offset_x, tuple(widths), row_height)
+        relayout = layout != self._geometry
+        self._geometry = layout
+        self._row_height = row_height
+
+        while len(self._pool) < len(slots):
+            self._pool.append(self._create_row())
+
+        for index, entry in enumerate(self._pool):
+            if index >= len(slots):
+                if entry['state'] is not None:
+                    self._set_row_hidden(entry)
+                continue
+            iid, tags = slots[index]
+            cells = tuple(self.draw_cell(column, tags) for column in self.columns)
+            state = (cells, iid == selected)
+            if relayout or entry['index'] != index:
+                self._layout_row(entry, index, offset_x, widths, row_height)
+            if entry['state'] != state:
+                self._draw_row(entry, cells, state[1])
+                entry['state'] = state
+
+    def _measure(self):
+        """Position de la premiere colonne et hauteur de ligne (un seul bbox)"""
+        if not self._slots:
+            return None
+        try:
+            bbox = self.tree.bbox(self._slots[0], self.columns[0])
+        except tk.TclError:
+            return None
+        if not bbox:
+            return None
+        widths = [int(self.tree.column(column, 'width')) for column in self.columns]
+        return bbox[0], widths, bbox[3], bbox[1]
+
+    def _hide(self):
+        if self._placed is not None:
+            self.canvas.place_forget()
+            self._placed = None
+
+    # ==================== POOL D'ELEMENTS ====================
+
+    def _create_row(self) -> Dict:
+        """Cree les elements d'une ligne (fond + image et texte par colonne)"""
+        canvas = self.canvas
+        entry = {
+            'bg': canvas.create_rectangle(0, 0, 0, 0, width=0, fill=Theme.COLORS['bg_alt']),
+            'images': [canvas.create_image(0, 0, state='hidden') for _ in self.columns],
+            'texts': [canvas.create_text(0, 0, font=self.font, state='hidden') for _ in self.columns],
+            'index': None,
+            'state': None,
+        }
+        return entry
+
+    def _layout_row(self, entry: Dict, index: int, offset_x: int, widths: List[int], row_height: int):
+        """Positionne les elements d'une ligne"""
+        canvas = self.canvas
+        y0 = index * row_height
+        canvas.coords(entry['bg'], 0, y0, sum(widths) + offset_x + 1, y0 + row_height)
+        x = offset_x
+        for image, text, width in zip(entry['images'], entry['texts'], widths):
+            center = (x + width // 2, y0 + row_height // 2 + 1)
+            canvas.coords(image, *center)
+            canvas.coords(text, *center)
+            x += width
+        entry['index'] = index
+
+    def _draw_row(self, entry: Dict, cells: Tuple, selected: bool):
+        """Applique le contenu d'une ligne (seulement si elle a change)"""
+        canvas = self.canvas
+        canvas.itemconfigure(entry['bg'], state='normal',
+                             fill=Theme.COLORS['bg_dark'] if selected else Theme.COLORS['bg_alt'])
+        for cell, image, text in zip(cells, entry['images'], entry['texts']):
+            if cell and cell[0] == 'image':
+                canvas.itemconfigure(image, image=cell[1], state='normal')
+                canvas.itemconfigure(text, state='hidden')
+            elif cell and cell[0] == 'text':
+                canvas.itemconfigure(text, text=cell[1], fill=cell[2], state='normal')
+                canvas.itemconfigure(image, state='hidden')
+            else:
+                canvas.itemconfigure(image, state='hidden')
+                canvas.itemconfigure(text, state='hidden')
+
+    def _set_row_hidden(self, entry: Dict):
+        for item in [entry['bg']] + entry['images'] + entry['texts']:
+            self.canvas.itemconfigure(item, state='hidden')
+        entry['state'] = None
+
+    # ==================== CLICS ====================
+
+    def _row_index(self, event) -> Optional[int]:
+        """Index de la ligne visible sous le pointeur (None hors des lignes)"""
+        if not self._row_height or self._geometry is None:
+            return None
+        index = event.y // self._row_height
+        return index if index < len(self._slots) else None
+
+    def _forward(self, event, handler: Optional[Callable]):
+        """Selectionne la ligne sous le pointeur puis transmet l'evenement au Treeview"""
+        index = self._row_index(event)
+        if index is None or handler is None or self._placed is None:
+            return
+        self.tree.selection_set(self._slots[index])
+        # Coordonnees du canvas ramenees a celles du Treeview (identify_row/column)
+        event.x += self._placed[0]
+        event.y += self._placed[1]
+        event.widget = self.tree
+        handler(event)
+
+    def _on_click(self, event):
+        """Retrouve la ligne et la colonne cliquees a partir des coordonnees"""
+        index = self._row_index(event)
+        if index is None:
+            return
+        iid = self._slots[index]
+
+        offset_x, widths, _ = self._geometry
+        x = offset_x
+        for column, width in zip(self.columns, widths):
+            if x <= event.x < x + width:
+                entry = self._pool[index]
+                cells = entry['state'][0] if entry['state'] else ()
+                if cells and cells[self.columns.index(column)] and self.on_click:
+                    self.on_click(column, iid)
+                else:
+                    self.tree.selection_set(iid)
+                return
+            x += width
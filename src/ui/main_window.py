@@ -7,9 +7,11 @@ Interface principale moderne et professionnelle
 import tkinter as tk
 from tkinter import ttk, messagebox, filedialog
 import os
+import queue
 import sys
 import subprocess
 from datetime import datetime
+from typing import Dict, List, Optional
 
 # Pour le logo et icones
 try:
@@ -25,6 +27,10 @@ sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
 from cart_manager import CartManager
 from ui.cart_panel import CartPanel
 from ui.cart_export_dialog import CartExportDialog
+from ui.search_scheduler import SearchScheduler
+from file_scanner import FileScanner
+from ui.virtual_tree import VirtualTreeview
+from ui.icon_layer import IconColumnsLayer
 
 sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
 from database import Database
@@ -39,6 +45,10 @@ from utils import get_resource_path
 class MainWindow:
     """Fenetre principale de l'application"""
 
+    # Nombre de produits lus par requete pour la liste virtuelle
+    PAGE_SIZE = 100
+    SCAN_POLL_MS = 1000  # Releve des passages du scanner de fichiers
+
     def __init__(self, root: tk.Tk):
         self.root = root
         self.db = Database()
@@ -55,15 +65,16 @@ class MainWindow:
         self.marque_var = tk.StringVar(value="Toutes")
         self.has_fiche_var = tk.IntVar(value=0)
         self.has_devis_var = tk.IntVar(value=0)
+        self.broken_links_var = tk.IntVar(value=0)
         self.marge_var = tk.StringVar(value=str(self.db.get_marge()))
+        # Libelles "valeur (nombre)" des listes de filtres -> valeur (voir _facet_labels)
+        self._facet_values = {}
+        self._category_names = []
 
         # Charger les icones PDF, Devis et Devis rapide
         self.pdf_icon = None
         self.devis_icon = None
         self.cart_icon = None
-        self.pdf_labels = []  # Labels pour afficher les icônes PDF
-        self.devis_labels = []  # Labels pour afficher les icônes Devis
-        self.cart_labels = []  # Labels pour afficher les icônes Devis rapide
         self._load_pdf_icon()
         self._load_devis_icon()
         self._load_cart_icon()
@@ -81,11 +92,23 @@ class MainWindow:
         self._create_action_bar()
         self._create_main_content()
 
+        # Recherche en arriere-plan (anti-rebond + thread de travail)
+        self.search_scheduler = SearchScheduler(self.root, self.db,
+                                                on_results=self._on_search_results,
+                                                on_error=self._on_search_error)
+
+        # Index des fichiers PDF en arriere-plan (badges de liens casses sans acces disque) ;
+        # Tk n'est pas appele depuis le scanner : ses passages sont releves par le thread Tk
+        self._scan_results = queue.Queue()
+        self.file_scanner = FileScanner(self.db, on_scan=self._scan_results.put)
+        self.file_scanner.start()
+        self._poll_file_scans()
+
         # Charger les donnees
         self.refresh_data()
 
-        # Bindings
-        self.search_var.trace('w', lambda *args: self.on_search())
+        # Bindings : la saisie est temporisee, les filtres declenchent immediatement
+        self.search_var.trace('w', lambda *args: self.on_search(debounce=True))
 
         # Verification automatique des mises a jour au demarrage (en arriere-plan)
         self.root.after(3000, self._check_updates_background)
@@ -465,7 +488,7 @@ class MainWindow:
                 fg=Theme.COLORS['text_muted']).pack(anchor='w')
 
         self.hauteur_combo = ttk.Combobox(hauteur_frame, textvariable=self.hauteur_var,
-                                         width=10, state='readonly',
+                                         width=12, state='readonly',
                                          font=Theme.FONTS['body'])
         self.hauteur_combo.pack(pady=(2, 0))
         self.hauteur_combo.bind('<<ComboboxSelected>>', self.on_hauteur_change)
@@ -479,7 +502,7 @@ class MainWindow:
                 fg=Theme.COLORS['text_muted']).pack(anchor='w')
 
         self.largeur_combo = ttk.Combobox(largeur_frame, textvariable=self.largeur_var,
-                                         width=10, state='readonly',
+                                         width=12, state='readonly',
                                          font=Theme.FONTS['body'])
         self.largeur_combo.pack(pady=(2, 0))
         self.largeur_combo.bind('<<ComboboxSelected>>', lambda e: self.on_search())
@@ -538,6 +561,15 @@ class MainWindow:
                                           command=self.on_search)
         self.devis_check.pack(anchor='w')
 
+        self.broken_check = tk.Checkbutton(docs_frame, text="Fichiers introuvables",
+                                           variable=self.broken_links_var,
+                                           font=Theme.FONTS['small'],
+                                           bg=Theme.COLORS['bg_alt'],
+                                           fg=Theme.COLORS['text'],
+                                           activebackground=Theme.COLORS['bg_alt'],
+                                           command=self.on_search)
+        self.broken_check.pack(anchor='w')
+
         # Bouton effacer
         clear_frame = tk.Frame(filter_row, bg=Theme.COLORS['bg_alt'])
         clear_frame.pack(side=tk.LEFT, pady=(12, 0))
@@ -638,9 +670,11 @@ class MainWindow:
             self.tree.column(col, width=width, anchor=anchor, minwidth=50)
 
         # Scrollbars
+        # La barre verticale represente tous les resultats (liste virtuelle),
+        # le Treeview ne contient que les lignes visibles
         self.vsb = ttk.Scrollbar(table_frame, orient="vertical", command=self._on_vsb_scroll)
         self.hsb = ttk.Scrollbar(table_frame, orient="horizontal", command=self._on_hsb_scroll)
-        self.tree.configure(yscrollcommand=self._on_tree_vsb, xscrollcommand=self._on_tree_hsb)
+        self.tree.configure(xscrollcommand=self._on_tree_hsb)
 
         # Grid layout
         self.tree.grid(row=0, column=0, sticky='nsew')
@@ -650,13 +684,16 @@ class MainWindow:
         table_frame.grid_columnconfigure(0, weight=1)
         table_frame.grid_rowconfigure(0, weight=1)
 
-        # Frame overlay pour les icônes PDF
-        self.pdf_overlay_frame = tk.Frame(table_frame, bg='')
+        # Calque unique pour les icones (fiche, devis, devis rapide)
+        self.icon_layer = IconColumnsLayer(self.tree, ('pdf', 'devis', 'cart'),
+                                           draw_cell=self._draw_icon_cell,
+                                           on_click=self._on_icon_click,
+                                           on_double_click=self._on_tree_double_click,
+                                           on_context_menu=self._show_context_menu)
 
-        # Bindings pour mettre à jour les icônes
-        self.tree.bind('<Configure>', lambda e: self._update_all_icons())
-        self.vsb.bind('<B1-Motion>', lambda e: self.root.after(10, self._update_all_icons))
-        self.hsb.bind('<B1-Motion>', lambda e: self.root.after(10, self._update_all_icons))
+        # Bindings pour mettre à jour les icônes (selection, redimensionnement de colonne)
+        self.tree.bind('<<TreeviewSelect>>', lambda e: self._update_all_icons(), add='+')
+        self.tree.bind('<ButtonRelease-1>', lambda e: self._update_all_icons(), add='+')
 
         # Bindings
         self.tree.bind('<Double-1>', self._on_tree_double_click)
@@ -665,6 +702,19 @@ class MainWindow:
         self.tree.bind('<Button-3>', self._show_context_menu)  # Clic droit
         self.tree.bind('<Control-c>', self._copy_row)  # Ctrl+C
 
+        # Liste virtuelle : pages lues a la demande autour de la zone visible
+        self.sort_order = None  # None : pertinence si un terme est saisi, sinon categorie
+        self.sort_descending = False
+        self._search_criteres = {}
+        self._search_order = ('categorie', False)  # Ordre de la recherche affichee
+        self._search_page_keys = []  # Cles de fin de page de la recherche affichee
+        self._display_marge = 20
+        self.virtual_list = VirtualTreeview(self.tree, self.vsb,
+                                            fetch_page=self._fetch_product_page,
+                                            render_row=self._render_product_row,
+                                            page_size=self.PAGE_SIZE,
+                                            on_render=self._update_all_icons)
+
         # Menu contextuel
         self._create_context_menu()
 
@@ -695,9 +745,13 @@ class MainWindow:
 
     def refresh_data(self):
         """Rafraichit les donnees"""
-        # Mettre a jour les categories
-        cats = ['Toutes'] + self.db.get_categories_names()
-        self.category_combo['values'] = cats
+        # Mettre a jour les categories (ordre de la table categories, compteurs des facettes)
+        current_category = self._facet_get(self.category_var)
+        self._category_names = self.db.get_categories_names()
+        counts = dict(self.db.get_facettes('categorie'))
+        self.category_combo['values'] = self._facet_labels(
+            [(nom, counts.get(nom)) for nom in self._category_names])
+        self._facet_set(self.category_var, current_category)
 
         # Mettre a jour les sous-categories (avec preservation des selections)
         self.update_subcategories(preserve_selection=True)
@@ -716,22 +770,58 @@ class MainWindow:
 
         self.set_status(f"Actualise - {datetime.now().strftime('%H:%M')}")
 
+    def _facet_labels(self, facets, all_label: str = 'Toutes') -> List[str]:
+        """
+        Libelles d'une liste de filtre avec le nombre de produits, ex. "EI30 (1 240)"
+
+        Args:
+            facets: Liste de (valeur, nombre) ; nombre None = sans compteur
+            all_label: Premier element (aucun filtre)
+
+        Returns:
+            Liste des libelles
+        """
+        labels = [all_label]
+        for valeur, nb in facets:
+            label = f"{valeur} ({nb:,})".replace(',', ' ') if nb else str(valeur)
+            self._facet_values[label] = str(valeur)
+            labels.append(label)
+        return labels
+
+    def _facet_get(self, var) -> str:
+        """Valeur selectionnee dans une liste de filtre (sans le compteur)"""
+        label = var.get()
+        return self._facet_values.get(label, label)
+
+    def _facet_set(self, var, valeur: str, combo=None, all_label: str = 'Toutes') -> bool:
+        """
+        Selectionne une valeur dans une liste de filtre (libelle avec compteur)
+
+        Returns:
+            False si la valeur n'est plus proposee (selection remise a all_label)
+        """
+        combo = combo or self.category_combo
+        for label in combo['values']:
+            if self._facet_values.get(label, label) == valeur:
+                var.set(label)
+                return True
+        var.set(all_label)
+        return False
+
     def update_subcategories(self, preserve_selection: bool = False):
         """Met a jour la liste des sous-categories niveau 1 selon la categorie selectionnee"""
-        categorie = self.category_var.get()
-        current_selection = self.subcategory_var.get()
+        current_selection = self._facet_get(self.subcategory_var)
 
-        # Utiliser la nouvelle methode avec filtrage
-        subcats = self.db.get_subcategories_filtered(
+        # Valeurs et compteurs lus dans la table des facettes
+        subcats = self.db.get_subcategory_facets(
             level=1,
-            categorie=categorie if categorie != "Toutes" else None
+            categorie=self._facet_get(self.category_var)
         )
-
-        self.subcategory_combo['values'] = ['Toutes'] + subcats
+        self.subcategory_combo['values'] = self._facet_labels(subcats)
 
         # Preserver la selection si demande et si elle existe encore
-        if preserve_selection and current_selection in subcats:
-            self.subcategory_var.set(current_selection)
+        if preserve_selection:
+            self._facet_set(self.subcategory_var, current_selection, self.subcategory_combo)
         else:
             self.subcategory_var.set('Toutes')
 
@@ -740,22 +830,19 @@ class MainWindow:
 
     def update_subcategories2(self, preserve_selection: bool = False):
         """Met a jour la liste des sous-categories niveau 2 selon les filtres precedents"""
-        categorie = self.category_var.get()
-        sous_cat1 = self.subcategory_var.get()
-        current_selection = self.subcategory2_var.get()
+        current_selection = self._facet_get(self.subcategory2_var)
 
-        # Utiliser la methode avec filtrage en cascade
-        subcats2 = self.db.get_subcategories_filtered(
+        # Filtrage en cascade
+        subcats2 = self.db.get_subcategory_facets(
             level=2,
-            categorie=categorie if categorie != "Toutes" else None,
-            sous_categorie=sous_cat1 if sous_cat1 != "Toutes" else None
+            categorie=self._facet_get(self.category_var),
+            sous_categorie=self._facet_get(self.subcategory_var)
         )
-
-        self.subcategory2_combo['values'] = ['Toutes'] + subcats2
+        self.subcategory2_combo['values'] = self._facet_labels(subcats2)
 
         # Preserver la selection si demande et si elle existe encore
-        if preserve_selection and current_selection in subcats2:
-            self.subcategory2_var.set(current_selection)
+        if preserve_selection:
+            self._facet_set(self.subcategory2_var, current_selection, self.subcategory2_combo)
         else:
             self.subcategory2_var.set('Toutes')
 
@@ -764,24 +851,20 @@ class MainWindow:
 
     def update_subcategories3(self, preserve_selection: bool = False):
         """Met a jour la liste des sous-categories niveau 3 selon les filtres precedents"""
-        categorie = self.category_var.get()
-        sous_cat1 = self.subcategory_var.get()
-        sous_cat2 = self.subcategory2_var.get()
-        current_selection = self.subcategory3_var.get()
+        current_selection = self._facet_get(self.subcategory3_var)
 
-        # Utiliser la methode avec filtrage en cascade
-        subcats3 = self.db.get_subcategories_filtered(
+        # Filtrage en cascade
+        subcats3 = self.db.get_subcategory_facets(
             level=3,
-            categorie=categorie if categorie != "Toutes" else None,
-            sous_categorie=sous_cat1 if sous_cat1 != "Toutes" else None,
-            sous_categorie_2=sous_cat2 if sous_cat2 != "Toutes" else None
+            categorie=self._facet_get(self.category_var),
+            sous_categorie=self._facet_get(self.subcategory_var),
+            sous_categorie_2=self._facet_get(self.subcategory2_var)
         )
-
-        self.subcategory3_combo['values'] = ['Toutes'] + subcats3
+        self.subcategory3_combo['values'] = self._facet_labels(subcats3)
 
         # Preserver la selection si demande et si elle existe encore
-        if preserve_selection and current_selection in subcats3:
-            self.subcategory3_var.set(current_selection)
+        if preserve_selection:
+            self._facet_set(self.subcategory3_var, current_selection, self.subcategory3_combo)
         else:
             self.subcategory3_var.set('Toutes')
 
@@ -804,32 +887,29 @@ class MainWindow:
 
     def update_hauteurs(self):
         """Met a jour la liste des hauteurs disponibles"""
-        categorie = self.category_var.get()
-        categorie = categorie if categorie != "Toutes" else None
-        hauteurs = self.db.get_hauteurs_distinctes(categorie)
-        self.hauteur_combo['values'] = ['Toutes'] + [str(h) for h in hauteurs]
+        hauteurs = self.db.get_facettes('hauteur', categorie=self._facet_get(self.category_var))
+        self.hauteur_combo['values'] = self._facet_labels(hauteurs)
         self.hauteur_var.set('Toutes')
 
     def update_largeurs(self):
         """Met a jour la liste des largeurs disponibles"""
-        categorie = self.category_var.get()
-        categorie = categorie if categorie != "Toutes" else None
-        hauteur_str = self.hauteur_var.get()
+        hauteur_str = self._facet_get(self.hauteur_var)
         hauteur = int(hauteur_str) if hauteur_str and hauteur_str != "Toutes" else None
-        largeurs = self.db.get_largeurs_distinctes(categorie, hauteur)
-        self.largeur_combo['values'] = ['Toutes'] + [str(l) for l in largeurs]
+        largeurs = self.db.get_facettes('largeur', categorie=self._facet_get(self.category_var),
+                                        hauteur=hauteur)
+        self.largeur_combo['values'] = self._facet_labels(largeurs)
         self.largeur_var.set('Toutes')
 
     def update_fournisseurs(self):
         """Met a jour la liste des fournisseurs disponibles"""
-        fournisseurs = self.db.get_fournisseurs_distincts()
-        self.fournisseur_combo['values'] = ['Tous'] + fournisseurs
+        fournisseurs = self.db.get_facettes('fournisseur')
+        self.fournisseur_combo['values'] = self._facet_labels(fournisseurs, all_label='Tous')
         self.fournisseur_var.set('Tous')
 
     def update_marques(self):
         """Met a jour la liste des marques disponibles"""
-        marques = self.db.get_marques_distinctes()
-        self.marque_combo['values'] = ['Toutes'] + marques
+        marques = self.db.get_facettes('marque')
+        self.marque_combo['values'] = self._facet_labels(marques)
         self.marque_var.set('Toutes')
 
     def on_hauteur_change(self, event=None):
@@ -837,17 +917,22 @@ class MainWindow:
         self.update_largeurs()
         self.on_search()
 
-    def on_search(self, *args):
-        """Execute la recherche (optimisee pour gros volumes)"""
+    def on_search(self, *args, debounce: bool = False):
+        """
+        Lance la recherche en arriere-plan (optimisee pour gros volumes)
+
+        Args:
+            debounce: True pour la saisie clavier (attend la fin de la frappe)
+        """
         terme = self.search_var.get()
-        categorie = self.category_var.get()
-        subcategorie = self.subcategory_var.get()
-        subcategorie2 = self.subcategory2_var.get()
-        subcategorie3 = self.subcategory3_var.get()
-        hauteur_str = self.hauteur_var.get()
-        largeur_str = self.largeur_var.get()
-        fournisseur = self.fournisseur_var.get()
-        marque = self.marque_var.get()
+        categorie = self._facet_get(self.category_var)
+        subcategorie = self._facet_get(self.subcategory_var)
+        subcategorie2 = self._facet_get(self.subcategory2_var)
+        subcategorie3 = self._facet_get(self.subcategory3_var)
+        hauteur_str = self._facet_get(self.hauteur_var)
+        largeur_str = self._facet_get(self.largeur_var)
+        fournisseur = self._facet_get(self.fournisseur_var)
+        marque = self._facet_get(self.marque_var)
 
         # Convertir hauteur/largeur
         hauteur = int(hauteur_str) if hauteur_str and hauteur_str != "Toutes" else None
@@ -856,13 +941,11 @@ class MainWindow:
         # Filtres documents (fix issue #27)
         has_fiche = True if self.has_fiche_var.get() == 1 else None
         has_devis = True if self.has_devis_var.get() == 1 else None
-
-        # Limite d'affichage pour les performances
-        display_limit = 500
+        liens_casses = True if self.broken_links_var.get() == 1 else None
 
         # Recherche optimisee : tous les filtres passes a la DB
-        produits = self.db.search_produits(
-            terme, categorie,
+        criteres = dict(
+            terme=terme, categorie=categorie,
             hauteur=hauteur, largeur=largeur,
             sous_categorie=subcategorie if subcategorie != "Toutes" else "",
             sous_categorie_2=subcategorie2 if subcategorie2 != "Toutes" else "",
@@ -871,72 +954,135 @@ class MainWindow:
             has_devis_fournisseur=has_devis,
             marque=marque if marque != "Toutes" else "",
             fournisseur=fournisseur if fournisseur != "Tous" else "",
-            limit=display_limit
+            liens_casses=liens_casses,
         )
-
-        # Compter le total pour affichage (si limite atteinte)
-        total_count = len(produits)
-        is_truncated = len(produits) >= display_limit
+        order_by, descending = self.sort_order, self.sort_descending
+        if order_by is None:
+            # Sans tri choisi : meilleurs resultats (bm25) d'abord pour une recherche
+            order_by = Database.ORDER_PERTINENCE if terme.strip() else 'categorie'
+
+        def query(reader):
+            # Total (etendue de la barre de defilement), compteurs des filtres
+            # et premiere page seulement
+            result = reader.search_with_facets(limit=self.PAGE_SIZE, order_by=order_by,
+                                               descending=descending, **criteres)
+            # Cles de fin de page : les sauts de la barre de defilement ne relisent
+            # ensuite que la page demandee depuis le thread Tk
+            page_keys = reader.search_page_keys(page_size=self.PAGE_SIZE, order_by=order_by,
+                                                descending=descending, **criteres)
+            return criteres, (order_by, descending), result, page_keys
+
+        # Execution dans le thread de recherche (connexion lecture seule)
+        self.search_scheduler.schedule(query, delay_ms=None if debounce else 0)
+
+    def _poll_file_scans(self):
+        """Releve les passages du scanner de fichiers (thread Tk, periodique)"""
+        changes = 0
+        while True:
+            try:
+                changes += self._scan_results.get_nowait()
+            except queue.Empty:
+                break
+        self._on_files_scanned(changes)
+        self.root.after(self.SCAN_POLL_MS, self._poll_file_scans)
+
+    def _on_files_scanned(self, changes: int):
+        """Rafraichit les badges des fichiers apres un passage du scanner (thread Tk)"""
+        if changes:
+            self.virtual_list.invalidate()
+
+    def _on_search_error(self, error: Exception):
+        """Affiche une erreur de recherche dans la barre de statut"""
+        self.set_status(f"Erreur de recherche: {error}")
+
+    def _on_search_results(self, result):
+        """Affiche les resultats de la derniere recherche (thread Tk)"""
+        criteres, order, result, page_keys = result
+        total = result['total']
 
         try:
             valeur_marge = self.marge_var.get().replace(',', '.').replace('%', '').strip()
-            marge = float(valeur_marge) if valeur_marge else 20
+            self._display_marge = float(valeur_marge) if valeur_marge else 20
         except ValueError:
-            marge = 20
-
-        # Nettoyer les icônes PDF existantes avant de vider le tableau
-        self._clear_pdf_icons()
-
-        # Vider le tableau
-        for item in self.tree.get_children():
-            self.tree.delete(item)
-
-        # Remplir
-        for p in produits:
-            prix_vente = p['prix_achat'] * (1 + marge / 100)
-            # Determiner si PDF/Devis/Devis rapide sont presents (tags seulement, pas de texte visible)
-            has_pdf = bool(p.get('fiche_technique'))
-            has_devis = bool(p.get('devis_fournisseur'))
-            in_cart = self.cart_manager.is_in_cart(p['id'])
-            tags = []
-            if has_pdf:
-                tags.append('has_pdf')
-            if has_devis:
-                tags.append('has_devis')
-            if in_cart:
-                tags.append('in_cart')
-
-            self.tree.insert('', tk.END, values=(
-                p['id'],
-                p['categorie'],
-                p['sous_categorie'] or '-',
-                p.get('sous_categorie_2') or '-',
-                p.get('sous_categorie_3') or '-',
-                p['designation'],
-                p['hauteur'] or '-',
-                p['largeur'] or '-',
-                f"{p['prix_achat']:.2f} EUR",
-                f"{prix_vente:.2f} EUR",
-                p['reference'] or '-',
-                p.get('fournisseur') or '-',
-                p.get('marque') or '-',
-                '',  # Colonne pdf : vide, icone affichee via overlay
-                '',  # Colonne devis : vide, icone affichee via overlay
-                ''   # Colonne cart : vide, icone affichee via overlay
-            ), tags=tuple(tags))
-
-        # Mise a jour compteur (avec indication si tronque)
-        count = len(produits)
-        if is_truncated:
-            self.count_label.config(text=f"{count}+ produits (limite atteinte)")
-        else:
-            self.count_label.config(text=f"{count} produit{'s' if count != 1 else ''}")
-
-        # Forcer la mise à jour du Treeview
-        self.tree.update_idletasks()
-
-        # Mettre à jour les icônes après un court délai
-        self.root.after(300, self._update_all_icons)
+            self._display_marge = 20
+
+        # Les pages suivantes sont lues a la demande avec les memes criteres
+        self._search_criteres = criteres
+        self._search_order = order
+        self._search_page_keys = page_keys
+        self.virtual_list.set_source(total, result['produits'])
+        self._apply_search_facets(result['facettes'])
+
+        # Mise a jour compteur
+        self.count_label.config(text=f"{total:,} produit{'s' if total != 1 else ''}".replace(',', ' '))
+
+    def _apply_search_facets(self, facettes):
+        """Met a jour les compteurs des listes de filtres d'apres la derniere recherche"""
+        counts = dict(facettes['categorie'])
+        self.category_combo['values'] = self._facet_labels(
+            [(nom, counts.get(nom)) for nom in self._category_names])
+        self._facet_set(self.category_var, self._facet_get(self.category_var))
+
+        for field, combo, var, all_label in (
+                ('marque', self.marque_combo, self.marque_var, 'Toutes'),
+                ('fournisseur', self.fournisseur_combo, self.fournisseur_var, 'Tous'),
+                ('hauteur', self.hauteur_combo, self.hauteur_var, 'Toutes'),
+                ('largeur', self.largeur_combo, self.largeur_var, 'Toutes')):
+            current = self._facet_get(var)
+            combo['values'] = self._facet_labels(facettes[field], all_label=all_label)
+            self._facet_set(var, current, combo, all_label)
+
+    def _fetch_product_page(self, after_row, offset: int, limit: int):
+        """
+        Lit une page de produits pour la liste virtuelle (pagination par cle)
+
+        Lecture sur le lecteur du thread Tk (WAL) : jamais bloquee par une
+        ecriture en cours sur la connexion principale. Un saut direct passe par
+        les cles de fin de page calculees avec la recherche (thread de recherche).
+        """
+        order_by, descending = self._search_order
+        with self.db.pool.reader() as reader:
+            after_key = reader.page_key(after_row, order_by) if after_row else None
+            return reader.search_produits_page(after_key=after_key, offset=offset, limit=limit,
+                                               order_by=order_by, descending=descending,
+                                               page_keys=self._search_page_keys,
+                                               **self._search_criteres)
+
+    def _render_product_row(self, p):
+        """Valeurs et tags Treeview d'un produit"""
+        prix_vente = p['prix_achat'] * (1 + self._display_marge / 100)
+        # Determiner si PDF/Devis/Devis rapide sont presents (tags seulement, pas de texte visible)
+        tags = []
+        if p.get('fiche_technique'):
+            tags.append('has_pdf')
+            if p.get('fiche_existe') == 0:
+                tags.append('pdf_broken')  # D'apres l'index fichiers_meta
+        if p.get('devis_fournisseur'):
+            tags.append('has_devis')
+            if p.get('devis_existe') == 0:
+                tags.append('devis_broken')
+        if self.cart_manager.is_in_cart(p['id']):
+            tags.append('in_cart')
+
+        values = (
+            p['id'],
+            p['categorie'],
+            p['sous_categorie'] or '-',
+            p.get('sous_categorie_2') or '-',
+            p.get('sous_categorie_3') or '-',
+            p['designation'],
+            p['hauteur'] or '-',
+            p['largeur'] or '-',
+            f"{p['prix_achat']:.2f} EUR",
+            f"{prix_vente:.2f} EUR",
+            p['reference'] or '-',
+            p.get('fournisseur') or '-',
+            p.get('marque') or '-',
+            '',  # Colonne pdf : vide, icone affichee via overlay
+            '',  # Colonne devis : vide, icone affichee via overlay
+            ''   # Colonne cart : vide, icone affichee via overlay
+        )
+        return values, tags
 
     def clear_search(self):
         """Efface la recherche"""
@@ -951,6 +1097,7 @@ class MainWindow:
         self.marque_var.set("Toutes")
         self.has_fiche_var.set(0)
         self.has_devis_var.set(0)
+        self.broken_links_var.set(0)
         self.update_subcategories()
         self.update_hauteurs()
         self.update_largeurs()
@@ -980,16 +1127,22 @@ class MainWindow:
             messagebox.showerror("Erreur", "Valeur invalide. Entrez un nombre (ex: 20)")
 
     def sort_column(self, col):
-        """Trie le tableau par colonne"""
-        items = [(self.tree.set(k, col), k) for k in self.tree.get_children('')]
-        items.sort()
-        for index, (val, k) in enumerate(items):
-            self.tree.move(k, '', index)
+        """Trie la liste par colonne (cote base, un second clic inverse l'ordre)"""
+        order_by = 'prix_achat' if col == 'prix_vente' else col
+        if order_by not in Database.PAGE_ORDERS:
+            return  # Colonnes d'icones : pas de tri
+        if order_by == self.sort_order:
+            self.sort_descending = not self.sort_descending
+        else:
+            self.sort_order = order_by
+            self.sort_descending = False
+        self.on_search()
 
     def on_add(self):
         """Ajoute un nouveau produit"""
         dialog = ProductDialog(self.root, self.db)
         if dialog.result:
+            self.file_scanner.scan_now()  # Fichiers joints : indexes en arriere-plan
             self.refresh_data()
             self.set_status("Produit ajoute")
 
@@ -1005,6 +1158,7 @@ class MainWindow:
 
         dialog = ProductDialog(self.root, self.db, product_id)
         if dialog.result:
+            self.file_scanner.scan_now()  # Fichiers joints : indexes en arriere-plan
             self.refresh_data()
             self.set_status("Produit modifie")
 
@@ -1029,6 +1183,22 @@ class MainWindow:
             filetypes=[("Fichiers CSV", "*.csv"), ("Tous", "*.*")]
         )
         if filepath:
+            # Mode d'import : ajout simple ou mise a jour d'un tarif fournisseur
+            incremental = messagebox.askyesnocancel(
+                "Mode d'import",
+                "Mettre a jour le catalogue existant (tarif fournisseur) ?\n\n"
+                "Oui : les produits sont rapproches par reference + fournisseur,\n"
+                "seuls les nouveaux et les modifies sont enregistres.\n"
+                "Non : toutes les lignes sont ajoutees comme nouveaux produits."
+            )
+            if incremental is None:
+                return
+            deactivate_missing = incremental and messagebox.askyesno(
+                "Produits absents",
+                "Desactiver les produits des fournisseurs du fichier\n"
+                "qui ne figurent plus dans le tarif ?"
+            )
+
             # Creer le dialogue de progression
             progress = ProgressDialog(self.root, title="Import en cours",
                                        message="Import des produits...")
@@ -1052,10 +1222,24 @@ class MainWindow:
 
             try:
                 self.set_status("Import en cours...")
-                count = self.db.import_csv(filepath, progress_callback=update_progress)
-                progress.close()
-                self.refresh_data()
-                messagebox.showinfo("Import termine", f"{count} produit(s) importe(s)")
+                if incremental:
+                    stats = self.db.import_csv_incremental(filepath, progress_callback=update_progress,
+                                                           deactivate_missing=deactivate_missing)
+                    progress.close()
+                    self.refresh_data()
+                    message = (f"{stats['crees']} produit(s) cree(s)\n"
+                               f"{stats['modifies']} produit(s) mis a jour\n"
+                               f"{stats['inchanges']} produit(s) inchange(s)")
+                    if deactivate_missing:
+                        message += f"\n{stats['desactives']} produit(s) desactive(s)"
+                    if stats['ignores']:
+                        message += f"\n{stats['ignores']} ligne(s) sans reference ignoree(s)"
+                    messagebox.showinfo("Import termine", message)
+                else:
+                    count = self.db.import_csv(filepath, progress_callback=update_progress)
+                    progress.close()
+                    self.refresh_data()
+                    messagebox.showinfo("Import termine", f"{count} produit(s) importe(s)")
             except InterruptedError:
                 progress.close()
                 self.refresh_data()
@@ -1187,22 +1371,35 @@ Prix max: {stats['prix_max']:.2f} EUR
             return
         self.on_edit()
 
-    def _open_pdf_for_item(self, item):
-        """Ouvre la fiche PDF pour un item du tableau"""
+    def _product_for_item(self, item) -> Optional[Dict]:
+        """
+        Produit d'une ligne du tableau : ligne deja chargee par la liste virtuelle,
+        sinon une lecture indexee par id
+        """
+        produit = self.virtual_list.row_for_item(item)
+        if produit is not None:
+            return produit
         values = self.tree.item(item)['values']
         if not values:
-            return
+            return None
+        produit = self.virtual_list.row_by_id(values[0])
+        if produit is None:
+            produits = self.db.get_produits_by_ids([values[0]])
+            produit = produits[0] if produits else None
+        return produit
 
-        product_id = values[0]
-        produit = self.db.get_produit(product_id)
+    def _open_pdf_for_item(self, item):
+        """Ouvre la fiche PDF pour un item du tableau"""
+        produit = self._product_for_item(item)
         if not produit:
             return
 
-        filepath = produit.get('fiche_technique')
+        filepath = self.db.resolve_fiche_path(produit.get('fiche_technique'))
         if not filepath:
             return
 
         if not os.path.exists(filepath):
+            self.file_scanner.scan_now()  # Mettre a jour les badges de liens casses
             messagebox.showerror("Erreur", f"Le fichier n'existe pas:\n{filepath}")
             return
 
@@ -1528,150 +1725,47 @@ Prix max: {stats['prix_max']:.2f} EUR
         self._copy_to_clipboard(row_text)
 
     def _on_vsb_scroll(self, *args):
-        """Callback pour le scroll vertical"""
-        self.tree.yview(*args)
-        self._update_all_icons()
+        """Callback pour le scroll vertical (deplace la fenetre de la liste virtuelle)"""
+        self.virtual_list.yview(*args)
 
     def _on_hsb_scroll(self, *args):
         """Callback pour le scroll horizontal"""
         self.tree.xview(*args)
         self._update_all_icons()
 
-    def _on_tree_vsb(self, *args):
-        """Callback quand le Treeview scrolle verticalement"""
-        self.vsb.set(*args)
-        self._update_all_icons()
-
     def _on_tree_hsb(self, *args):
         """Callback quand le Treeview scrolle horizontalement"""
         self.hsb.set(*args)
         self._update_all_icons()
 
-    def _clear_pdf_icons(self):
-        """Nettoie toutes les icônes affichées (PDF, Devis et Devis rapide)"""
-        for label in self.pdf_labels:
-            try:
-                label.place_forget()
-                label.destroy()
-            except:
-                pass
-        self.pdf_labels.clear()
-
-        for label in self.devis_labels:
-            try:
-                label.place_forget()
-                label.destroy()
-            except:
-                pass
-        self.devis_labels.clear()
-
-        for label in self.cart_labels:
-            try:
-                label.place_forget()
-                label.destroy()
-            except:
-                pass
-        self.cart_labels.clear()
-
     def _update_all_icons(self):
         """Met à jour toutes les icônes (PDF, Devis et Devis rapide)"""
-        # Nettoyer toutes les icônes une seule fois au début
-        self._clear_pdf_icons()
-        # Recréer toutes les icônes
-        self._update_pdf_icons()
-        self._update_devis_icons()
-        self._update_cart_icons()
-
-    def _update_pdf_icons(self):
-        """Met à jour les positions des icônes PDF avec des Labels overlay"""
-        if not self.pdf_icon:
-            return
-
-        # Obtenir les limites du Treeview
-        try:
-            tree_height = self.tree.winfo_height()
-            tree_width = self.tree.winfo_width()
-        except:
-            return
-
-        # Obtenir la colonne PDF (index 9)
-        try:
-            # Parcourir les items visibles
-            for item in self.tree.get_children():
-                bbox = self.tree.bbox(item, 'pdf')
-                if bbox:  # Item visible
-                    # Vérifier que la cellule est bien dans les limites du Treeview
-                    if bbox[1] < 0 or bbox[1] + bbox[3] > tree_height:
-                        continue  # Cellule en dehors de la vue verticale
-
-                    if bbox[0] < 0 or bbox[0] + bbox[2] > tree_width:
-                        continue  # Cellule en dehors de la vue horizontale
-
-                    # Vérifier si l'item a le tag 'has_pdf'
-                    tags = self.tree.item(item)['tags']
-                    if 'has_pdf' in tags:  # A un PDF
-                        # Créer un label avec l'icône
-                        # bbox retourne (x, y, width, height) de la cellule
-                        x = bbox[0] + (bbox[2] - 24) // 2  # Centrer horizontalement
-                        y = bbox[1] + (bbox[3] - 24) // 2 + 1  # Centrer verticalement avec petit ajustement
-
-                        label = tk.Label(self.tree.master, image=self.pdf_icon,
-                                        bg='white', cursor='hand2',
-                                        bd=0, relief='flat')
-                        label.place(x=x, y=y, width=24, height=24)
-
-                        # Bind pour ouvrir le PDF au clic
-                        label.bind('<Button-1>', lambda e, i=item: self._on_pdf_icon_click(i))
-
-                        self.pdf_labels.append(label)
-
-        except Exception as e:
-            pass  # Ignorer les erreurs de positionnement
-
-    def _update_devis_icons(self):
-        """Met à jour les positions des icônes Devis avec des Labels overlay"""
-        if not self.devis_icon:
-            return
-
-        # Obtenir les limites du Treeview
-        try:
-            tree_height = self.tree.winfo_height()
-            tree_width = self.tree.winfo_width()
-        except:
-            return
-
-        # Obtenir la colonne Devis (index 10)
-        try:
-            # Parcourir les items visibles
-            for item in self.tree.get_children():
-                bbox = self.tree.bbox(item, 'devis')
-                if bbox:  # Item visible
-                    # Vérifier que la cellule est bien dans les limites du Treeview
-                    if bbox[1] < 0 or bbox[1] + bbox[3] > tree_height:
-                        continue  # Cellule en dehors de la vue verticale
-
-                    if bbox[0] < 0 or bbox[0] + bbox[2] > tree_width:
-                        continue  # Cellule en dehors de la vue horizontale
-
-                    # Vérifier si l'item a le tag 'has_devis'
-                    tags = self.tree.item(item)['tags']
-                    if 'has_devis' in tags:  # A un devis
-                        # Créer un label avec l'icône
-                        x = bbox[0] + (bbox[2] - 24) // 2  # Centrer horizontalement
-                        y = bbox[1] + (bbox[3] - 24) // 2 + 1  # Centrer verticalement
-
-                        label = tk.Label(self.tree.master, image=self.devis_icon,
-                                        bg='white', cursor='hand2',
-                                        bd=0, relief='flat')
-                        label.place(x=x, y=y, width=24, height=24)
-
-                        # Bind pour ouvrir le devis au clic
-                        label.bind('<Button-1>', lambda e, i=item: self._on_devis_icon_click(i))
-
-                        self.devis_labels.append(label)
-
-        except Exception as e:
-            pass  # Ignorer les erreurs de positionnement
+        selection = self.tree.selection()
+        self.icon_layer.update(self.virtual_list.visible_tags(),
+                               selected=selection[0] if selection else None)
+
+    def _draw_icon_cell(self, column: str, tags):
+        """Contenu d'une cellule d'icone selon les tags de la ligne"""
+        if column == 'pdf':
+            if 'pdf_broken' in tags:
+                return ('text', "!", Theme.COLORS['danger'])  # Lien casse
+            return ('image', self.pdf_icon) if self.pdf_icon and 'has_pdf' in tags else None
+        if column == 'devis':
+            if 'devis_broken' in tags:
+                return ('text', "!", Theme.COLORS['danger'])
+            return ('image', self.devis_icon) if self.devis_icon and 'has_devis' in tags else None
+        if 'in_cart' in tags:
+            return ('text', "\u2713", Theme.COLORS['success'])  # ✓
+        return ('text', "+", Theme.COLORS['secondary'])
+
+    def _on_icon_click(self, column: str, item):
+        """Gere le clic sur une icone du calque"""
+        if column == 'pdf':
+            self._on_pdf_icon_click(item)
+        elif column == 'devis':
+            self._on_devis_icon_click(item)
+        else:
+            self._on_cart_icon_click(item)
 
     def _on_pdf_icon_click(self, item):
         """Gère le clic sur une icône PDF"""
@@ -1685,23 +1779,17 @@ Prix max: {stats['prix_max']:.2f} EUR
 
     def _open_devis_for_item(self, item):
         """Ouvre le devis pour un item du tableau"""
-        values = self.tree.item(item)['values']
-        if not values:
-            return
-
-        product_id = values[0]
-        produit = self.db.get_produit(product_id)
+        produit = self._product_for_item(item)
         if not produit:
             return
 
-        filepath = produit.get('devis_fournisseur')
+        # Résoudre le chemin
+        filepath = self.db.resolve_fiche_path(produit.get('devis_fournisseur'))
         if not filepath:
             return
 
-        # Résoudre le chemin
-        filepath = self.db.resolve_fiche_path(filepath)
-
         if not os.path.exists(filepath):
+            self.file_scanner.scan_now()  # Mettre a jour les badges de liens casses
             messagebox.showerror("Erreur", f"Le fichier n'existe pas:\n{filepath}")
             return
 
@@ -1718,56 +1806,13 @@ Prix max: {stats['prix_max']:.2f} EUR
 
     # ==================== GESTION DU PANIER ====================
 
-    def _update_cart_icons(self):
-        """Met a jour les positions des icones Devis rapide avec des Labels overlay"""
-        try:
-            tree_height = self.tree.winfo_height()
-            tree_width = self.tree.winfo_width()
-        except:
-            return
-
-        try:
-            for item in self.tree.get_children():
-                bbox = self.tree.bbox(item, 'cart')
-                if bbox:
-                    if bbox[1] < 0 or bbox[1] + bbox[3] > tree_height:
-                        continue
-                    if bbox[0] < 0 or bbox[0] + bbox[2] > tree_width:
-                        continue
-
-                    values = self.tree.item(item)['values']
-                    product_id = values[0]
-                    in_cart = self.cart_manager.is_in_cart(product_id)
-
-                    x = bbox[0] + (bbox[2] - 24) // 2
-                    y = bbox[1] + (bbox[3] - 24) // 2 + 1
-
-                    emoji = "\u2713" if in_cart else "+"  # ✓ ou +
-                    color = Theme.COLORS['success'] if in_cart else Theme.COLORS['secondary']
-
-                    label = tk.Label(self.tree.master, text=emoji,
-                                    font=('Segoe UI', 12, 'bold'),
-                                    bg='white', fg=color,
-                                    cursor='hand2', bd=0, relief='flat')
-                    label.place(x=x, y=y, width=24, height=24)
-
-                    label.bind('<Button-1>', lambda e, i=item: self._on_cart_icon_click(i))
-
-                    self.cart_labels.append(label)
-
-        except Exception as e:
-            pass
-
     def _on_cart_icon_click(self, item):
         """Gere le clic sur une icone Devis rapide"""
-        values = self.tree.item(item)['values']
-        product_id = values[0]
-
-        produits = self.db.search_produits()
-        product = next((p for p in produits if p['id'] == product_id), None)
-
+        # Le produit affiche est deja en memoire dans la liste virtuelle
+        product = self._product_for_item(item)
         if not product:
             return
+        product_id = product['id']
 
         if self.cart_manager.is_in_cart(product_id):
             self.cart_manager.remove_from_cart(product_id)
@@ -1777,7 +1822,7 @@ Prix max: {stats['prix_max']:.2f} EUR
             self.set_status(f"Article ajoute au devis: {product['designation']}")
 
         self._update_cart_button()
-        self._update_all_icons()
+        self.virtual_list.refresh()
 
     def _update_cart_button(self):
         """Met a jour le compteur du bouton devis rapide"""
@@ -1808,8 +1853,9 @@ Prix max: {stats['prix_max']:.2f} EUR
 
     def on_closing(self):
         """Ferme l'application"""
-        # Nettoyer les icônes PDF
-        self._clear_pdf_icons()
+        # Arreter le thread de recherche et le scanner de fichiers
+        self.search_scheduler.close()
+        self.file_scanner.close()
 
         self.db.close()
         self.root.destroy()
@@ -14,6 +14,7 @@ from ui.theme import Theme
 from ui.dpgf_import_dialog import DPGFImportDialog, ChantierEditDialog, TYPES_MARCHE
 from ui.dpgf_chiffrage_view import DPGFChiffrageView
 from ui.resultat_marche_dialog import get_resultat_color, get_resultat_label, RESULTATS
+from ui.actualisation_prix_dialog import ActualisationPrixDialog
 
 
 class MarchesAnalyseView:
@@ -206,6 +207,13 @@ class MarchesAnalyseView:
                  bd=0, padx=16, pady=10, cursor='hand2',
                  command=self._delete_chantier).pack(side=tk.LEFT, padx=(8, 0))
 
+        tk.Button(action_bar, text="Actualiser les prix",
+                 font=Theme.FONTS['body'],
+                 bg=Theme.COLORS['bg_dark'],
+                 fg=Theme.COLORS['text'],
+                 bd=0, padx=16, pady=10, cursor='hand2',
+                 command=self._actualiser_prix).pack(side=tk.LEFT, padx=(8, 0))
+
         tk.Button(action_bar, text="Fermer",
                  font=Theme.FONTS['body'],
                  bg=Theme.COLORS['bg_dark'],
@@ -358,6 +366,12 @@ class MarchesAnalyseView:
             self.db.delete_chantier(chantier_id)
             self._load_chantiers()
 
+    def _actualiser_prix(self):
+        """Reporte les prix catalogue modifies sur les chantiers"""
+        dialog = ActualisationPrixDialog(self.window, self.db)
+        if dialog.result:
+            self._load_chantiers()
+
     def _show_context_menu(self, event):
         """Affiche le menu contextuel"""
         # Selectionner la ligne sous le curseur
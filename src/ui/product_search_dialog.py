@@ -346,8 +346,10 @@ class ProductSearchDialog:
         has_fiche = True if self.has_fiche_var.get() == 1 else None
         has_devis = True if self.has_devis_var.get() == 1 else None
 
-        produits = self.db.search_produits(
-            terme, categorie,
+        # Resultats et total en une lecture (ordre de pertinence de search_produits)
+        result = self.db.search_with_facets(
+            limit=5000, order_by=None, facets=(),
+            terme=terme, categorie=categorie,
             sous_categorie=sous_cat,
             sous_categorie_2=sous_cat2,
             sous_categorie_3=sous_cat3,
@@ -355,6 +357,7 @@ class ProductSearchDialog:
             has_devis_fournisseur=has_devis,
             marque=marque
         )
+        produits = result['produits']
 
         # Vider le tableau
         for item in self.tree.get_children():
@@ -372,7 +375,10 @@ class ProductSearchDialog:
                 p['reference'] or '-',
             ))
 
-        self.count_label.config(text=f"{len(produits)} produit(s)")
+        if result['total'] > len(produits):
+            self.count_label.config(text=f"{len(produits)} / {result['total']} produit(s)")
+        else:
+            self.count_label.config(text=f"{len(produits)} produit(s)")
 
     def _create_product(self):
         """Ouvre le dialogue de creation de produit"""
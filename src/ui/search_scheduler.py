@@ -0,0 +1,201 @@
+"""
+Planificateur de recherches catalogue en arriere-plan
+
+Ce module execute les recherches hors du thread Tk :
+- anti-rebond (debounce) de la saisie
+- execution sur un thread de travail avec sa propre connexion SQLite en lecture seule
+- numero de generation : les resultats d'une recherche obsolete sont ignores
+- seul le dernier resultat est livre au thread Tk : le thread de travail le
+  depose dans une file, que le thread Tk releve par root.after (Tk n'est
+  jamais appele depuis le thread de travail)
+"""
+
+import queue
+import sqlite3
+import threading
+from typing import Callable, Optional, TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from database import Database
+
+
+POLL_MS = 20  # Releve des resultats tant qu'une recherche est en cours
+
+
+class SearchScheduler:
+    """Planifie et annule les recherches catalogue executees en arriere-plan"""
+
+    def __init__(self, root, db: 'Database', on_results: Callable,
+                 on_error: Callable = None, delay_ms: int = 250):
+        """
+        Initialise le planificateur et demarre le thread de travail
+
+        Args:
+            root: Fenetre Tk (pour root.after, appele depuis le thread Tk uniquement)
+            db: Base de donnees principale (sert a ouvrir le lecteur du thread)
+            on_results: Callback(resultat) appele dans le thread Tk
+            on_error: Callback(exception) appele dans le thread Tk (optionnel)
+            delay_ms: Delai d'anti-rebond par defaut pour la saisie
+        """
+        self.root = root
+        self.db = db
+        self.on_results = on_results
+        self.on_error = on_error
+        self.delay_ms = delay_ms
+
+        self._generation = 0
+        self._after_id = None
+        self._pending = None  # (generation, query) en attente pour le thread
+        self._running_generation = None
+        self._reader: Optional['Database'] = None
+        self._closed = False
+        self._cond = threading.Condition()
+        self._results = queue.Queue()  # (generation, resultat, erreur) deposes par le thread
+        self._delivered = 0  # Derniere generation livree au thread Tk
+        self._poll_id = None
+
+        self._thread = threading.Thread(target=self._worker, name="catalogue-search")
+        self._thread.daemon = True
+        self._thread.start()
+
+    @property
+    def generation(self) -> int:
+        """Numero de la derniere recherche demandee"""
+        return self._generation
+
+    def schedule(self, query: Callable, delay_ms: int = None) -> int:
+        """
+        Planifie une recherche (remplace toute recherche en attente)
+
+        Args:
+            query: Fonction query(reader_db) executee dans le thread de travail
+            delay_ms: Delai d'anti-rebond (None = delai par defaut, 0 = immediat)
+
+        Returns:
+            Numero de generation de la recherche
+        """
+        self._generation += 1
+        generation = self._generation
+
+        if self._after_id is not None:
+            self.root.after_cancel(self._after_id)
+            self._after_id = None
+
+        # Une requete plus ancienne en cours d'execution est devenue inutile
+        self._interrupt_stale()
+
+        delay = self.delay_ms if delay_ms is None else delay_ms
+        self._after_id = self.root.after(delay, lambda: self._submit(generation, query))
+        return generation
+
+    def close(self):
+        """Arrete le thread de travail et ferme sa connexion"""
+        for after_id in (self._after_id, self._poll_id):
+            if after_id is not None:
+                try:
+                    self.root.after_cancel(after_id)
+                except Exception:
+                    pass
+        self._after_id = None
+        self._poll_id = None
+        with self._cond:
+            self._closed = True
+            self._pending = None
+            self._cond.notify()
+        self._interrupt_stale(force=True)
+
+    def _submit(self, generation: int, query: Callable):
+        """Transmet la recherche au thread de travail (thread Tk)"""
+        self._after_id = None
+        if generation != self._generation:
+            return
+        with self._cond:
+            # Seule la derniere recherche compte : on ecrase celle en attente
+            self._pending = (generation, query)
+            self._cond.notify()
+        if self._poll_id is None:
+            self._poll_id = self.root.after(POLL_MS, self._poll)
+
+    def _poll(self):
+        """Releve les resultats deposes par le thread de travail (thread Tk)"""
+        self._poll_id = None
+        while True:
+            try:
+                generation, result, error = self._results.get_nowait()
+            except queue.Empty:
+                break
+            self._deliver(generation, result, error)
+        # Continuer tant que la derniere recherche n'est pas livree
+        if self._delivered < self._generation and not self._closed:
+            self._poll_id = self.root.after(POLL_MS, self._poll)
+
+    def _interrupt_stale(self, force: bool = False):
+        """Interrompt la requete SQLite en cours si elle est obsolete"""
+        reader = self._reader
+        running = self._running_generation
+        if reader is None or running is None:
+            return
+        if force or running != self._generation:
+            try:
+                reader.conn.interrupt()
+            except Exception:
+                pass
+
+    def _worker(self):
+        """Boucle du thread de travail"""
+        try:
+            while True:
+                with self._cond:
+                    while self._pending is None and not self._closed:
+                        self._cond.wait()
+                    if self._closed:
+                        return
+                    generation, query = self._pending
+                    self._pending = None
+
+                if generation != self._generation:
+                    continue
+
+                if self._reader is None:
+                    try:
+                        self._reader = self.db.open_reader()
+                    except Exception as e:
+                        self._post(generation, error=e)
+                        continue
+
+                self._running_generation = generation
+                try:
+                    result = query(self._reader)
+                except sqlite3.OperationalError as e:
+                    # 'interrupted' : une recherche plus recente a pris le relais
+                    if generation == self._generation:
+                        self._post(generation, error=e)
+                    continue
+                except Exception as e:
+                    self._post(generation, error=e)
+                    continue
+                finally:
+                    self._running_generation = None
+
+                self._post(generation, result=result)
+        finally:
+            if self._reader is not None:
+                self._reader.close()
+                self._reader = None
+
+    def _post(self, generation: int, result=None, error: Exception = None):
+        """Depose le resultat pour le thread Tk (ignore s'il est deja obsolete)"""
+        if generation != self._generation or self._closed:
+            return
+        self._results.put((generation, result, error))
+
+    def _deliver(self, generation: int, result, error: Exception):
+        """Livre le resultat dans le thread Tk si c'est toujours le plus recent"""
+        if generation != self._generation or self._closed:
+            return
+        self._delivered = generation
+        if error is not None:
+            if self.on_error:
+                self.on_error(error)
+            return
+        self.on_results(result)
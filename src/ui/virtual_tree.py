@@ -0,0 +1,292 @@
+"""
+Liste virtuelle pour ttk.Treeview
+
+Le Treeview ne contient que les lignes visibles (un "slot" par ligne affichee,
+reutilise a chaque defilement). Les donnees sont lues par pages a la demande
+(pagination par cle) et gardees dans un petit cache LRU : memoire et cout
+d'insertion constants, quel que soit le nombre de resultats.
+"""
+
+import tkinter as tk
+from tkinter import ttk
+from collections import OrderedDict
+from typing import Callable, Dict, List, Optional, Tuple
+
+
+class VirtualTreeview:
+    """Affiche une fenetre glissante d'un grand jeu de resultats dans un Treeview"""
+
+    def __init__(self, tree: ttk.Treeview, vsb: ttk.Scrollbar,
+                 fetch_page: Callable, render_row: Callable,
+                 page_size: int = 100, max_pages: int = 8,
+                 on_render: Callable = None):
+        """
+        Initialise la liste virtuelle
+
+        Args:
+            tree: Treeview d'affichage (ne contient que les lignes visibles)
+            vsb: Barre de defilement verticale (etendue = nombre total de lignes)
+            fetch_page: fetch_page(after_row, offset, limit) -> liste de lignes.
+                        after_row est la derniere ligne de la page precedente si
+                        elle est en cache (pagination par cle), sinon None et
+                        offset indique la position de depart.
+            render_row: render_row(row) -> (values, tags) pour le Treeview
+            page_size: Nombre de lignes lues par requete
+            max_pages: Nombre de pages gardees en cache
+            on_render: Callback appele apres chaque mise a jour des lignes visibles
+        """
+        self.tree = tree
+        self.vsb = vsb
+        self.fetch_page = fetch_page
+        self.render_row = render_row
+        self.page_size = page_size
+        self.max_pages = max_pages
+        self.on_render = on_render
+
+        self.total = 0
+        self.top = 0
+        self.selected_id = None
+
+        self._pages: 'OrderedDict[int, List[Dict]]' = OrderedDict()
+        self._rows_by_id: Dict[int, Dict] = {}  # Index id -> ligne des pages en cache
+        self._slots: List[str] = []
+        self._slot_rows: List[Optional[Dict]] = []
+        self._slot_rendered: List[Optional[Tuple]] = []
+        self._row_height = None
+        self._header_height = None
+
+        self.tree.bind('<MouseWheel>', self._on_mousewheel)
+        self.tree.bind('<Button-4>', lambda e: self._scroll_and_break(-3))
+        self.tree.bind('<Button-5>', lambda e: self._scroll_and_break(3))
+        self.tree.bind('<Down>', lambda e: self._on_key_step(1))
+        self.tree.bind('<Up>', lambda e: self._on_key_step(-1))
+        self.tree.bind('<Next>', lambda e: self._scroll_and_break(self.visible_count()))
+        self.tree.bind('<Prior>', lambda e: self._scroll_and_break(-self.visible_count()))
+        self.tree.bind('<<TreeviewSelect>>', self._on_select, add='+')
+        self.tree.bind('<Configure>', lambda e: self.render(), add='+')
+
+    # ==================== SOURCE DE DONNEES ====================
+
+    def set_source(self, total: int, first_page: List[Dict] = None):
+        """
+        Remplace le jeu de resultats (nouvelle recherche)
+
+        Args:
+            total: Nombre total de lignes (etendue de la barre de defilement)
+            first_page: Premiere page deja chargee (optionnel)
+        """
+        self.total = total
+        self.top = 0
+        self._pages.clear()
+        self._rows_by_id.clear()
+        if first_page is not None:
+            self._store_page(0, first_page)
+        self.tree.selection_remove(self.tree.selection())
+        self.render(force=True)
+
+    def invalidate(self):
+        """Vide le cache de pages (donnees modifiees) et reaffiche la fenetre courante"""
+        self._pages.clear()
+        self._rows_by_id.clear()
+        self.render(force=True)
+
+    def refresh(self):
+        """Recalcule l'affichage des lignes visibles sans relire la base"""
+        self.render(force=True)
+
+    def row_at(self, index: int) -> Optional[Dict]:
+        """Retourne la ligne a la position absolue index (lue si necessaire)"""
+        if index < 0 or index >= self.total:
+            return None
+        page = self._load_page(index // self.page_size)
+        offset = index % self.page_size
+        return page[offset] if offset < len(page) else None
+
+    def row_for_item(self, iid: str) -> Optional[Dict]:
+        """Retourne la ligne affichee dans le slot iid du Treeview"""
+        try:
+            return self._slot_rows[self._slots.index(iid)]
+        except (ValueError, IndexError):
+            return None
+
+    def row_by_id(self, row_id: int) -> Optional[Dict]:
+        """Retourne une ligne en cache par son id (sans lecture en base)"""
+        return self._rows_by_id.get(row_id)
+
+    def cached_rows(self):
+        """Itere sur les lignes actuellement en cache"""
+        for page in self._pages.values():
+            yield from page
+
+    def visible_items(self) -> List[Tuple[str, Dict]]:
+        """Retourne les couples (iid, ligne) actuellement affiches"""
+        return [(iid, row) for iid, row in zip(self._slots, self._slot_rows) if row is not None]
+
+    def visible_tags(self) -> List[Tuple[str, Tuple]]:
+        """Retourne les couples (iid, tags) affiches, sans interroger le Treeview"""
+        return [(iid, rendered[1]) for iid, row, rendered
+                in zip(self._slots, self._slot_rows, self._slot_rendered) if row is not None]
+
+    def _load_page(self, page_index: int) -> List[Dict]:
+        """Charge une page (cache LRU, pagination par cle si la page precedente est connue)"""
+        page = self._pages.get(page_index)
+        if page is not None:
+            self._pages.move_to_end(page_index)
+            return page
+
+        previous = self._pages.get(page_index - 1)
+        after_row = previous[-1] if previous and len(previous) == self.page_size else None
+        page = self.fetch_page(after_row, page_index * self.page_size, self.page_size)
+        self._store_page(page_index, page)
+        return page
+
+    def _store_page(self, page_index: int, page: List[Dict]):
+        """Ajoute une page au cache et a l'index par id (eviction LRU)"""
+        self._pages[page_index] = page
+        for row in page:
+            self._rows_by_id[row.get('id')] = row
+        while len(self._pages) > self.max_pages:
+            _, evicted = self._pages.popitem(last=False)
+            for row in evicted:
+                if self._rows_by_id.get(row.get('id')) is row:
+                    del self._rows_by_id[row.get('id')]
+
+    # ==================== AFFICHAGE ====================
+
+    def row_height(self) -> int:
+        """Hauteur d'une ligne (mesuree, sinon lue dans le style)"""
+        if self._row_height:
+            return self._row_height
+        try:
+            return int(ttk.Style().lookup('Treeview', 'rowheight')) or 20
+        except (tk.TclError, ValueError):
+            return 20
+
+    def header_height(self) -> int:
+        """Hauteur de l'en-tete (mesuree, sinon estimee)"""
+        return self._header_height if self._header_height is not None else 28
+
+    def visible_count(self) -> int:
+        """Nombre de lignes entierement visibles dans le Treeview"""
+        height = self.tree.winfo_height()
+        if height <= 1:
+            return 1
+        return max(1, (height - self.header_height()) // self.row_height())
+
+    def _measure(self):
+        """Mesure en-tete et hauteur de ligne sur le premier slot affiche"""
+        if not self._slots:
+            return
+        try:
+            bbox = self.tree.bbox(self._slots[0])
+        except tk.TclError:
+            return
+        if bbox:
+            self._header_height = bbox[1]
+            self._row_height = bbox[3]
+
+    def render(self, force: bool = False):
+        """Met a jour les slots visibles pour la position courante"""
+        visible = self.visible_count()
+        self.top = max(0, min(self.top, self.total - visible))
+        count = max(0, min(visible, self.total - self.top))
+
+        # Ajuster le nombre de slots a la hauteur de la vue
+        while len(self._slots) < count:
+            iid = self.tree.insert('', tk.END, iid=f"vrow{len(self._slots)}", values=())
+            self._slots.append(iid)
+            self._slot_rows.append(None)
+            self._slot_rendered.append(None)
+        while len(self._slots) > count:
+            self.tree.delete(self._slots.pop())
+            self._slot_rows.pop()
+            self._slot_rendered.pop()
+
+        selected_iid = None
+        for index, iid in enumerate(self._slots):
+            row = self.row_at(self.top + index)
+            self._slot_rows[index] = row
+            if row is None:
+                rendered = ((), ())
+            else:
+                values, tags = self.render_row(row)
+                rendered = (tuple(values), tuple(tags))
+            # Ne toucher au Treeview que si la ligne a change
+            if force or rendered != self._slot_rendered[index]:
+                self.tree.item(iid, values=rendered[0], tags=rendered[1])
+                self._slot_rendered[index] = rendered
+            if row is not None and row.get('id') == self.selected_id:
+                selected_iid = iid
+
+        # La selection suit le produit, pas le slot
+        current = self.tree.selection()
+        if selected_iid and current != (selected_iid,):
+            self.tree.selection_set(selected_iid)
+            self.tree.focus(selected_iid)
+        elif not selected_iid and current:
+            self.tree.selection_remove(current)
+
+        self.tree.yview_moveto(0)
+        if self._row_height is None:
+            self._measure()
+
+        if self.total > 0:
+            self.vsb.set(self.top / self.total, (self.top + count) / self.total)
+        else:
+            self.vsb.set(0, 1)
+
+        if self.on_render:
+            self.on_render()
+
+    # ==================== DEFILEMENT ====================
+
+    def yview(self, *args):
+        """Commande de la barre de defilement ('moveto' / 'scroll')"""
+        if not args:
+            return
+        if args[0] == 'moveto':
+            self.scroll_to(int(float(args[1]) * self.total))
+        elif args[0] == 'scroll':
+            amount = int(args[1])
+            if len(args) > 2 and args[2] == 'pages':
+                amount *= self.visible_count()
+            self.scroll_to(self.top + amount)
+
+    def scroll_to(self, top: int):
+        """Positionne la premiere ligne visible"""
+        top = max(0, min(top, self.total - self.visible_count()))
+        if top != self.top:
+            self.top = top
+            self.render()
+
+    def _scroll_and_break(self, amount: int):
+        self.scroll_to(self.top + amount)
+        return 'break'
+
+    def _on_mousewheel(self, event):
+        # Windows/macOS : delta multiple de 120 (3 lignes par cran)
+        steps = -int(event.delta / 120) if abs(event.delta) >= 120 else (-1 if event.delta > 0 else 1)
+        return self._scroll_and_break(steps * 3)
+
+    def _on_key_step(self, step: int):
+        """Fleches haut/bas : fait defiler quand la selection atteint le bord"""
+        selection = self.tree.selection()
+        if not selection or selection[0] not in self._slots:
+            return None
+        index = self._slots.index(selection[0])
+        if (step > 0 and index < len(self._slots) - 1) or (step < 0 and index > 0):
+            return None  # Deplacement natif a l'interieur de la vue
+
+        target = self.row_at(self.top + index + step)
+        if target is None:
+            return 'break'
+        self.selected_id = target.get('id')
+        self.scroll_to(self.top + step)
+        return 'break'
+
+    def _on_select(self, event=None):
+        selection = self.tree.selection()
+        if selection:
+            row = self.row_for_item(selection[0])
+            if row is not None:
+                self.selected_id = row.get('id')
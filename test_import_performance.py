@@ -13,6 +13,8 @@ import time
 sys.path.insert(0, os.path.join(os.path.dirname(__file__), 'src'))
 
 from database import Database
+import csv
+import random
 import tempfile
 
 def test_import(csv_filepath):
@@ -92,11 +94,58 @@ def test_import(csv_filepath):
             import traceback
             traceback.print_exc()
 
+def generer_csv(csv_filepath, nb_lignes):
+    """Genere un catalogue CSV synthetique (format du modele d'import)"""
+    random.seed(42)
+    categories = ['STANDARD', 'COUPE-FEU', 'ACOUSTIQUE', 'VITREE', 'EXTERIEURE']
+    fournisseurs = ['Dispano', 'Point P', 'Larivière', 'Würth']
+    with open(csv_filepath, 'w', encoding='utf-8-sig', newline='') as f:
+        writer = csv.writer(f, delimiter=';')
+        writer.writerow(['CATEGORIE', 'SOUS-CATEGORIE', 'SOUS-CATEGORIE 2', 'SOUS-CATEGORIE 3',
+                         'DESIGNATION', 'DESCRIPTION', 'DIMENSIONS', 'HAUTEUR', 'LARGEUR',
+                         'PRIX_UNITAIRE_HT', 'ARTICLE', 'FOURNISSEUR', 'MARQUE', 'CHANTIER',
+                         'FICHE_TECHNIQUE', 'FICHIER_PDF'])
+        for i in range(nb_lignes):
+            hauteur = random.choice([2040, 2150, 2250])
+            largeur = random.choice([730, 830, 930])
+            writer.writerow([
+                random.choice(categories), f'EI{random.choice([30, 60, 90])}', 'Bloc-porte', '',
+                f'Bloc-porte {i} {hauteur}x{largeur}', 'Bloc-porte ame pleine, huisserie metal',
+                f'{hauteur} x {largeur}', '', '',
+                f'{random.uniform(50, 900):.2f}'.replace('.', ','), f'REF{i:07d}',
+                random.choice(fournisseurs), 'Malerba', '',
+                f'Fiches_techniques\\fiche_{i % 500}.pdf', '',
+            ])
+
+
+def benchmark(nb_lignes=1_000_000):
+    """Mesure le debit de l'import (lignes/s) sur un catalogue synthetique"""
+    with tempfile.TemporaryDirectory() as tmpdir:
+        csv_filepath = os.path.join(tmpdir, 'catalogue.csv')
+        print(f"Generation de {nb_lignes:,} lignes...")
+        generer_csv(csv_filepath, nb_lignes)
+        print(f"Taille: {os.path.getsize(csv_filepath) / 1024 / 1024:.1f} Mo")
+        print()
+
+        for workers in (0, None):
+            db = Database(data_dir=os.path.join(tmpdir, f'data_{workers}'))
+            start_time = time.time()
+            count = db.import_csv(csv_filepath, workers=workers)
+            elapsed = time.time() - start_time
+            db.close()
+            mode = "sans pool" if workers == 0 else "pool automatique"
+            print(f"  {mode:<18} {count:,} produits en {elapsed:.1f}s - {count / elapsed:,.0f} lignes/s")
+
+
 if __name__ == "__main__":
-    if len(sys.argv) < 2:
+    if len(sys.argv) >= 2 and sys.argv[1] == '--bench':
+        benchmark(int(sys.argv[2]) if len(sys.argv) > 2 else 1_000_000)
+    elif len(sys.argv) < 2:
         print("Usage: python test_import_performance.py <chemin_fichier.csv>")
+        print("       python test_import_performance.py --bench [nombre_de_lignes]")
         print()
         print("Exemple:")
         print("  python test_import_performance.py data/mon_catalogue.csv")
+        print("  python test_import_performance.py --bench 1000000")
     else:
         test_import(sys.argv[1])
@@ -4,11 +4,17 @@ Tests pour le module database
 
 import pytest
 import os
+import socket
+import sqlite3
 import sys
 import tempfile
+import threading
+import zipfile
 
 sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
 from database import Database
+from file_scanner import FileScanner
+from chiffrage_cache import ChiffrageCache
 
 
 class TestDatabase:
@@ -141,6 +147,832 @@ class TestDatabase:
         assert stats['prix_min'] == 100
         assert stats['prix_max'] == 200
 
+    def test_search_plein_texte(self, db):
+        """Test de la recherche FTS5 (prefixes, accents, synchronisation)"""
+        id1 = db.add_produit({'categorie': 'VITREE', 'designation': 'Porte vitrée Delta', 'prix_achat': 100})
+        db.add_produit({'categorie': 'ACOUSTIQUE', 'designation': 'Porte acoustique', 'marque': 'Righini',
+                        'prix_achat': 200})
+
+        # Prefixe et insensibilite aux accents
+        assert len(db.search_produits(terme='acous')) == 1
+        assert len(db.search_produits(terme='vitree')) == 1
+        assert len(db.search_produits(terme='righ')) == 1
+        assert db.count_search_results(terme='porte') == 2
+
+        # Filtres structures appliques en plus du terme
+        assert len(db.search_produits(terme='porte', categorie='VITREE')) == 1
+
+        # L'index suit les mises a jour et suppressions
+        db.update_produit(id1, {'categorie': 'VITREE', 'designation': 'Chassis fixe', 'prix_achat': 100})
+        assert len(db.search_produits(terme='vitree')) == 0
+        assert len(db.search_produits(terme='chassis')) == 1
+        db.delete_produit(id1, permanent=True)
+        assert db.count_search_results(terme='chassis') == 0
+
+    def test_search_classement_pertinence(self, db):
+        """Test du classement bm25 : la reference exacte passe en premier"""
+        db.add_produit({'categorie': 'A', 'designation': 'Ferme-porte CF30 accessoire', 'reference': 'X1',
+                        'prix_achat': 10})
+        db.add_produit({'categorie': 'B', 'designation': 'Bloc-porte', 'reference': 'CF30',
+                        'prix_achat': 10})
+        results = db.search_produits(terme='CF30')
+        assert results[0]['reference'] == 'CF30'
+
+    def test_open_reader_lecture_seule(self, db):
+        """Test du lecteur en lecture seule utilise par la recherche en arriere-plan"""
+        import sqlite3
+        db.add_produit({'categorie': 'CAT1', 'designation': 'Porte EI30', 'prix_achat': 100})
+
+        reader = db.open_reader()
+        try:
+            assert reader.read_only
+            assert len(reader.search_produits(terme='EI30')) == 1
+            with pytest.raises(sqlite3.OperationalError):
+                reader.add_produit({'categorie': 'CAT1', 'designation': 'Interdit'})
+
+            # Le lecteur voit les ecritures validees par la connexion principale
+            db.add_produit({'categorie': 'CAT1', 'designation': 'Porte EI60', 'prix_achat': 120})
+            assert reader.count_search_results(terme='porte') == 2
+        finally:
+            reader.close()
+
+    def test_search_produits_page(self, db):
+        """Test de la pagination par cle (liste virtuelle)"""
+        for i in range(25):
+            db.add_produit({'categorie': f'CAT{i % 3}',
+                            'sous_categorie': None if i % 4 == 0 else f'SC{i % 2}',
+                            'designation': f'Porte {i % 5}' + (' double porte' if i % 3 == 0 else ''),
+                            'prix_achat': 100 + i})
+
+        for order_by, descending, criteres in (('categorie', False, {}), ('prix_achat', True, {}),
+                                               ('sous_categorie', False, {}),
+                                               (db.ORDER_PERTINENCE, False, {'terme': 'porte'})):
+            reference = db.search_produits_page(limit=100, order_by=order_by, descending=descending,
+                                                **criteres)
+            assert len(reference) == 25
+
+            # Pages enchainees par la cle de la derniere ligne
+            pages, after_key = [], None
+            while True:
+                page = db.search_produits_page(after_key=after_key, limit=7,
+                                               order_by=order_by, descending=descending, **criteres)
+                if not page:
+                    break
+                pages.extend(page)
+                after_key = db.page_key(page[-1], order_by)
+            assert [p['id'] for p in pages] == [p['id'] for p in reference]
+
+            # Acces direct coherent avec la pagination par cle : saut par les cles de fin
+            # de page (multiple de limit), sinon par OFFSET
+            for offset in (14, 21, 10, 28):
+                assert db.search_produits_page(offset=offset, limit=7, order_by=order_by,
+                                               descending=descending,
+                                               **criteres) == reference[offset:offset + 7]
+            page_keys = db.search_page_keys(page_size=7, order_by=order_by, descending=descending,
+                                            **criteres)
+            assert len(page_keys) == 3
+
+            # Cles calculees d'avance (thread de recherche) : meme page
+            assert db.search_produits_page(offset=14, limit=7, order_by=order_by,
+                                           descending=descending, page_keys=page_keys,
+                                           **criteres) == reference[14:21]
+
+        # Pertinence : les produits ou le terme revient le plus souvent d'abord
+        classement = db.search_produits_page(limit=100, order_by=db.ORDER_PERTINENCE, terme='porte')
+        assert 'double porte' in classement[0]['designation']
+        assert 'double porte' not in classement[-1]['designation']
+
+        # Les filtres de recherche s'appliquent aussi
+        assert len(db.search_produits_page(categorie='CAT1', limit=100)) == 8
+
+    def test_import_csv(self, db, tmp_path):
+        """Test de l'import CSV en flux (conversion, index plein texte, annulation)"""
+        csv_path = tmp_path / 'catalogue.csv'
+        lignes = ['CATEGORIE;DESIGNATION;DIMENSIONS;HAUTEUR;LARGEUR;PRIX_UNITAIRE_HT;ARTICLE;FOURNISSEUR']
+        lignes += [f'TECHNIQUE;Bloc-porte EI30 n{i};2040 x 830;;;{100 + i},50;CF{i:04d};Dispano'
+                   for i in range(25)]
+        lignes.append('COUPE-FEU;;;;;;;')  # Sans designation : ignoree
+        csv_path.write_text('\n'.join(lignes) + '\n', encoding='utf-8-sig')
+
+        progression = []
+        count = db.import_csv(str(csv_path), workers=0,
+                              progress_callback=lambda c, t: progression.append((c, t)))
+        assert count == 25
+        assert progression[-1] == (26, 26)
+
+        produit = db.search_produits(terme='CF0007')[0]
+        assert produit['hauteur'] == 2040 and produit['largeur'] == 830
+        assert produit['prix_achat'] == 107.5
+        assert 'TECHNIQUE' in db.get_categories_names()
+
+        # Import annule : aucune ligne conservee
+        def annuler(current, total):
+            raise InterruptedError()
+        with pytest.raises(InterruptedError):
+            db.import_csv(str(csv_path), workers=0, progress_callback=annuler)
+        assert db.count_produits() == 25
+        db.add_produit({'categorie': 'CAT1', 'designation': 'Porte EI60', 'prix_achat': 120})
+        assert db.count_search_results(terme='EI60') == 1
+
+    def test_import_csv_incremental(self, db, tmp_path):
+        """Test de la mise a jour d'un tarif fournisseur (reference + fournisseur)"""
+        csv_path = tmp_path / 'tarif.csv'
+        entete = 'CATEGORIE;DESIGNATION;PRIX_UNITAIRE_HT;ARTICLE;FOURNISSEUR'
+
+        def ecrire(lignes):
+            csv_path.write_text('\n'.join([entete] + lignes) + '\n', encoding='utf-8-sig')
+
+        ecrire(['STANDARD;Porte A;100;A1;Dispano', 'STANDARD;Porte B;200;B1;Dispano',
+                'STANDARD;Porte C;300;C1;Dispano', 'STANDARD;Porte autre;50;A1;Point P'])
+        stats = db.import_csv_incremental(str(csv_path), workers=0)
+        assert stats['crees'] == 4
+        produit_b = db.search_produits(terme='B1')[0]
+
+        # B1 change de prix, C1 disparait, D1 apparait, ligne sans reference ignoree
+        ecrire(['STANDARD;Porte A;100;A1;Dispano', 'STANDARD;Porte B;250;B1;Dispano',
+                'STANDARD;Porte D;400;D1;Dispano', 'STANDARD;Sans reference;10;;Dispano'])
+        stats = db.import_csv_incremental(str(csv_path), workers=0, deactivate_missing=True)
+        assert stats == {'crees': 1, 'modifies': 1, 'inchanges': 1, 'desactives': 1, 'ignores': 1}
+
+        # Le produit est mis a jour sur place (meme id) avec historique du prix
+        assert db.get_produit(produit_b['id'])['prix_achat'] == 250
+        historique = db.conn.execute("SELECT ancien_prix, nouveau_prix FROM historique_prix "
+                                     "WHERE produit_id = ?", (produit_b['id'],)).fetchall()
+        assert [tuple(h) for h in historique] == [(200, 250)]
+
+        # Le produit d'un autre fournisseur n'est pas desactive
+        assert db.count_produits() == 4
+        assert len(db.search_produits(terme='C1')) == 0
+
+    def test_recalculer_articles_dpgf(self, db):
+        """Test du recalcul ensembliste des articles DPGF et du montant chantier"""
+        chantier_id = db.add_chantier({'nom': 'Chantier test'})
+        produit_id = db.add_produit({'categorie': 'CAT1', 'designation': 'Porte', 'prix_achat': 100})
+
+        a1 = db.add_article_dpgf(chantier_id, {'designation': 'Bloc-porte', 'quantite': 2,
+                                               'temps_pose': 1, 'marge_pct': 25,
+                                               'fournitures_additionnelles': 10})
+        db.add_produit_article(a1, produit_id, quantite=2)
+        a2 = db.add_article_dpgf(chantier_id, {'designation': 'Forfait', 'prix_manuel': 500})
+
+        # Pose : cout 32 / vente 42 par defaut
+        article = db.get_article_dpgf(a1)
+        assert article['cout_materiaux'] == 210
+        assert article['cout_revient'] == 210 + 32
+        assert article['prix_unitaire_ht'] == pytest.approx(210 * 1.25 + 42)
+        assert article['prix_total_ht'] == pytest.approx((210 * 1.25 + 42) * 2)
+        assert db.get_article_dpgf(a2)['prix_unitaire_ht'] == 500
+
+        # La marge projet est appliquee et recalculee en une passe
+        db.set_chantier_marge_projet(chantier_id, 50)
+        article = db.get_article_dpgf(a1)
+        assert article['marge_pct'] == 50
+        assert article['prix_unitaire_ht'] == pytest.approx(210 * 1.5 + 42)
+        assert db.get_chantier(chantier_id)['montant_ht'] == pytest.approx((210 * 1.5 + 42) * 2 + 500)
+
+        assert db.recalculer_articles_dpgf(article_ids=[a1, a2, a1]) == 2
+        assert db.recalculer_articles_dpgf() == 2
+
+    def test_batch(self, db):
+        """Test de l'unite de travail : commit unique, recalculs regroupes, imbrication"""
+        chantier_id = db.add_chantier({'nom': 'Chantier batch'})
+        produit_id = db.add_produit({'categorie': 'CAT1', 'designation': 'Porte', 'prix_achat': 100})
+
+        with db.batch():
+            article_id = db.add_article_dpgf(chantier_id, {'designation': 'Bloc-porte', 'marge_pct': 0})
+            db.add_produit_article(article_id, produit_id, quantite=3)
+            db.add_categorie('NOUVELLE')
+            # Recalcul differe a la fin du bloc
+            assert db.get_article_dpgf(article_id)['prix_unitaire_ht'] == 0
+            assert 'NOUVELLE' not in db.get_categories_names()
+
+        assert db.get_article_dpgf(article_id)['prix_unitaire_ht'] == 300
+        assert db.get_chantier(chantier_id)['montant_ht'] == 300
+        assert 'NOUVELLE' in db.get_categories_names()
+
+        # Bloc imbrique en erreur : seul ce bloc est annule
+        with db.batch():
+            db.add_produit({'categorie': 'CAT1', 'designation': 'Garde', 'prix_achat': 10})
+            with pytest.raises(ValueError):
+                with db.batch():
+                    db.add_produit({'categorie': 'CAT1', 'designation': 'Annule', 'prix_achat': 10})
+                    raise ValueError()
+        assert db.count_produits() == 2
+
+        # Recalculs differes par un bloc imbrique annule : abandonnes avec lui
+        with db.batch():
+            db.add_categorie('GARDEE')
+            with pytest.raises(ValueError):
+                with db.batch():
+                    db.add_categorie('FANTOME')
+                    raise ValueError()
+        assert 'GARDEE' in db.get_categories_names()
+        assert 'FANTOME' not in db.get_categories_names()
+
+        # Transaction deja ouverte hors batch() : refusee plutot que validee
+        db.conn.execute("UPDATE produits SET prix_achat = 0")
+        with pytest.raises(sqlite3.OperationalError):
+            with db.batch():
+                pass
+        db.conn.rollback()
+        assert not db.in_batch
+
+        # Bloc externe en erreur : tout est annule
+        with pytest.raises(ValueError):
+            with db.batch():
+                db.add_produit({'categorie': 'CAT1', 'designation': 'Annule', 'prix_achat': 10})
+                raise ValueError()
+        assert db.count_produits() == 2
+        assert not db.in_batch
+
+    def test_batch_ecriture_autre_thread(self, db):
+        """Test d'une ecriture d'un autre thread pendant un bloc batch() : elle attend, sans s'y joindre"""
+        started = threading.Event()
+        thread = threading.Thread(target=lambda: (started.set(), db.add_produit(
+            {'categorie': 'CAT1', 'designation': 'Thread B', 'prix_achat': 10})))
+
+        with pytest.raises(ValueError):
+            with db.batch():
+                db.add_produit({'categorie': 'CAT1', 'designation': 'Thread A', 'prix_achat': 10})
+                thread.start()
+                started.wait()
+                thread.join(0.2)
+                assert thread.is_alive()  # Bloquee par le verrou d'ecriture
+                raise ValueError()
+        thread.join()
+
+        assert [p['designation'] for p in db.search_produits()] == ['Thread B']
+        assert not db.in_batch
+
+    def test_import_dpgf_csv(self, db, tmp_path):
+        """Test de l'import DPGF : hierarchie resolue par les codes, articles recalcules"""
+        db.set_parametre('marge_marche', '10')
+        chantier_id = db.add_chantier({'nom': 'Chantier DPGF'})
+        csv_path = tmp_path / 'dpgf.csv'
+        csv_path.write_text(
+            "CODE;NIVEAU;DESIGNATION;UNITE;QUANTITE\n"
+            "1;1;Menuiseries interieures;;\n"
+            "1.1;2;Blocs-portes;;\n"
+            "1.1.1;4;Bloc-porte 83;U;2\n"
+            "1.1.2;4;Bloc-porte 93;U;3,5\n"
+            "2;1;Agencement;;\n"
+            "2.1;2;Placards;;\n",
+            encoding='utf-8')
+
+        assert db.import_dpgf_csv(chantier_id, str(csv_path)) == 2
+
+        structure = {s['code']: s for s in db.get_structure_dpgf(chantier_id)}
+        assert structure['1']['parent_id'] is None
+        assert structure['1.1']['parent_id'] == structure['1']['id']
+        assert structure['2.1']['parent_id'] == structure['2']['id']
+
+        articles = {a['code']: a for a in db.get_articles_dpgf(chantier_id)}
+        assert articles['1.1.2']['quantite'] == 3.5
+        assert articles['1.1.1']['marge_pct'] == 10
+        assert not db.in_batch
+
+    def test_export_dpgf_produits_lies(self, db, tmp_path):
+        """Test des produits lies charges en une requete pour les exports DPGF"""
+        chantier_id = db.add_chantier({'nom': 'Chantier export'})
+        porte = db.add_produit({'categorie': 'CAT1', 'designation': 'Porte', 'prix_achat': 100})
+        serrure = db.add_produit({'categorie': 'CAT1', 'designation': 'Serrure', 'prix_achat': 20})
+        with db.batch():
+            a1 = db.add_article_dpgf(chantier_id, {'code': '1.1', 'designation': 'Bloc-porte'})
+            a2 = db.add_article_dpgf(chantier_id, {'code': '1.2', 'designation': 'Sans produit'})
+            db.add_produit_article(a1, porte, quantite=2)
+            db.add_produit_article(a1, serrure, quantite=1)
+
+        produits_lies = db.get_produits_lies_chantier(chantier_id)
+        assert [p['produit_designation'] for p in produits_lies[a1]] == ['Porte', 'Serrure']
+        assert a2 not in produits_lies
+        # Memes champs que la lecture article par article
+        for groupe, unitaire in zip(produits_lies[a1], db.get_produits_article(a1)):
+            assert unitaire.items() <= groupe.items()
+
+        csv_path = tmp_path / 'export.csv'
+        assert db.export_dpgf_csv(chantier_id, str(csv_path)) == 2
+        lignes = csv_path.read_text(encoding='utf-8-sig').splitlines()
+        assert lignes[1].endswith('Porte x2.0 | Serrure x1.0')
+        assert db.export_dpgf_odoo(chantier_id, str(tmp_path / 'odoo.csv')) == 2
+
+    def test_export_pdf_dedoublonne(self, db, tmp_path):
+        """Test de la copie des PDFs : source lue une fois, dossier ou archive ZIP"""
+        fiche = tmp_path / 'fiche_commune.pdf'
+        fiche.write_bytes(b'%PDF-1.4 fiche commune')
+        copie = tmp_path / 'fiche_copie.pdf'
+        copie.write_bytes(b'%PDF-1.4 fiche commune')  # Meme contenu, autre chemin
+        devis = tmp_path / 'devis.pdf'
+        devis.write_bytes(b'%PDF-1.4 devis')
+
+        ids = [
+            db.add_produit({'categorie': 'CAT1', 'designation': 'Porte A', 'prix_achat': 10,
+                            'fiche_technique': str(fiche), 'devis_fournisseur': str(devis)}),
+            db.add_produit({'categorie': 'CAT1', 'designation': 'Porte B', 'prix_achat': 10,
+                            'fiche_technique': str(fiche)}),
+            db.add_produit({'categorie': 'CAT1', 'designation': 'Porte C', 'prix_achat': 10,
+                            'fiche_technique': str(copie)}),
+        ]
+
+        progression = []
+        export_dir = tmp_path / 'export'
+        stats = db.export_cart_to_csv(ids, str(tmp_path / 'panier.csv'), export_dir=str(export_dir),
+                                      include_fiches=True, include_devis=True,
+                                      progress_callback=lambda done, total: progression.append((done, total)))
+        assert (stats['nb_fiches'], stats['nb_devis']) == (3, 1)
+        assert (export_dir / 'Fiches_techniques' / f'{ids[2]}_Porte C_fiche.pdf').read_bytes() == fiche.read_bytes()
+        # Octets lus : un seul exemplaire de la fiche commune
+        assert progression[-1] == (fiche.stat().st_size + devis.stat().st_size,) * 2
+        # Doublons exportes independants : modifier l'un ne modifie pas l'autre
+        doublon_a = export_dir / 'Fiches_techniques' / f'{ids[0]}_Porte A_fiche.pdf'
+        doublon_b = export_dir / 'Fiches_techniques' / f'{ids[1]}_Porte B_fiche.pdf'
+        doublon_a.write_bytes(b'%PDF-1.4 annotee')
+        assert doublon_b.read_bytes() == fiche.read_bytes()
+
+        zip_path = tmp_path / 'pdf.zip'
+        stats = db.export_cart_to_csv(ids, str(tmp_path / 'panier.csv'), include_fiches=True,
+                                      include_devis=True, zip_path=str(zip_path))
+        assert (stats['nb_fiches'], stats['nb_devis']) == (3, 1)
+        with zipfile.ZipFile(zip_path) as archive:
+            assert len(archive.namelist()) == 4
+            assert archive.read(f'Devis_fournisseur/{ids[0]}_Porte A_devis.pdf') == devis.read_bytes()
+
+    def test_stockage_pdf_par_contenu(self, db, tmp_path):
+        """Test du stockage des PDF par contenu : une copie, des liens, comptage des references"""
+        db.data_dir = str(tmp_path / 'data')
+        db.set_parametre('stockage_pdf', '1')
+        source = tmp_path / 'fiche.pdf'
+        source.write_bytes(b'%PDF-1.4 fiche')
+
+        vue_a = db.copy_pdf_to_category_folder(str(source), 'Fiches_techniques', 'PORTES')
+        vue_b = db.copy_pdf_to_category_folder(str(source), 'Fiches_techniques', 'BLOCS')
+        assert vue_a != vue_b
+        assert db.copy_pdf_to_category_folder(str(source), 'Fiches_techniques', 'PORTES') == vue_a
+        assert os.path.samefile(db.resolve_fiche_path(vue_a), db.resolve_fiche_path(vue_b))
+
+        p1 = db.add_produit({'categorie': 'PORTES', 'designation': 'P1', 'fiche_technique': vue_a})
+        p2 = db.add_produit({'categorie': 'BLOCS', 'designation': 'P2', 'fiche_technique': vue_b})
+        refcount = lambda: db.conn.execute("SELECT refcount FROM pdf_blobs").fetchone()[0]
+        assert refcount() == 2
+
+        # Renommage de categorie : la vue suit, le comptage ne change pas
+        db.rename_category_folders('PORTES', 'HUISSERIES')
+        db.update_categorie('PORTES', 'HUISSERIES')
+        db.update_pdf_paths_for_category('PORTES', 'HUISSERIES')
+        assert 'HUISSERIES' in db.get_produit(p1)['fiche_technique']
+        assert refcount() == 2
+
+        db.update_produit(p1, {**db.get_produit(p1), 'fiche_technique': str(source)})
+        db.delete_produit(p2, permanent=True)
+        assert refcount() == 0
+        # Fichier ajoute recemment (produit peut-etre pas encore enregistre) : conserve
+        assert db.gc_pdf_blobs() == 0
+        assert os.path.exists(db.resolve_fiche_path(vue_b))
+        assert db.gc_pdf_blobs(delai_heures=0) == 1
+        assert not os.path.exists(db.resolve_fiche_path(vue_b))
+        assert db.conn.execute("SELECT COUNT(*) FROM pdf_vues").fetchone()[0] == 0
+
+    def test_pool_lecteurs_wal(self, db):
+        """Test du mode WAL : un lecteur par thread, non bloque par une ecriture en cours"""
+        assert db.conn.execute("PRAGMA journal_mode").fetchone()[0] == 'wal'
+        db.add_produit({'categorie': 'CAT1', 'designation': 'Porte', 'prix_achat': 100})
+
+        # Meme lecteur dans un thread, un autre dans un second thread
+        assert db.pool.get_reader() is db.pool.get_reader()
+        readers = []
+        thread = threading.Thread(target=lambda: readers.append(db.pool.get_reader()))
+        thread.start()
+        thread.join()
+        assert readers[0] is not db.pool.get_reader()
+
+        # Ecriture non validee : le lecteur voit le dernier etat valide, sans attendre
+        with db.batch():
+            db.add_produit({'categorie': 'CAT1', 'designation': 'Fenetre', 'prix_achat': 50})
+            with db.pool.reader() as reader:
+                assert reader.count_produits() == 1
+        assert db.pool.get_reader().count_produits() == 2
+
+    def test_index_fichiers(self, db, tmp_path):
+        """Test de l'index des fichiers : existence lue en base, filtres PDF valide / liens casses"""
+        db.data_dir = str(tmp_path / 'data')
+        fiche = tmp_path / 'data' / 'Fiches_techniques' / 'porte.pdf'
+        fiche.parent.mkdir(parents=True)
+        fiche.write_bytes(b'%PDF-1.4 porte')
+        p1 = db.add_produit({'categorie': 'CAT1', 'designation': 'Porte', 'fiche_technique': str(fiche)})
+        p2 = db.add_produit({'categorie': 'CAT1', 'designation': 'Bloc',
+                             'fiche_technique': str(fiche.parent / 'absente.pdf')})
+
+        scanner = FileScanner(db, compute_hash=True)
+        assert scanner.scan() == 2
+        generation = db.cache_generation()
+        assert scanner.scan() == 0  # Dossier et fichiers inchanges : aucune ecriture
+        scanner.scan_now()
+        with db.pool.reader() as reader:
+            assert scanner.scan(reader) == 0  # Relu, inchange : aucune ecriture
+        assert db.cache_generation() == generation
+        meta = db.get_fichier_meta(db.get_produit(p1)['fiche_technique'])
+        assert meta['existe'] == 1 and meta['taille'] == len(b'%PDF-1.4 porte') and meta['sha256']
+        assert [p['id'] for p in db.search_produits(fiche_valide=True)] == [p1]
+        assert [p['id'] for p in db.search_produits(liens_casses=True)] == [p2]
+        page = {p['id']: p for p in db.search_produits_page()}
+        assert page[p1]['fiche_existe'] == 1 and page[p2]['fiche_existe'] == 0
+
+        # Fichier reecrit sur place (date du dossier inchangee) : relu au passage suivant
+        dir_mtime = fiche.parent.stat().st_mtime
+        fiche.write_bytes(b'%PDF-1.4 porte, version corrigee du fabricant')
+        os.utime(fiche.parent, (dir_mtime, dir_mtime))
+        assert scanner.scan() == 1
+        meta_reecrite = db.get_fichier_meta(db.get_produit(p1)['fiche_technique'])
+        assert meta_reecrite['taille'] == len(b'%PDF-1.4 porte, version corrigee du fabricant')
+        assert meta_reecrite['sha256'] != meta['sha256']
+
+        fiche.unlink()
+        scanner.scan_now()
+        scanner.scan()
+        assert db.count_search_results(liens_casses=True) == 2
+
+    def test_renommage_categorie_journalise(self, db, tmp_path):
+        """Test du renommage de categorie : chemins reecrits en base, reprise apres interruption"""
+        db.data_dir = str(tmp_path / 'data')
+        dossier = tmp_path / 'data' / 'Fiches_techniques' / 'PORTES'
+        dossier.mkdir(parents=True)
+        (dossier / 'p1.pdf').write_bytes(b'%PDF-1.4 p1')
+        p1 = db.add_produit({'categorie': 'PORTES', 'designation': 'P1', 'fiche_technique': str(dossier / 'p1.pdf')})
+        # Autre categorie pointant dans le meme dossier : chemin aussi reecrit
+        p2 = db.add_produit({'categorie': 'BLOCS', 'designation': 'P2', 'fiche_technique': str(dossier / 'p1.pdf')})
+        p3 = db.add_produit({'categorie': 'PORTES', 'designation': 'P3',
+                             'fiche_technique': os.path.join('Fiches_techniques', 'PORTES_BIS', 'x.pdf')})
+        db.add_categorie('PORTES')
+
+        assert db.rename_category('PORTES', 'HUISSERIES', 'Portes et huisseries') == 1
+        nouveau = tmp_path / 'data' / 'Fiches_techniques' / 'HUISSERIES' / 'p1.pdf'
+        assert nouveau.exists() and not dossier.exists()
+        assert db.get_produit(p1)['fiche_technique'] == str(nouveau)
+        assert db.get_produit(p2)['fiche_technique'] == str(nouveau)
+        assert db.get_produit(p3)['fiche_technique'].endswith(os.path.join('PORTES_BIS', 'x.pdf'))
+        assert db.get_produit(p1)['categorie'] == 'HUISSERIES'
+        assert db.conn.execute("SELECT COUNT(*) FROM journal_renommages").fetchone()[0] == 0
+
+        # Arret brutal apres le deplacement du dossier : la base est terminee a la reouverture
+        moves = db._category_folders('HUISSERIES', 'MENUISERIES')
+        for etat, (source, destination) in zip(['deplace', 'prevu'], moves):
+            db.conn.execute('''
+                INSERT INTO journal_renommages (ancien_nom, nouveau_nom, source, destination, etat, poste)
+                VALUES ('HUISSERIES', 'MENUISERIES', ?, ?, ?, ?)
+            ''', (db.make_fiche_path_relative(source), db.make_fiche_path_relative(destination),
+                  etat, socket.gethostname()))
+        db.conn.commit()
+        os.rename(moves[0][0], moves[0][1])
+
+        reopened = Database(db.db_path, data_dir=db.data_dir)
+        try:
+            produit = reopened.get_produit(p1)
+            assert produit['categorie'] == 'MENUISERIES'
+            assert os.path.exists(produit['fiche_technique']) and 'MENUISERIES' in produit['fiche_technique']
+            assert reopened.conn.execute("SELECT COUNT(*) FROM journal_renommages").fetchone()[0] == 0
+        finally:
+            reopened.close()
+
+    def test_renommage_categorie_erreur(self, db, tmp_path, monkeypatch):
+        """Test d'un renommage de categorie en erreur : dossiers remis en place, journal efface"""
+        db.data_dir = str(tmp_path / 'data')
+        fiches = tmp_path / 'data' / 'Fiches_techniques' / 'PORTES'
+        devis = tmp_path / 'data' / 'Devis_fournisseur' / 'PORTES'
+        for dossier in (fiches, devis):
+            dossier.mkdir(parents=True)
+            (dossier / 'p1.pdf').write_bytes(b'%PDF-1.4 p1')
+        p1 = db.add_produit({'categorie': 'PORTES', 'designation': 'P1', 'fiche_technique': str(fiches / 'p1.pdf')})
+        db.add_categorie('PORTES')
+
+        # Le second deplacement echoue, apres le premier
+        move = db._move_category_folder
+
+        def move_en_erreur(old_path, new_path, moved=None):
+            if 'Devis_fournisseur' in old_path:
+                raise PermissionError(old_path)
+            return move(old_path, new_path, moved)
+        monkeypatch.setattr(db, '_move_category_folder', move_en_erreur)
+
+        with pytest.raises(PermissionError):
+            db.rename_category('PORTES', 'HUISSERIES')
+        assert (fiches / 'p1.pdf').exists() and (devis / 'p1.pdf').exists()
+        assert not (tmp_path / 'data' / 'Fiches_techniques' / 'HUISSERIES').exists()
+        assert db.get_produit(p1)['fiche_technique'] == str(fiches / 'p1.pdf')
+        assert db.conn.execute("SELECT COUNT(*) FROM journal_renommages").fetchone()[0] == 0
+
+        # Rien a reprendre au demarrage suivant
+        monkeypatch.undo()
+        assert db.recover_category_renames() == 0
+        assert db.get_produit(p1)['categorie'] == 'PORTES'
+
+    def test_facettes_filtres(self, db):
+        """Test des facettes : valeurs et compteurs tenus a jour par les triggers"""
+        p1 = db.add_produit({'categorie': 'PORTES', 'sous_categorie': 'EI30', 'designation': 'P1',
+                             'hauteur': 2040, 'marque': 'M1'})
+        db.add_produit({'categorie': 'PORTES', 'sous_categorie': 'EI30', 'designation': 'P2',
+                        'hauteur': 2140, 'marque': 'M1'})
+        db.add_produit({'categorie': 'BLOCS', 'sous_categorie': 'EI60', 'designation': 'P3',
+                        'hauteur': 2040})
+
+        assert db.get_facettes('sous_categorie', categorie='PORTES') == [('EI30', 2)]
+        assert db.get_facettes('hauteur') == [(2040, 2), (2140, 1)]
+        assert db.get_marques_distinctes() == ['M1']
+        assert db.get_subcategories_filtered(1, 'Toutes') == ['EI30', 'EI60']
+
+        # Modification, desactivation : les compteurs suivent
+        db.update_produit(p1, {**db.get_produit(p1), 'sous_categorie': 'EI60'})
+        assert db.get_facettes('sous_categorie') == [('EI30', 1), ('EI60', 2)]
+        db.delete_produit(p1)
+        assert db.get_facettes('sous_categorie', categorie='PORTES') == [('EI30', 1)]
+        assert db.get_largeurs_distinctes() == []
+
+    def test_search_with_facets(self, db):
+        """Test de la recherche facettee : page, total et compteurs en une lecture"""
+        for i, (categorie, marque, hauteur) in enumerate([('PORTES', 'M1', 2040), ('PORTES', 'M2', 2040),
+                                                          ('PORTES', 'M1', 2140), ('BLOCS', 'M1', 2040)]):
+            db.add_produit({'categorie': categorie, 'designation': f'Porte EI30 {i}',
+                            'marque': marque, 'hauteur': hauteur})
+
+        result = db.search_with_facets(limit=2, categorie='PORTES', marque='M1')
+        assert result['total'] == db.count_search_results(categorie='PORTES', marque='M1') == 2
+        assert len(result['produits']) == 2
+        # Chaque facette ignore son propre filtre
+        assert result['facettes']['marque'] == [('M1', 2), ('M2', 1)]
+        assert result['facettes']['categorie'] == [('BLOCS', 1), ('PORTES', 2)]
+        assert result['facettes']['hauteur'] == [(2040, 1), (2140, 1)]
+
+        # Avec un terme : lecture de produits au lieu de la table des facettes
+        result = db.search_with_facets(terme='EI30', hauteur=2040, order_by=None)
+        assert result['total'] == 3
+        assert result['facettes']['hauteur'] == [(2040, 3), (2140, 1)]
+
+        # Filtre documents a False : applique (produits sans fiche), pas ignore
+        produit = db.get_produit(result['produits'][0]['id'])
+        db.update_produit(produit['id'], dict(produit, fiche_technique='fiche.pdf'))
+        result = db.search_with_facets(limit=10, has_fiche_technique=False, hauteur=2040)
+        assert result['total'] == db.count_search_results(has_fiche_technique=False, hauteur=2040) == 2
+        assert len(result['produits']) == 2
+
+    def test_cache_lectures(self, db):
+        """Test du cache des lectures : succes, invalidation par ecriture et par annulation"""
+        db.add_produit({'categorie': 'CAT1', 'designation': 'Porte', 'prix_achat': 100})
+        stats = db.cache_stats()
+        assert len(db.search_produits('Porte')) == 1
+        assert len(db.search_produits(terme='Porte')) == 1  # Meme cle (arguments normalises)
+        assert db.cache_stats()['hits'] == stats['hits'] + 1
+
+        # Le resultat servi est une copie
+        db.search_produits('Porte')[0]['designation'] = 'Modifie'
+        assert db.search_produits('Porte')[0]['designation'] == 'Porte'
+
+        # Ecriture de cette connexion
+        db.add_produit({'categorie': 'CAT1', 'designation': 'Porte 2', 'prix_achat': 100})
+        assert len(db.search_produits('Porte')) == 2
+
+        # Ecriture annulee : la lecture faite dans la transaction n'est plus servie
+        with pytest.raises(RuntimeError):
+            with db.batch():
+                db.add_produit({'categorie': 'CAT1', 'designation': 'Porte 3', 'prix_achat': 100})
+                assert len(db.search_produits('Porte')) == 3
+                raise RuntimeError()
+        assert len(db.search_produits('Porte')) == 2
+
+        # Ecriture d'une autre connexion (autre poste, autre thread)
+        assert db.get_parametre('marge') == '20'
+        other = Database(db.db_path, data_dir=db.data_dir)
+        try:
+            other.set_parametre('marge', '35')
+        finally:
+            other.close()
+        assert db.get_parametre('marge') == '35'
+
+    def test_cache_lectures_eviction(self, db):
+        """Test du cache des lectures : borne en nombre total de lignes, eviction LRU"""
+        for i in range(4):
+            db.add_produit({'categorie': f'CAT{i % 2}', 'designation': f'Porte {i}', 'prix_achat': 100})
+        db.query_cache.max_rows = 5
+
+        assert len(db.search_produits()) == 4
+        assert db.cache_stats()['lignes'] == 4
+        assert len(db.search_produits(categorie='CAT0')) == 2
+        assert db.cache_stats()['lignes'] == 2  # 4 + 2 > 5 : la plus ancienne est evincee
+
+        hits = db.cache_stats()['hits']
+        db.search_produits(categorie='CAT0')
+        db.search_produits()
+        assert db.cache_stats()['hits'] == hits + 1
+
+        # Resultat plus gros que la borne : jamais conserve
+        db.query_cache.clear()
+        db.query_cache.max_rows = 3
+        db.search_produits()
+        assert db.cache_stats()['lignes'] == 0
+
+    def test_instantane_parametres(self, db):
+        """Test de l'instantane des parametres : typage, rechargement, recalcul a taux fixes"""
+        parametres = db.parametres()
+        assert parametres is db.parametres()  # Pas de relecture sans ecriture
+        assert parametres.marge_marche == 25.0 and parametres.taux_vente['pose'] == 42.0
+        with pytest.raises(AttributeError):
+            parametres.marge = 50
+
+        db.set_parametre('taux_vente_pose', '50')
+        assert db.get_taux_horaires()['pose']['vente'] == 50.0
+        assert parametres.taux_vente['pose'] == 42.0  # L'ancien instantane ne change pas
+
+        # Recalcul avec un jeu de taux explicite
+        chantier_id = db.add_chantier({'nom': 'Chantier taux'})
+        article_id = db.add_article_dpgf(chantier_id, {'designation': 'Pose', 'temps_pose': 2,
+                                                       'marge_pct': 0})
+        assert db.get_article_dpgf(article_id)['prix_unitaire_ht'] == 100.0
+        db.recalculer_articles_dpgf(chantier_id=chantier_id, parametres=parametres)
+        assert db.get_article_dpgf(article_id)['prix_unitaire_ht'] == 84.0
+
+    def test_get_produits_by_ids(self, db):
+        """Test de la lecture groupee par IDs (ordre, paquets, produits absents)"""
+        with db.batch():
+            ids = [db.add_produit({'categorie': 'PORTES', 'designation': f'Porte {i}', 'prix_achat': i})
+                   for i in range(1200)]
+        db.conn.execute("UPDATE produits SET actif = 0 WHERE id = ?", (ids[5],))
+
+        wanted = [ids[1100], ids[3], ids[5], 999999, ids[3]] + ids[600:1000]
+        produits = db.get_produits_by_ids(wanted)
+        assert [p['id'] for p in produits] == [ids[1100], ids[3]] + ids[600:1000]
+        assert produits[0]['designation'] == 'Porte 1100'
+
+        # Produit desactive (ex. panier conserve apres suppression)
+        assert [p['id'] for p in db.get_produits_by_ids([ids[5]], actif_only=False)] == [ids[5]]
+        assert db.get_produits_by_ids([]) == []
+
+    def test_tri_lignes_dpgf(self, db):
+        """Test de l'ordre hierarchique du DPGF calcule en SQL (sort_key)"""
+        chantier_id = db.add_chantier({'nom': 'Chantier tri'})
+        db.add_structure_dpgf(chantier_id, {'code': '1.10', 'niveau': 2, 'designation': 'Lot 1.10'})
+        db.add_structure_dpgf(chantier_id, {'code': '1', 'niveau': 1, 'designation': 'Lot 1'})
+        db.add_structure_dpgf(chantier_id, {'code': '1.2', 'niveau': 2, 'designation': 'Lot 1.2'})
+        for code in ['1.10.1', '1.2.10', '1.2-9', '1.2', '2.1']:
+            db.add_article_dpgf(chantier_id, {'code': code, 'designation': f'Article {code}'})
+
+        expected = [('structure', '1'), ('structure', '1.2'), ('article', '1.2'), ('article', '1.2-9'),
+                    ('article', '1.2.10'), ('structure', '1.10'), ('article', '1.10.1'), ('article', '2.1')]
+        assert [(l['type'], l['code']) for l in db.iter_lignes_dpgf(chantier_id)] == expected
+        assert [a['code'] for a in db.get_articles_dpgf(chantier_id)] == \
+            [code for kind, code in expected if kind == 'article']
+
+        # Modification du code : la cle suit
+        article = db.get_articles_dpgf(chantier_id)[-1]
+        db.update_article_dpgf(article['id'], dict(article, code='0.5'))
+        assert next(l for l in db.iter_lignes_dpgf(chantier_id))['code'] == '0.5'
+
+        # Base anterieure sans cle : calculee a l'ouverture
+        db.conn.execute("UPDATE prix_marche SET sort_key = NULL")
+        db.conn.execute("UPDATE dpgf_structure SET sort_key = NULL")
+        db.conn.commit()
+        reopened = Database(db.db_path, data_dir=db.data_dir)
+        try:
+            assert [l['code'] for l in reopened.iter_lignes_dpgf(chantier_id)][:3] == ['0.5', '1', '1.2']
+        finally:
+            reopened.close()
+
+    def test_cache_chiffrage(self, db):
+        """Test du cache de chiffrage DPGF (detail, recap, articles modifies)"""
+        chantier_id = db.add_chantier({'nom': 'Chantier cache'})
+        produit_id = db.add_produit({'categorie': 'PORTES', 'designation': 'Bloc-porte', 'prix_achat': 100})
+        a1 = db.add_article_dpgf(chantier_id, {'code': '1.1', 'designation': 'Porte', 'quantite': 2,
+                                               'temps_pose': 1, 'marge_pct': 10})
+        a2 = db.add_article_dpgf(chantier_id, {'code': '1.2', 'designation': 'Pose', 'temps_pose': 2})
+        db.add_produit_article(a1, produit_id, quantite=3)
+
+        cache = ChiffrageCache(db, chantier_id)
+        recap = db.get_chantier_recap(chantier_id)
+        assert cache.recap() == pytest.approx(recap)
+        couts = cache.couts(a1)
+        assert couts['cout_produits'] == 300
+        assert couts['cout_mo'] == 32.0 and couts['vente_mo'] == 42.0
+        assert couts['prix_unitaire_ht'] == pytest.approx(372.0)
+        assert [p['produit_id'] for p in cache.produits(a1)] == [produit_id]
+
+        # Modification faite ailleurs sur la meme connexion : seul l'article est relu
+        liaison_id = cache.produits(a1)[0]['id']
+        db.update_produit_article(liaison_id, 1)
+        assert db.dpgf_changes(chantier_id, cache._version)[1] == [a1]
+        assert cache.couts(a1)['cout_produits'] == 100
+        assert cache.recap() == pytest.approx(db.get_chantier_recap(chantier_id))
+
+        # Actualisation des prix sur la meme connexion (instantane des parametres inchange)
+        produit = db.get_produit(produit_id)
+        db.update_produit(produit_id, dict(produit, prix_achat=150))
+        cache.recap()
+        db.actualiser_prix_dpgf([chantier_id])
+        assert cache.couts(a1)['cout_produits'] == 150
+        assert cache.recap() == pytest.approx(db.get_chantier_recap(chantier_id))
+
+        # Article d'un autre chantier : ignore
+        autre = db.add_article_dpgf(db.add_chantier({'nom': 'Autre'}), {'designation': 'Autre'})
+        assert cache.article(autre) is None
+
+        # Taux horaires modifies : nouvel instantane, tout est relu
+        db.set_parametre('taux_vente_pose', '50')
+        db.recalculer_articles_dpgf(chantier_id=chantier_id)
+        assert cache.couts(a2)['vente_mo'] == 100.0
+
+        db.delete_article_dpgf(a2)
+        cache.mark_dirty(a2)
+        assert cache.article(a2) is None
+        assert cache.recap()['nb_articles'] == 1
+
+    def test_actualisation_prix_dpgf(self, db):
+        """Test de l'actualisation des prix catalogue sur les articles DPGF"""
+        produit_id = db.add_produit({'categorie': 'PORTES', 'designation': 'Bloc-porte', 'prix_achat': 100})
+        ouvert = db.add_chantier({'nom': 'Ouvert'})
+        gagne = db.add_chantier({'nom': 'Gagne', 'resultat': 'GAGNE'})
+        a1 = db.add_article_dpgf(ouvert, {'code': '1', 'designation': 'Porte', 'quantite': 2, 'marge_pct': 10})
+        a2 = db.add_article_dpgf(ouvert, {'code': '2', 'designation': 'Porte negociee', 'marge_pct': 10})
+        a3 = db.add_article_dpgf(gagne, {'code': '1', 'designation': 'Porte', 'marge_pct': 10})
+        db.add_produit_article(a1, produit_id, quantite=3)
+        negocie = db.add_produit_article(a2, produit_id)
+        db.update_produit_article(negocie, 1, prix_unitaire=90)  # Prix negocie : conserve
+        db.add_produit_article(a3, produit_id)
+
+        assert db.get_ecarts_prix_dpgf() == []
+        produit = db.get_produit(produit_id)
+        db.update_produit(produit_id, dict(produit, prix_achat=120))
+
+        ecarts = db.get_ecarts_prix_dpgf()
+        assert [(e['chantier_id'], e['nb_liens'], e['nb_articles']) for e in ecarts] == [(ouvert, 1, 1)]
+        assert ecarts[0]['ecart_materiaux'] == pytest.approx(60)
+        assert ecarts[0]['ecart_ht'] == pytest.approx(132)
+        assert ecarts[0]['derniere_modification']
+        assert len(db.get_ecarts_prix_dpgf(resultat=None)) == 2
+
+        # Thread de travail sur sa propre connexion : vu par la connexion principale apres validation
+        montant = db.get_chantier(ouvert)['montant_ht']
+        progression = []
+        resultats = []
+
+        def actualiser():
+            writer = db.open_writer()
+            try:
+                resultats.append(writer.actualiser_prix_dpgf(
+                    [ouvert], progress_callback=lambda c, t: progression.append((c, t))))
+            finally:
+                writer.close()
+        thread = threading.Thread(target=actualiser)
+        thread.start()
+        thread.join()
+        assert resultats == [{'chantiers': 1, 'liens': 1, 'articles': 1}]
+        assert progression == [(0, 1), (1, 1)]
+        assert db.get_article_dpgf(a1)['cout_materiaux'] == 360
+        assert db.get_chantier(ouvert)['montant_ht'] == pytest.approx(montant + 132)
+        assert db.get_produits_article(a2)[0]['prix_unitaire'] == 90
+        assert db.get_ecarts_prix_dpgf() == []
+
+        # Annulation en cours : rien n'est modifie
+        def annuler(current, total):
+            if current:
+                raise InterruptedError()
+        with pytest.raises(InterruptedError):
+            db.actualiser_prix_dpgf([gagne, ouvert], progress_callback=annuler)
+        assert db.get_produits_article(a3)[0]['prix_unitaire'] == 100
+
+    def test_simulation_chantier(self, db):
+        """Test de la simulation de marge et de taux (sans ecriture en base)"""
+        chantier_id = db.add_chantier({'nom': 'Chantier simulation'})
+        produit_id = db.add_produit({'categorie': 'PORTES', 'designation': 'Bloc-porte', 'prix_achat': 100})
+        db.add_structure_dpgf(chantier_id, {'code': '1', 'niveau': 1, 'designation': 'Menuiseries'})
+        a1 = db.add_article_dpgf(chantier_id, {'code': '1.1', 'designation': 'Porte', 'quantite': 3,
+                                               'temps_pose': 1.5, 'marge_pct': 10})
+        db.add_produit_article(a1, produit_id, quantite=2)
+        db.add_article_dpgf(chantier_id, {'code': '2.1', 'designation': 'Reprise', 'quantite': 2,
+                                          'temps_fabrication': 4, 'fournitures_additionnelles': 30})
+        db.add_article_dpgf(chantier_id, {'code': '2.2', 'designation': 'Forfait', 'prix_manuel': 500})
+
+        simulation = db.simulation_chantier(chantier_id)
+        assert simulation.nb_articles == 3
+        assert simulation.lots == {'1': 'Menuiseries'}
+
+        # Marges actuelles : identique au recapitulatif
+        recap = db.get_chantier_recap(chantier_id)
+        actuel = simulation.evaluer()
+        for key in ('prix_total', 'cout_materiaux', 'cout_mo', 'cout_revient', 'marge_globale'):
+            assert actuel[key] == pytest.approx(recap[key])
+
+        changes = db.conn.total_changes
+        scenarios = simulation.sensibilite(20, ecart=10, pas=1, taux_vente={'pose': 50})
+        assert db.conn.total_changes == changes  # Rien n'est ecrit
+        assert [s['marge'] for s in scenarios] == list(range(10, 31))
+
+        # Meme resultat qu'une application reelle de la marge et du taux
+        db.set_parametre('taux_vente_pose', '50')
+        db.set_chantier_marge_projet(chantier_id, 25)
+        recap = db.get_chantier_recap(chantier_id)
+        scenario = scenarios[15]
+        assert scenario['prix_total'] == pytest.approx(recap['prix_total'])
+        assert scenario['marge_globale'] == pytest.approx(recap['marge_globale'])
+        articles = db.get_articles_dpgf(chantier_id)
+        assert scenario['lots'] == pytest.approx({
+            '1': articles[0]['prix_total_ht'],
+            '2': articles[1]['prix_total_ht'] + articles[2]['prix_total_ht']})
+
 
 if __name__ == '__main__':
     pytest.main([__file__, '-v'])